@@ -0,0 +1,207 @@
+"""Denormalized per-hike activity counters and trending scores.
+
+hike_activity holds each hike's check in, comment and bookmark counts and
+a time-decayed trending score, so listing hikes by popularity reads an
+index instead of counting rows per request. Routes that add or remove
+check ins, comments or bookmarks call update_hike_activity() in the same
+transaction. rebuild_hike_activity() recomputes every row from the
+check ins, comments and bookmarks (python3 rebuild_stats.py).
+"""
+
+from collections import defaultdict
+import datetime
+import math
+
+from sqlalchemy import case, func, select
+
+from model import (db, ChangeVersion, CheckIn, Comment, Hike, HikeActivity, HikeBookmarksList,
+                   increment_row)
+
+
+# A check in or comment weighs 2 ** (days from TRENDING_EPOCH / TRENDING_HALF_LIFE_DAYS),
+# so its weight relative to newer activity halves every TRENDING_HALF_LIFE_DAYS.
+# A hike's trending score is the natural log of the sum of its weights,
+# which grows with the date instead of doubling every half life, so it
+# never overflows. A hike without check ins or comments scores 0.
+TRENDING_EPOCH = datetime.date(2000, 1, 1)
+TRENDING_HALF_LIFE_DAYS = 7
+
+# A log weight further than this below a score adds less than a double can
+# represent, so it's skipped rather than passed to exp(), which raises an
+# error on underflow in Postgres
+MAX_TRENDING_GAP = 50.0
+
+# hike_activity column -> the sort option ordered by it
+COLUMN_SORTS = {column: sort for sort, column in HikeActivity.SORT_COLUMNS.items()}
+
+
+def get_trending_weight(day):
+    """Return the log of the weight of a check in or comment on a date (or datetime).
+
+    Dates are clamped to between TRENDING_EPOCH and today, so a check in
+    dated in the future weighs the same as one dated today.
+    """
+
+    if isinstance(day, datetime.datetime):
+        day = day.date()
+
+    day = min(max(day, TRENDING_EPOCH), datetime.date.today())
+
+    return (day - TRENDING_EPOCH).days / TRENDING_HALF_LIFE_DAYS * math.log(2)
+
+
+def get_trending_score(weights):
+    """Return the trending score of activity with the given log weights."""
+
+    weights = list(weights)
+    if not weights:
+        return 0.0
+
+    top = max(weights)
+
+    return top + math.log(sum(math.exp(weight - top) for weight in weights))
+
+
+def add_trending_weight(score, weight):
+    """Return a SQL expression adding a log weight to a trending score column."""
+
+    gap = func.abs(score - weight)
+
+    return (case((score > weight, score), else_=weight)
+            + case((gap > MAX_TRENDING_GAP, 0.0), else_=func.ln(1 + func.exp(-gap))))
+
+
+def get_sort_scope(sort):
+    """Return the change scope of hike listings ordered by a sort option."""
+
+    return f"hike_activity:{sort}"
+
+
+def get_trending_scores(connection, hike_ids=None):
+    """Return a dictionary of hike_id -> trending score from the hikes' check ins and comments.
+
+    Scores are computed for every hike if hike_ids is None.
+    """
+
+    check_ins = (select(CheckIn.hike_id, CheckIn.date_hiked, func.count())
+                 .group_by(CheckIn.hike_id, CheckIn.date_hiked))
+    comments = select(Comment.hike_id, Comment.date_created)
+
+    if hike_ids is not None:
+        check_ins = check_ins.where(CheckIn.hike_id.in_(hike_ids))
+        comments = comments.where(Comment.hike_id.in_(hike_ids))
+
+    weights = defaultdict(list)
+
+    for hike_id, date_hiked, count in connection.execute(check_ins):
+        weights[hike_id].append(get_trending_weight(date_hiked) + math.log(count))
+
+    for hike_id, date_created in connection.execute(comments):
+        weights[hike_id].append(get_trending_weight(date_created))
+
+    return {hike_id: get_trending_score(hike_weights) for hike_id, hike_weights in weights.items()}
+
+
+def update_hike_activity(check_ins_removed=(), check_ins_added=(), comments_removed=(),
+                         comments_added=(), bookmarks_removed=(), bookmarks_added=()):
+    """Update the activity of hikes whose check ins, comments or bookmarks changed.
+
+    Check ins are objects with hike_id and date_hiked (such as
+    stats.CheckInStats), comments objects with hike_id and date_created,
+    and bookmarks the hike_id of each hike added to or removed from a
+    bookmarks list. Counters are changed with atomic increments and the
+    change versions of the affected sort orders are bumped.
+
+    A trending score can't have a weight subtracted from its log, so the
+    scores of hikes that lost check ins or comments are recomputed from
+    their rows instead. Call this after the change is flushed.
+    """
+
+    deltas = defaultdict(lambda: defaultdict(int))
+    weights_added = defaultdict(list)
+
+    for check_ins, sign in ((check_ins_removed, -1), (check_ins_added, 1)):
+        for check_in in check_ins:
+            deltas[check_in.hike_id]["check_in_count"] += sign
+
+    for comments, sign in ((comments_removed, -1), (comments_added, 1)):
+        for comment in comments:
+            deltas[comment.hike_id]["comment_count"] += sign
+
+    for hike_ids, sign in ((bookmarks_removed, -1), (bookmarks_added, 1)):
+        for hike_id in hike_ids:
+            deltas[hike_id]["bookmark_count"] += sign
+
+    recompute_hike_ids = sorted({check_in.hike_id for check_in in check_ins_removed}
+                                | {comment.hike_id for comment in comments_removed})
+
+    for check_in in check_ins_added:
+        weights_added[check_in.hike_id].append(get_trending_weight(check_in.date_hiked))
+
+    for comment in comments_added:
+        weights_added[comment.hike_id].append(get_trending_weight(comment.date_created))
+
+    connection = db.session.connection()
+    table = HikeActivity.__table__
+    scopes = set()
+
+    for hike_id, increments in sorted(deltas.items()):
+        increments = {name: value for name, value in increments.items() if value}
+        if not increments:
+            continue
+
+        increment_row(connection, table, {"hike_id": hike_id}, increments)
+        scopes |= {get_sort_scope(COLUMN_SORTS[name]) for name in increments}
+
+    # Added activity always changed a count above, so its hike has a row
+    for hike_id, weights in sorted(weights_added.items()):
+        if hike_id in recompute_hike_ids:
+            continue
+
+        weight = get_trending_score(weights)
+        connection.execute(table.update()
+                                .where(table.c.hike_id == hike_id)
+                                .values(trending_score=add_trending_weight(table.c.trending_score,
+                                                                           weight)))
+        scopes.add(get_sort_scope("trending"))
+
+    if recompute_hike_ids:
+        scores = get_trending_scores(connection, recompute_hike_ids)
+        for hike_id in recompute_hike_ids:
+            connection.execute(table.update()
+                                    .where(table.c.hike_id == hike_id)
+                                    .values(trending_score=scores.get(hike_id, 0.0)))
+        scopes.add(get_sort_scope("trending"))
+
+    if scopes:
+        ChangeVersion.bump_versions(connection, scopes)
+
+
+def rebuild_hike_activity(connection):
+    """Replace every hike's activity with activity recomputed from its check ins, comments and bookmarks.
+
+    Every hike gets a row, including hikes without any activity. Return
+    the number of hikes.
+    """
+
+    rows = {hike_id: {"hike_id": hike_id, "check_in_count": 0, "comment_count": 0,
+                      "bookmark_count": 0, "trending_score": 0.0}
+            for hike_id, in connection.execute(select(Hike.hike_id))}
+
+    for column_name, model in (("check_in_count", CheckIn), ("comment_count", Comment),
+                               ("bookmark_count", HikeBookmarksList)):
+        for hike_id, count in connection.execute(select(model.hike_id, func.count())
+                                                 .group_by(model.hike_id)):
+            rows[hike_id][column_name] = count
+
+    for hike_id, score in get_trending_scores(connection).items():
+        rows[hike_id]["trending_score"] = score
+
+    table = HikeActivity.__table__
+    connection.execute(table.delete())
+    if rows:
+        connection.execute(table.insert(), list(rows.values()))
+
+    ChangeVersion.bump_versions(connection, {get_sort_scope(sort) for sort in HikeActivity.SORT_COLUMNS})
+
+    return len(rows)
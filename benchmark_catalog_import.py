@@ -0,0 +1,76 @@
+"""Script to measure catalog import throughput in rows/sec.
+
+Imports ROWS synthetic hikes (copies of data/hikes.json with unique
+names) with the old row-by-row ORM inserts and with load_catalog(), then
+imports them again unchanged and again with every hike changed. Each run
+is rolled back, so the database is left as it was.
+
+Run against a seeded database: python3 benchmark_catalog_import.py [rows]
+"""
+
+import io
+import json
+import sys
+import time
+
+from model import connect_to_db, db, Hike
+from catalog_loader import load_catalog, get_rows_per_second
+import server
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+
+def make_ndjson(hikes, rows, miles_offset=0.0):
+    """Return NDJSON for rows copies of the hikes, each with a unique name."""
+
+    lines = []
+
+    for i in range(rows):
+        hike = dict(hikes[i % len(hikes)])
+        hike["hike_name"] = f"{hike['hike_name']} #{i}"
+        hike["miles"] = float(hike["miles"]) + miles_offset
+        lines.append(json.dumps(hike))
+
+    return "\n".join(lines)
+
+
+def orm_insert(ndjson):
+    """Insert hikes one ORM object at a time, like seed_database.py used to."""
+
+    for line in ndjson.splitlines():
+        hike = json.loads(line)
+        db.session.add(Hike.create_hike(hike["hike_name"], hike["area"], hike["difficulty"],
+                                        hike["leash_rule"], hike["description"], hike["address"],
+                                        hike["latitude"], hike["longitude"], hike["city"],
+                                        hike["state"], float(hike["miles"]), hike["path"],
+                                        hike["parking"], hike["resources"], hike["hike_imgURL"]))
+    db.session.flush()
+
+
+connect_to_db(server.app, echo=False)
+
+with open("data/hikes.json") as f:
+    hikes = json.load(f)
+
+ndjson = make_ndjson(hikes, ROWS)
+changed_ndjson = make_ndjson(hikes, ROWS, miles_offset=0.1)
+
+print(f"{'import':<28}{'rows':>8}{'seconds':>10}{'rows/sec':>12}")
+
+with server.app.app_context():
+    start = time.perf_counter()
+    orm_insert(ndjson)
+    seconds = time.perf_counter() - start
+    db.session.rollback()
+    print(f"{'ORM, row by row':<28}{ROWS:>8}{seconds:>10.2f}{ROWS / seconds:>12,.0f}")
+
+with db.engine.connect() as connection:
+    transaction = connection.begin()
+
+    for name, text in [("load_catalog, new", ndjson),
+                       ("load_catalog, unchanged", ndjson),
+                       ("load_catalog, all changed", changed_ndjson)]:
+        result = load_catalog(connection, io.StringIO(text))
+        print(f"{name:<28}{ROWS:>8}{result.seconds:>10.2f}{get_rows_per_second(result):>12,.0f}")
+
+    transaction.rollback()
@@ -0,0 +1,208 @@
+"""Script to compare gunicorn's gthread and gevent workers under concurrent load.
+
+Starts gunicorn (gunicorn.conf.py) with each worker class, logs in as
+the seeded test user and has many clients fetch the dashboard's JSON
+endpoints at once, then prints requests per second and latency
+percentiles for each worker class and number of clients. A response
+counts as an error unless it's the one the logged in user got before the
+run, since the endpoints answer logged out requests with empty lists.
+
+Run against a seeded database, with the settings gunicorn needs (see
+README) in the environment: python3 benchmark_concurrency.py [clients ...]
+"""
+
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+
+WORKER_CLASSES = ["gthread", "gevent"]
+CLIENTS = [10, 50, 200]
+SECONDS = 10
+PORT = 8100
+
+# Few workers, so the benchmark measures how many requests each one
+# serves at once rather than how many cores there are
+WORKERS = 2
+
+PATHS = ["/dashboard/bootstrap.json", "/user_check_ins.json", "/user_comments.json", "/pets.json",
+         "/user_bookmarks_lists.json"]
+
+EMAIL = "test@test"
+PASSWORD = "test"
+
+
+def start_server(worker_class):
+    """Start gunicorn with a worker class and return its process once it's ready."""
+
+    env = dict(os.environ, WEB_WORKER_CLASS=worker_class, BIND=f"127.0.0.1:{PORT}",
+               WEB_CONCURRENCY=str(WORKERS))
+    process = subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"], env=env,
+                               stdout=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 60
+
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"gunicorn ({worker_class}) exited with status {process.returncode}")
+
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", PORT, timeout=5)
+            connection.request("GET", "/readyz")
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+
+        time.sleep(0.5)
+
+    process.terminate()
+    sys.exit(f"gunicorn ({worker_class}) didn't become ready")
+
+
+def get(path, cookie):
+    """Return the (status, body) of a GET request with a session cookie."""
+
+    connection = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+
+    try:
+        connection.request("GET", path, headers={"Cookie": cookie})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def log_in():
+    """Log in as the test user and return the session cookie.
+
+    Exits unless the dashboard then has the user's pets, which a failed
+    login (whose response sets a cookie too, for its message) wouldn't.
+    """
+
+    connection = http.client.HTTPConnection("127.0.0.1", PORT)
+    connection.request("POST", "/login", urlencode({"email": EMAIL, "current-password": PASSWORD}),
+                       {"Content-Type": "application/x-www-form-urlencoded", "Referer": "/"})
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+
+    cookie = response.getheader("Set-Cookie", "").split(";")[0]
+
+    dashboard_status, _ = get("/dashboard", cookie)
+    bootstrap_status, bootstrap = get("/dashboard/bootstrap.json", cookie)
+
+    if (response.status != 302 or dashboard_status != 200 or bootstrap_status != 200
+            or not json.loads(bootstrap)["petProfiles"]):
+        sys.exit(f"Couldn't log in as {EMAIL}; is the database seeded?")
+
+    return cookie
+
+
+def get_expected_bodies(cookie):
+    """Return {path: body} of PATHS for the logged in user."""
+
+    bodies = {}
+
+    for path in PATHS:
+        status, body = get(path, cookie)
+        if status != 200:
+            sys.exit(f"GET {path} returned {status}")
+        bodies[path] = body
+
+    return bodies
+
+
+def run_clients(cookie, expected_bodies, clients, seconds):
+    """Fetch PATHS from clients concurrent connections for seconds.
+
+    Return (latencies in seconds of the successful requests, number of
+    errors). A request fails unless its response is 200 with the body in
+    expected_bodies.
+    """
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client(offset):
+        nonlocal errors
+
+        connection = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+        client_latencies = []
+        client_errors = 0
+        i = offset
+
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+
+            path = PATHS[i % len(PATHS)]
+
+            try:
+                connection.request("GET", path, headers={"Cookie": cookie})
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                client_errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+                continue
+
+            if response.status == 200 and body == expected_bodies[path]:
+                client_latencies.append(time.perf_counter() - start)
+            else:
+                client_errors += 1
+            i += 1
+
+        connection.close()
+
+        with lock:
+            latencies.extend(client_latencies)
+            errors += client_errors
+
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return latencies, errors
+
+
+def get_percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))]
+
+
+if __name__ == "__main__":
+    clients_counts = [int(arg) for arg in sys.argv[1:]] or CLIENTS
+
+    print(f"{'worker':<10}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+
+    for worker_class in WORKER_CLASSES:
+        process = start_server(worker_class)
+
+        try:
+            cookie = log_in()
+            expected_bodies = get_expected_bodies(cookie)
+
+            for clients in clients_counts:
+                latencies, errors = run_clients(cookie, expected_bodies, clients, SECONDS)
+                latencies.sort()
+
+                print(f"{worker_class:<10}{clients:>8}"
+                      f"{len(latencies) / SECONDS:>10.1f}"
+                      f"{get_percentile(latencies, 50) * 1000:>10.1f}"
+                      f"{get_percentile(latencies, 99) * 1000:>10.1f}"
+                      f"{errors:>8}")
+        finally:
+            process.terminate()
+            process.wait()
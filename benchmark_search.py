@@ -0,0 +1,36 @@
+"""Script to compare the search index with the old ilike keyword query.
+
+Run against a seeded database: python3 benchmark_search.py
+"""
+
+import timeit
+
+from model import connect_to_db, db, Hike
+import server
+
+SEARCH_TERMS = ["griffith", "falls", "lake", "canyon trail", "grifith", "mountain loop"]
+REPEAT = 200
+
+
+def get_hikes_by_keyword(keyword):
+    """Return hikes whose name contains keyword, as /hikes/search used to query them."""
+
+    return db.session.query(Hike).filter(Hike.hike_name.ilike(f"%{keyword}%")).all()
+
+
+connect_to_db(server.app, echo=False)
+
+with server.app.app_context():
+    index, _ = server.get_search_index()
+
+    print(f"{'search term':<16}{'ilike ms':>10}{'index ms':>10}{'ilike hits':>12}{'index hits':>12}")
+
+    for search_term in SEARCH_TERMS:
+        ilike_seconds = timeit.timeit(lambda: get_hikes_by_keyword(search_term), number=REPEAT)
+        index_seconds = timeit.timeit(lambda: index.search(search_term), number=REPEAT)
+
+        print(f"{search_term:<16}"
+              f"{ilike_seconds / REPEAT * 1000:>10.3f}"
+              f"{index_seconds / REPEAT * 1000:>10.3f}"
+              f"{len(get_hikes_by_keyword(search_term)):>12}"
+              f"{len(index.search(search_term)):>12}")
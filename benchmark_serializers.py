@@ -0,0 +1,37 @@
+"""Script to compare the compiled serializers with marshmallow's dump().
+
+Run against a seeded database: python3 benchmark_serializers.py
+"""
+
+import timeit
+
+from model import connect_to_db, Hike, CheckIn, Comment
+import server
+
+REPEAT = 50
+
+connect_to_db(server.app, echo=False)
+
+with server.app.app_context():
+    hikes = Hike.get_hikes()
+    check_ins = CheckIn.query.all()
+    comments = Comment.query.all()
+
+    benchmarks = [
+        ("hikes_serializer", hikes),
+        ("user_check_ins_serializer", check_ins),
+        ("comments_serializer", comments),
+    ]
+
+    print(f"{'serializer':<28}{'rows':>6}{'schema ms':>12}{'compiled ms':>13}{'speedup':>9}")
+
+    for name, rows in benchmarks:
+        serializer = getattr(server, name)
+
+        schema_seconds = timeit.timeit(lambda: serializer.schema.dump(rows), number=REPEAT)
+        compiled_seconds = timeit.timeit(lambda: serializer.dump(rows), number=REPEAT)
+
+        print(f"{name:<28}{len(rows):>6}"
+              f"{schema_seconds / REPEAT * 1000:>12.3f}"
+              f"{compiled_seconds / REPEAT * 1000:>13.3f}"
+              f"{schema_seconds / compiled_seconds:>8.1f}x")
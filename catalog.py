@@ -0,0 +1,97 @@
+"""In-process read-through cache for the hike catalog."""
+
+from collections import namedtuple
+import itertools
+import threading
+
+from flask import jsonify
+
+from conditional import get_change_versions
+
+
+def get_catalog_version():
+    """Return the version of the "catalog" change scope.
+
+    Every commit that inserts, updates or deletes hikes bumps it (see
+    conditional.bump_change_versions and catalog_loader), whichever
+    process made the change, so each worker sees it and rebuilds. It's
+    read at most once per request (see conditional.get_change_versions).
+    """
+
+    return get_change_versions(["catalog"])["catalog"]
+
+
+CatalogSnapshot = namedtuple("CatalogSnapshot",
+                             ["generation", "version", "hikes", "hikes_by_id", "body"])
+CatalogSnapshot.__doc__ = """Serialized hikes for one catalog version.
+
+generation: number of the snapshot, unique within this process; the
+    search indexes compare it to tell whether they need to resync
+version: catalog version the hikes were loaded at
+hikes: list of serialized hikes ordered by lowercase hike name
+hikes_by_id: dict of hike_id -> serialized hike
+body: JSON bytes for {"hikes": hikes}, as returned by /all_hikes.json
+"""
+
+
+class CatalogCache:
+    """Hold the serialized hike catalog until its version changes."""
+
+    def __init__(self, load_hikes):
+        """load_hikes is a function returning the serialized hikes list."""
+
+        self._load_hikes = load_hikes
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._generations = itertools.count(1)
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        """Return the current CatalogSnapshot, rebuilding it if stale."""
+
+        # Read before the hikes, on the same database, so a snapshot is
+        # never labelled with a newer version than the hikes it holds
+        version = get_catalog_version()
+        snapshot = self._snapshot
+
+        if snapshot is not None and snapshot.version == version:
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            # Another thread may have rebuilt the snapshot while we waited
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == version:
+                self.hits += 1
+                return snapshot
+
+            self.misses += 1
+            hikes = self._load_hikes()
+            hikes_by_id = {hike["hike_id"]: hike for hike in hikes}
+            body = jsonify({"hikes": hikes}).get_data()
+
+            self._snapshot = CatalogSnapshot(next(self._generations), version, hikes, hikes_by_id,
+                                             body)
+
+            return self._snapshot
+
+    def clear(self):
+        """Drop the cached snapshot and reset the counters."""
+
+        with self._lock:
+            self._snapshot = None
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the cache counters."""
+
+        snapshot = self._snapshot
+
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "version": get_catalog_version(),
+                "cached_version": snapshot.version if snapshot else None,
+                "size": len(snapshot.hikes) if snapshot else 0}
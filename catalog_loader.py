@@ -0,0 +1,305 @@
+"""Streaming, batched import of the hike catalog.
+
+Hikes are read one record at a time from a JSON array (like
+data/hikes.json) or from NDJSON (one hike object per line), validated and
+type-converted, and written in batches: new hikes with one executemany
+insert per batch, changed hikes with one executemany update. Hikes are
+matched on their catalog_key, so importing a file again only writes the
+hikes that changed and never drops any data.
+
+Run with: python3 import_catalog.py [file]
+"""
+
+from collections import namedtuple
+import io
+import itertools
+import json
+import time
+
+from sqlalchemy import bindparam, select
+
+from model import ChangeVersion, Hike, HikeActivity, get_catalog_key
+
+
+BATCH_SIZE = 1000
+
+# Bytes read at a time from a JSON array
+CHUNK_SIZE = 64 * 1024
+
+# Text columns copied from a record, stripped; None if missing
+TEXT_FIELDS = ["hike_name", "area", "difficulty", "leash_rule", "description", "address",
+               "city", "state", "path", "parking", "resources", "hike_imgURL"]
+REQUIRED_FIELDS = ["hike_name", "address"]
+
+# Columns compared to decide whether an existing hike changed
+COMPARED_COLUMNS = TEXT_FIELDS + ["latitude", "longitude", "lat", "lng", "miles"]
+
+COORDINATE_RANGES = {"latitude": ("lat", 90), "longitude": ("lng", 180)}
+
+
+class CatalogRecordError(ValueError):
+    """Raised for a catalog record that can't be imported."""
+
+
+CatalogLoadResult = namedtuple("CatalogLoadResult",
+                               ["inserted", "updated", "unchanged", "errors", "seconds"])
+CatalogLoadResult.__doc__ = """Counts of a catalog import.
+
+errors: list of (record number, message) for records that were skipped
+seconds: time spent reading, converting and writing
+"""
+
+
+def get_rows_per_second(result):
+    """Return the import's throughput in valid records per second."""
+
+    rows = result.inserted + result.updated + result.unchanged
+
+    return rows / result.seconds if result.seconds else 0.0
+
+
+def iter_json_array(f, chunk_size=CHUNK_SIZE, buffer=""):
+    """Yield the elements of a JSON array read from a text file, one chunk at a time.
+
+    buffer is text already read from the start of the file.
+    """
+
+    decoder = json.JSONDecoder()
+    pos = 0
+    eof = False
+
+    def read_more():
+        nonlocal buffer, pos, eof
+
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            read_more()
+
+    def expect(characters):
+        nonlocal pos
+
+        skip_whitespace()
+        if pos == len(buffer) or buffer[pos] not in characters:
+            found = buffer[pos] if pos < len(buffer) else "end of file"
+            raise CatalogRecordError(f"Expected {' or '.join(characters)}, found {found!r}")
+        pos += 1
+        return buffer[pos - 1]
+
+    read_more()
+    expect("[")
+    skip_whitespace()
+
+    if buffer[pos:pos + 1] == "]":
+        return
+
+    while True:
+        skip_whitespace()
+
+        # A value that ends at the end of the buffer may continue in the
+        # next chunk (e.g. a number), so it's decoded again with more text
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as error:
+                if eof:
+                    raise CatalogRecordError(f"Invalid JSON: {error.msg}") from error
+                read_more()
+                continue
+            if end < len(buffer) or eof:
+                break
+            read_more()
+
+        pos = end
+        yield value
+
+        if expect(",]") == "]":
+            return
+
+
+def iter_ndjson(f):
+    """Yield (line number, record or CatalogRecordError) for each line of NDJSON."""
+
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as error:
+            yield line_number, CatalogRecordError(f"Invalid JSON: {error.msg}")
+
+
+def iter_records(f):
+    """Yield (record number, record or CatalogRecordError) from a JSON array or NDJSON file.
+
+    Records of a JSON array are numbered from 1; NDJSON records by line.
+    Raise CatalogRecordError if a JSON array is malformed.
+    """
+
+    head = f.read(CHUNK_SIZE)
+
+    if head.lstrip().startswith("["):
+        yield from enumerate(iter_json_array(f, buffer=head), 1)
+    else:
+        # Finish head's last line so line numbers still match the file
+        yield from iter_ndjson(itertools.chain(io.StringIO(head + f.readline()), f))
+
+
+def convert_text(record, field):
+    value = record.get(field)
+
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str):
+        raise CatalogRecordError(f"{field} must be a string")
+
+    return value.strip()
+
+
+def convert_number(record, field):
+    """Return a record's field as a float, or None if it's missing or blank."""
+
+    value = record.get(field)
+
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, bool):
+        raise CatalogRecordError(f"{field} must be a number")
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise CatalogRecordError(f"{field} must be a number, not {value!r}") from None
+
+
+def convert_record(record):
+    """Return the hikes row for a catalog record. Raise CatalogRecordError if it's invalid."""
+
+    if not isinstance(record, dict):
+        raise CatalogRecordError("Record must be an object")
+
+    row = {field: convert_text(record, field) for field in TEXT_FIELDS}
+
+    for field in REQUIRED_FIELDS:
+        if not row[field]:
+            raise CatalogRecordError(f"{field} is required")
+
+    row["miles"] = convert_number(record, "miles")
+    if row["miles"] is not None and row["miles"] < 0:
+        raise CatalogRecordError("miles can't be negative")
+
+    for field, (number_field, limit) in COORDINATE_RANGES.items():
+        number = convert_number(record, field)
+        if number is not None and not -limit <= number <= limit:
+            raise CatalogRecordError(f"{field} must be between -{limit} and {limit}")
+
+        row[field] = convert_text(record, field)
+        row[number_field] = number
+
+    row["catalog_key"] = (convert_text(record, "catalog_key")
+                          or get_catalog_key(row["hike_name"], row["resources"]))
+
+    return row
+
+
+def write_batch(connection, rows):
+    """Insert new hikes and update changed ones. Return (inserted, updated, unchanged)."""
+
+    table = Hike.__table__
+    rows_by_key = {row["catalog_key"]: row for row in rows}
+
+    existing = {row.catalog_key: row for row in connection.execute(
+        select(table.c.hike_id, table.c.catalog_key, *[table.c[name] for name in COMPARED_COLUMNS])
+        .where(table.c.catalog_key.in_(rows_by_key)))}
+
+    new_rows = []
+    changed_rows = []
+
+    for key, row in rows_by_key.items():
+        current = existing.get(key)
+
+        if current is None:
+            new_rows.append(row)
+        elif any(getattr(current, name) != row[name] for name in COMPARED_COLUMNS):
+            changed_rows.append(dict(row, b_hike_id=current.hike_id))
+
+    if new_rows:
+        connection.execute(table.insert(), new_rows)
+
+    if changed_rows:
+        connection.execute(table.update()
+                                .where(table.c.hike_id == bindparam("b_hike_id"))
+                                .values({name: bindparam(name) for name in COMPARED_COLUMNS}),
+                           changed_rows)
+
+    unchanged = len(rows_by_key) - len(new_rows) - len(changed_rows)
+
+    return len(new_rows), len(changed_rows), unchanged
+
+
+def add_missing_activity(connection):
+    """Give hikes without an activity row an empty one, so they're listed by popularity."""
+
+    hikes = Hike.__table__
+    activity = HikeActivity.__table__
+
+    connection.execute(activity.insert().from_select(
+        ["hike_id"],
+        select(hikes.c.hike_id).where(~hikes.c.hike_id.in_(select(activity.c.hike_id)))))
+
+
+def load_catalog(connection, f, batch_size=BATCH_SIZE):
+    """Import the hikes in a JSON array or NDJSON file. Return a CatalogLoadResult.
+
+    Invalid records are skipped and listed in the result's errors. A record
+    whose catalog_key appears again later in its batch is replaced by the
+    later one. Raise CatalogRecordError if a JSON array is malformed; run
+    it in a transaction (e.g. db.engine.begin()) so nothing is imported then.
+    """
+
+    start = time.perf_counter()
+    inserted = updated = unchanged = 0
+    errors = []
+    batch = []
+
+    def flush():
+        nonlocal inserted, updated, unchanged
+
+        batch_inserted, batch_updated, batch_unchanged = write_batch(connection, batch)
+        inserted += batch_inserted
+        updated += batch_updated
+        unchanged += batch_unchanged
+        batch.clear()
+
+    for number, record in iter_records(f):
+        try:
+            if isinstance(record, CatalogRecordError):
+                raise record
+            batch.append(convert_record(record))
+        except CatalogRecordError as error:
+            errors.append((number, str(error)))
+
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    if inserted or updated:
+        add_missing_activity(connection)
+        ChangeVersion.bump_versions(connection, {"catalog"})
+
+    return CatalogLoadResult(inserted, updated, unchanged, errors, time.perf_counter() - start)
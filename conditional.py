@@ -0,0 +1,159 @@
+"""Conditional GET (ETag / If-None-Match) support for JSON read endpoints."""
+
+from functools import wraps
+import hashlib
+import os
+
+from flask import current_app, g, has_app_context, request, session
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from model import (ChangeVersion, User, Pet, Hike, Comment, CheckIn, PetCheckIn,
+BookmarksList, HikeBookmarksList)
+
+
+# Cache-Control policies. Every policy forces revalidation, so clients
+# always see changes right away but get a 304 while nothing has changed.
+PUBLIC_REVALIDATE = "public, no-cache"
+PRIVATE_REVALIDATE = "private, no-cache"
+
+# Generated once per server start (before workers are forked), so ETags
+# issued by a previous deploy never match.
+ETAG_SALT = os.urandom(8).hex()
+
+
+def get_change_scopes(connection, obj):
+    """Return the change scopes affected by a changed model object.
+
+    Scopes are strings such as "user:1", "hike:12", "bookmarks_list:3",
+    "users" (any user's public details) and "catalog" (any hike).
+    """
+
+    if isinstance(obj, Hike):
+        return {"catalog"}
+
+    if isinstance(obj, User):
+        return {f"user:{obj.user_id}", "users"}
+
+    if isinstance(obj, (Pet, CheckIn)):
+        return {f"user:{obj.user_id}"}
+
+    if isinstance(obj, Comment):
+        return {f"user:{obj.user_id}", f"hike:{obj.hike_id}"}
+
+    if isinstance(obj, BookmarksList):
+        return {f"user:{obj.user_id}", f"bookmarks_list:{obj.bookmarks_list_id}"}
+
+    if isinstance(obj, PetCheckIn):
+        user_id = connection.execute(select(CheckIn.user_id)
+                                     .where(CheckIn.check_in_id == obj.check_in_id)).scalar()
+        return {f"user:{user_id}"}
+
+    if isinstance(obj, HikeBookmarksList):
+        user_id = connection.execute(select(BookmarksList.user_id)
+                                     .where(BookmarksList.bookmarks_list_id == obj.bookmarks_list_id)
+                                     ).scalar()
+        return {f"user:{user_id}", f"bookmarks_list:{obj.bookmarks_list_id}"}
+
+    return set()
+
+
+@event.listens_for(Session, "after_flush")
+def bump_change_versions(session, flush_context):
+    """Bump the version of every scope touched by this flush."""
+
+    # A hike is marked dirty whenever a check in, comment or bookmark is
+    # appended to one of its backrefs; only column changes affect the catalog.
+    dirty = [obj for obj in session.dirty
+             if session.is_modified(obj, include_collections=not isinstance(obj, Hike))]
+
+    changed = [obj for obj in list(session.new) + dirty + list(session.deleted)
+               if not isinstance(obj, ChangeVersion)]
+
+    if not changed:
+        return
+
+    connection = session.connection()
+    scopes = set()
+
+    for obj in changed:
+        scopes |= get_change_scopes(connection, obj)
+
+    if scopes:
+        ChangeVersion.bump_versions(connection, scopes)
+
+        # Versions read earlier in the request are out of date now
+        if has_app_context():
+            for scope in scopes:
+                g.get("change_versions", {}).pop(scope, None)
+
+
+def get_change_versions(scopes):
+    """Return a dictionary of scope -> version, reading each scope once per request.
+
+    A version read during a request is kept on g until a flush bumps it,
+    so e.g. the catalog version an ETag was computed from is reused by
+    the catalog cache instead of being queried again.
+    """
+
+    versions = g.setdefault("change_versions", {})
+    missing = [scope for scope in scopes if scope not in versions]
+
+    if missing:
+        read_versions = ChangeVersion.get_versions(missing)
+        versions.update({scope: read_versions.get(scope, 0) for scope in missing})
+
+    return {scope: versions[scope] for scope in scopes}
+
+
+def compute_etag(scopes):
+    """Return a strong ETag for the current request given its scopes."""
+
+    versions = get_change_versions(scopes)
+
+    parts = [ETAG_SALT, request.full_path]
+    parts.extend(f"{scope}={versions.get(scope, 0)}" for scope in scopes)
+
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+class ScopeValues(dict):
+    """Values for scope templates; any other name is a query arg, or "" if absent."""
+
+    def __missing__(self, key):
+        return request.args.get(key, "")
+
+
+def conditional(*scope_templates, cache_control=PRIVATE_REVALIDATE):
+    """Decorate a JSON read view with ETag / If-None-Match support.
+
+    Each scope template is formatted with the view arguments, the
+    session's user_id and the query args, e.g.
+    conditional("user:{user_id}", "catalog", "hike_activity:{sort}").
+    If the client's If-None-Match matches, a 304 is returned without
+    calling the view.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            values = ScopeValues(kwargs, user_id=session.get("user_id"))
+            scopes = [template.format_map(values) for template in scope_templates]
+
+            etag = compute_etag(scopes)
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = cache_control
+
+            return response
+
+        return wrapper
+
+    return decorator
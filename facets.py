@@ -0,0 +1,243 @@
+"""In-memory facet index over the hike catalog for advanced search."""
+
+from collections import Counter
+import threading
+
+
+# Facets with exact-match values; each maps value -> bitset of hike positions
+FACETS = ["difficulty", "leash_rule", "area", "city", "state", "parking"]
+
+# Facets returned with per-value counts alongside search results
+COUNTED_FACETS = ["difficulty", "leash_rule", "area", "city", "parking"]
+
+# Parking is matched by case-insensitive substring, like the search form's
+# "free" and "fee" options (e.g. "fee" matches "Fee (Adventure Pass)")
+PARKING_TERMS = ["free", "fee"]
+
+
+def get_bit_positions(bitset):
+    """Return the positions of the set bits of a bitset, lowest first."""
+
+    bits = bin(bitset)[:1:-1]  # bit 0 first
+    positions = []
+
+    position = bits.find("1")
+    while position != -1:
+        positions.append(position)
+        position = bits.find("1", position + 1)
+
+    return positions
+
+
+def get_bitset(positions, size):
+    """Return a bitset of positions below size.
+
+    Setting bits in a bytearray costs the same whatever the position,
+    while each 1 << position makes an int as long as the position.
+    """
+
+    bits = bytearray((size + 7) // 8)
+
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+
+    return int.from_bytes(bits, "little")
+
+
+class FacetIndex:
+    """Map each facet value to a bitset of hikes.
+
+    Bit n stands for the hike at position n of the catalog snapshot, so
+    bitsets are only as long as the catalog, however large its hike_ids.
+    The index follows the catalog cache: when the snapshot changes, sync()
+    compares it with the hikes already indexed. If every hike kept its
+    position (e.g. a hike's details were edited), only the bits of the
+    changed hikes are updated. Adding, removing or reordering hikes (e.g.
+    renaming one) shifts positions, so the index is rebuilt, which takes
+    one pass over the catalog plus one bitset per facet value.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.generation = None
+        self.rebuilds = 0
+
+        self._hikes = []  # position -> serialized hike
+        self._positions = {}  # hike_id -> position
+        self._values = {facet: {} for facet in FACETS}
+        self._all = 0
+
+    def sync(self, snapshot):
+        """Bring the index up to date with a CatalogSnapshot."""
+
+        if snapshot.generation == self.generation:
+            return
+
+        with self._lock:
+            if snapshot.generation == self.generation:
+                return
+
+            if not self._update(snapshot.hikes):
+                self._rebuild(snapshot.hikes)
+
+            self.generation = snapshot.generation
+
+    def _rebuild(self, hikes):
+        """Index hikes from scratch."""
+
+        positions = {facet: {} for facet in FACETS}  # facet -> value -> positions
+
+        for position, hike in enumerate(hikes):
+            for facet in FACETS:
+                positions[facet].setdefault(hike[facet], []).append(position)
+
+        self._hikes = hikes
+        self._positions = {hike["hike_id"]: position for position, hike in enumerate(hikes)}
+        self._values = {facet: {value: get_bitset(value_positions, len(hikes))
+                                for value, value_positions in values.items()}
+                        for facet, values in positions.items()}
+        self._all = (1 << len(hikes)) - 1
+        self.rebuilds += 1
+
+    def _update(self, hikes):
+        """Move the bits of the hikes whose facet values changed.
+
+        Return False, without changing anything, unless every indexed
+        hike is at the same position in hikes and there are no others.
+        """
+
+        if len(hikes) != len(self._hikes):
+            return False
+
+        changed = []
+
+        for position, (indexed_hike, hike) in enumerate(zip(self._hikes, hikes)):
+            if hike["hike_id"] != indexed_hike["hike_id"]:
+                return False
+            if hike != indexed_hike:
+                changed.append(position)
+
+        for position in changed:
+            bit = 1 << position
+
+            for facet in FACETS:
+                old_value = self._hikes[position][facet]
+                new_value = hikes[position][facet]
+                if old_value == new_value:
+                    continue
+
+                values = self._values[facet]
+                values[old_value] &= ~bit
+                if not values[old_value]:
+                    del values[old_value]
+                values[new_value] = values.get(new_value, 0) | bit
+
+        self._hikes = hikes
+
+        return True
+
+    def _match_ids(self, hike_ids):
+        """Return the bitset of the indexed hikes among hike_ids."""
+
+        positions = (self._positions.get(hike_id) for hike_id in hike_ids)
+
+        return get_bitset((position for position in positions if position is not None),
+                          len(self._hikes))
+
+    def _match_parking(self, terms):
+        """Return the bitset of hikes whose parking contains any of the terms."""
+
+        bitset = 0
+
+        for parking, positions in self._values["parking"].items():
+            if parking and any(term.lower() in parking.lower() for term in terms):
+                bitset |= positions
+
+        return bitset
+
+    def _match_any(self, facet, values):
+        """Return the bitset of hikes with any of the values for a facet."""
+
+        if facet == "parking":
+            return self._match_parking(values)
+
+        bitset = 0
+
+        for value in values:
+            bitset |= self._values[facet].get(value, 0)
+
+        return bitset
+
+    def _match_length(self, length_min, length_max):
+        """Return the bitset of hikes whose miles are within the range."""
+
+        positions = []
+
+        for position, hike in enumerate(self._hikes):
+            miles = hike["miles"]
+            if length_min is not None and (miles is None or miles < length_min):
+                continue
+            if length_max is not None and (miles is None or miles > length_max):
+                continue
+            positions.append(position)
+
+        return get_bitset(positions, len(self._hikes))
+
+    def search(self, filters, within=None, length_min=None, length_max=None):
+        """Return (list of hike_ids, facet counts) for an advanced search.
+
+        filters maps facet -> list of accepted values; a hike must match
+        one value of every non-empty facet. within is an optional
+        collection of hike_ids to search (e.g. keyword matches). Each
+        facet's counts apply all the other filters, so they show how many
+        hikes each value would match; values with no matches are left out.
+        hike_ids are in the catalog's order.
+        """
+
+        with self._lock:
+            base = self._all if within is None else self._match_ids(within)
+
+            if length_min is not None or length_max is not None:
+                base &= self._match_length(length_min, length_max)
+
+            matches = {facet: self._match_any(facet, values)
+                       for facet, values in filters.items() if values}
+
+            result = base
+            for bitset in matches.values():
+                result &= bitset
+
+            counts = {}
+            for facet in COUNTED_FACETS:
+                others = base
+                for other_facet, bitset in matches.items():
+                    if other_facet != facet:
+                        others &= bitset
+
+                # Counting the matched hikes' values takes one pass over
+                # them, however many values the facet has
+                value_counts = Counter(self._hikes[position][facet]
+                                       for position in get_bit_positions(others))
+
+                if facet == "parking":
+                    value_counts = Counter({term: sum(count for parking, count in value_counts.items()
+                                                      if parking and term in parking.lower())
+                                            for term in PARKING_TERMS})
+
+                counts[facet] = {value: count for value, count in value_counts.items() if count}
+
+            hike_ids = [self._hikes[position]["hike_id"] for position in get_bit_positions(result)]
+
+            return hike_ids, counts
+
+    def get_values(self, facet, within_facet, within_value):
+        """Return the sorted values of a facet among hikes with another facet's value.
+
+        e.g. get_values("city", "state", "Oregon")
+        """
+
+        with self._lock:
+            within = self._values[within_facet].get(within_value, 0)
+
+            return sorted(value for value, bitset in self._values[facet].items()
+                          if bitset & within)
@@ -0,0 +1,126 @@
+"""In-memory grid index of hike coordinates for nearby and map viewport queries."""
+
+import math
+import threading
+
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LATITUDE = 69.0
+
+# Grid cells are CELL_DEGREES on a side (about 35 miles north-south)
+CELL_DEGREES = 0.5
+
+
+def get_distance(lat1, lng1, lat2, lng2):
+    """Return the great-circle distance in miles between two points."""
+
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(min(1.0, a)))
+
+
+def get_cell(lat, lng):
+    """Return the grid cell containing a point."""
+
+    return (math.floor(lat / CELL_DEGREES), math.floor(lng / CELL_DEGREES))
+
+
+class GeoIndex:
+    """Bucket hikes into a grid of CELL_DEGREES cells by their lat/lng.
+
+    A query only looks at hikes in the cells overlapping its bounding box.
+    The grid is rebuilt when the catalog changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.generation = None
+
+        self._cells = {}  # (row, column) -> [(lat, lng, hike), ...]
+
+    def sync(self, snapshot):
+        """Rebuild the grid if the catalog has changed."""
+
+        if snapshot.generation == self.generation:
+            return
+
+        cells = {}
+
+        for hike in snapshot.hikes:
+            if hike["lat"] is None or hike["lng"] is None:
+                continue
+            cells.setdefault(get_cell(hike["lat"], hike["lng"]), []).append(
+                (hike["lat"], hike["lng"], hike))
+
+        with self._lock:
+            self._cells = cells
+            self.generation = snapshot.generation
+
+    def _get_candidates(self, south, west, north, east):
+        """Yield (lat, lng, hike) for hikes in cells overlapping a bounding box.
+
+        If west > east the box crosses the antimeridian.
+        """
+
+        if west > east:
+            yield from self._get_candidates(south, west, north, 180.0)
+            yield from self._get_candidates(south, -180.0, north, east)
+            return
+
+        min_row, min_column = get_cell(south, west)
+        max_row, max_column = get_cell(north, east)
+
+        with self._lock:
+            cells = self._cells
+
+        for row in range(min_row, max_row + 1):
+            for column in range(min_column, max_column + 1):
+                yield from cells.get((row, column), ())
+
+    def nearby(self, lat, lng, radius, limit):
+        """Return [(distance, hike), ...] within radius miles of a point, nearest first."""
+
+        lat_delta = radius / MILES_PER_DEGREE_LATITUDE
+        cos_lat = math.cos(math.radians(lat))
+        lng_delta = 180.0 if cos_lat < 1e-6 else min(180.0, lat_delta / cos_lat)
+
+        south, north = max(-90.0, lat - lat_delta), min(90.0, lat + lat_delta)
+        west, east = lng - lng_delta, lng + lng_delta
+        if lng_delta >= 180.0:
+            west, east = -180.0, 180.0
+        else:
+            west = west + 360.0 if west < -180.0 else west
+            east = east - 360.0 if east > 180.0 else east
+
+        results = []
+
+        for hike_lat, hike_lng, hike in self._get_candidates(south, west, north, east):
+            distance = get_distance(lat, lng, hike_lat, hike_lng)
+            if distance <= radius:
+                results.append((distance, hike))
+
+        results.sort(key=lambda result: (result[0], result[1]["hike_id"]))
+
+        return results[:limit]
+
+    def in_bbox(self, south, west, north, east, limit):
+        """Return [(distance, hike), ...] inside a bounding box, nearest its center first."""
+
+        center_lat = (south + north) / 2
+        center_lng = (west + east) / 2 if west <= east else (west + east + 360.0) / 2
+        if center_lng > 180.0:
+            center_lng -= 360.0
+
+        results = []
+
+        for hike_lat, hike_lng, hike in self._get_candidates(south, west, north, east):
+            in_lngs = west <= hike_lng <= east if west <= east else hike_lng >= west or hike_lng <= east
+            if south <= hike_lat <= north and in_lngs:
+                results.append((get_distance(center_lat, center_lng, hike_lat, hike_lng), hike))
+
+        results.sort(key=lambda result: (result[0], result[1]["hike_id"]))
+
+        return results[:limit]
@@ -0,0 +1,74 @@
+"""gunicorn settings for serving the app in production.
+
+Run: gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is loaded and its caches warmed once in the master process, then
+WEB_CONCURRENCY worker processes are forked, each serving requests on
+WEB_THREADS threads. With WEB_WORKER_CLASS=gevent, each worker serves up
+to WEB_WORKER_CONNECTIONS requests at once on greenlets instead, which
+yield to each other while they wait on Postgres. CPU-bound work that
+would hold up a gevent worker's other requests, like resizing pet
+images, runs on gevent's native thread pool (see uploads.py).
+"""
+
+import glob
+import multiprocessing
+import os
+import tempfile
+
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get("WEB_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("WEB_THREADS", 4))
+worker_connections = int(os.environ.get("WEB_WORKER_CONNECTIONS", 100))
+
+if worker_class == "gevent":
+    # Patch before the app is preloaded, so the locks, thread locals and
+    # sockets it creates cooperate with gevent, and make psycopg2 wait
+    # for query results on gevent's event loop instead of blocking
+    from gevent import monkey
+    monkey.patch_all()
+
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+# Workers write their request metrics here, so /metrics can add up every
+# worker's; set before the app (and prometheus_client) is imported
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR",
+                                    os.path.join(tempfile.gettempdir(), "pupjourney-metrics"))
+
+# Load the app before forking, so workers share its memory copy-on-write
+# and a missing setting stops the server before any worker starts
+preload_app = True
+
+timeout = 30
+# Workers finish the requests they're handling before exiting on a restart
+graceful_timeout = 30
+keepalive = 5
+
+# Replace workers now and then in case anything leaks
+max_requests = 10000
+max_requests_jitter = 1000
+
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    from server import after_fork
+
+    # Only the first worker resumes the uploads a previous run left pending
+    after_fork(resume_uploads=worker.age == 1)
+
+
+def on_starting(server):
+    # Counters start from zero with each server, as a single process's would
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
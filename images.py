@@ -0,0 +1,99 @@
+"""Resized, EXIF-stripped variants of uploaded pet images.
+
+An uploaded image is decoded once, rotated upright from its EXIF
+orientation, and re-encoded at each size in IMAGE_VARIANTS, largest
+first, each variant downscaled from the one before it. Re-encoding drops
+the EXIF data (camera details and GPS position) of the upload.
+"""
+
+import os
+
+from lazy import LazyModule
+
+
+# Pillow is imported when the first image is processed, not at startup
+Image = LazyModule("PIL.Image")
+ImageOps = LazyModule("PIL.ImageOps")
+features = LazyModule("PIL.features")
+
+# (variant, longest side in pixels, format), largest first. "full" is
+# the pet's pet_img_url; the smaller variants are stored under derived
+# keys (see get_variant_public_id) and are WebP when Pillow supports it.
+IMAGE_VARIANTS = [
+    ("full", 2048, "JPEG"),
+    ("medium", 640, "WEBP"),
+    ("thumb", 256, "WEBP"),
+]
+
+IMAGE_QUALITY = 85
+
+# Decoding larger images could exhaust memory (Pillow's own limit only warns)
+MAX_IMAGE_PIXELS = 50_000_000
+
+FILE_EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+
+class InvalidImageError(ValueError):
+    """Raised when an uploaded file isn't an image that can be processed."""
+
+
+def get_variant_public_id(public_id, variant):
+    """Return the key a variant of an image is stored under, e.g. "abc123_thumb"."""
+
+    if variant == "full":
+        return public_id
+
+    return f"{public_id}_{variant}"
+
+
+def get_variant_format(image_format):
+    """Return the format to encode a variant in, falling back from WebP to JPEG."""
+
+    if image_format == "WEBP" and not features.check("webp"):
+        return "JPEG"
+
+    return image_format
+
+
+def open_image(path):
+    """Decode an image file, upright and in RGB. Raise InvalidImageError if it can't be."""
+
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            if width * height > MAX_IMAGE_PIXELS:
+                raise InvalidImageError(f"Image is too large ({width}x{height})")
+
+            image = ImageOps.exif_transpose(image)
+            return image.convert("RGB")
+    except (OSError, SyntaxError, Image.DecompressionBombError) as error:
+        raise InvalidImageError(str(error)) from error
+
+
+def process_image(path):
+    """Write each variant of an image file next to it.
+
+    Return [(variant, variant path), ...] in IMAGE_VARIANTS order. Raise
+    InvalidImageError if the file isn't an image.
+    """
+
+    image = open_image(path)
+    variant_paths = []
+
+    for variant, size, image_format in IMAGE_VARIANTS:
+        image_format = get_variant_format(image_format)
+        image.thumbnail((size, size), Image.LANCZOS)
+
+        variant_path = f"{path}.{variant}{FILE_EXTENSIONS[image_format]}"
+        image.save(variant_path, image_format, quality=IMAGE_QUALITY)
+        variant_paths.append((variant, variant_path))
+
+    return variant_paths
+
+
+def remove_variants(variant_paths):
+    """Delete the files written by process_image()."""
+
+    for _, variant_path in variant_paths:
+        if os.path.exists(variant_path):
+            os.remove(variant_path)
@@ -0,0 +1,40 @@
+"""Script to import hikes into the catalog without re-creating the database.
+
+New hikes are added and changed hikes updated; hikes that aren't in the
+file are kept. Accepts a JSON array or NDJSON (one hike per line):
+
+python3 import_catalog.py [data/hikes.json] [--batch-size 1000]
+
+Running servers reload their catalog on the next request.
+"""
+
+import argparse
+import sys
+
+from model import connect_to_db, db
+from catalog_loader import BATCH_SIZE, load_catalog, get_rows_per_second
+import server
+
+# Invalid records printed before the rest are summarized
+MAX_ERRORS_SHOWN = 20
+
+parser = argparse.ArgumentParser(description="Import hikes into the catalog.")
+parser.add_argument("file", nargs="?", default="data/hikes.json",
+                    help="JSON array or NDJSON file of hikes (default: data/hikes.json)")
+parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                    help=f"hikes written per statement (default: {BATCH_SIZE})")
+args = parser.parse_args()
+
+connect_to_db(server.app, echo=False)
+
+with open(args.file) as f, db.engine.begin() as connection:
+    result = load_catalog(connection, f, args.batch_size)
+
+for number, message in result.errors[:MAX_ERRORS_SHOWN]:
+    print(f"Skipped record {number}: {message}", file=sys.stderr)
+if len(result.errors) > MAX_ERRORS_SHOWN:
+    print(f"... and {len(result.errors) - MAX_ERRORS_SHOWN} more invalid records", file=sys.stderr)
+
+print(f"Imported {args.file}: {result.inserted} added, {result.updated} updated, "
+      f"{result.unchanged} unchanged, {len(result.errors)} skipped")
+print(f"{get_rows_per_second(result):,.0f} rows/sec ({result.seconds:.2f}s)")
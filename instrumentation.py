@@ -0,0 +1,200 @@
+"""Per-request query, timing and N+1 instrumentation with Prometheus metrics."""
+
+from collections import Counter as StatementCounter
+from contextlib import contextmanager
+import os
+import time
+
+from flask import g, has_app_context, request, request_finished, request_started
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# A request running the same SQL statement more than this many times is
+# flagged as an N+1 query pattern (override with app.config["N_PLUS_ONE_THRESHOLD"])
+N_PLUS_ONE_THRESHOLD = 10
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+
+METRIC_PREFIX = "pupjourney"
+
+
+class RequestMetrics:
+    """Queries and timings recorded while handling one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.serialization_depth = 0
+        self.statements = StatementCounter()
+
+    def get_repeated_statements(self, threshold):
+        """Return [(statement, count), ...] for statements run more than threshold times."""
+
+        return [(statement, count) for statement, count in self.statements.most_common()
+                if count > threshold]
+
+
+def get_request_metrics():
+    """Return the current request's RequestMetrics, or None outside a request."""
+
+    if not has_app_context():
+        return None
+
+    return g.get("request_metrics")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_times"].pop()
+
+    metrics = get_request_metrics()
+    if metrics is not None:
+        metrics.query_count += 1
+        metrics.db_seconds += elapsed
+        metrics.statements[statement] += 1
+
+
+@contextmanager
+def timed_serialization():
+    """Add the time spent in the block to the request's serialization time.
+
+    Nested blocks (e.g. a schema dumping a nested schema) are only counted once.
+    """
+
+    metrics = get_request_metrics()
+
+    if metrics is None:
+        yield
+        return
+
+    metrics.serialization_depth += 1
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        metrics.serialization_depth -= 1
+        if metrics.serialization_depth == 0:
+            metrics.serialization_seconds += time.perf_counter() - start
+
+
+class TimedDumpMixin:
+    """Marshmallow schema mixin that records dump() time as serialization time."""
+
+    def dump(self, obj, *, many=None):
+        with timed_serialization():
+            return super().dump(obj, many=many)
+
+
+def get_timed_json_encoder(json_encoder):
+    """Return a subclass of a JSON encoder that records encode() time as serialization time."""
+
+    class TimedJSONEncoder(json_encoder):
+        def encode(self, o):
+            with timed_serialization():
+                return super().encode(o)
+
+    return TimedJSONEncoder
+
+
+def is_multiprocess():
+    """Return whether metrics are shared by worker processes through PROMETHEUS_MULTIPROC_DIR."""
+
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+class Instrumentation:
+    """Record query count, DB time, serialization time and latency per request.
+
+    Aggregates are kept per (endpoint, method) and rendered in the
+    Prometheus text format by render_metrics(). With
+    PROMETHEUS_MULTIPROC_DIR set (as gunicorn.conf.py does), each worker
+    process writes its aggregates to files there and render_metrics()
+    adds up every worker's, so a scrape sees the same totals whichever
+    worker answers it. In debug mode, each response also gets a
+    Server-Timing header.
+    """
+
+    def __init__(self, app=None):
+        self.registry = CollectorRegistry()
+        self.app = None
+
+        def add_counter(name, help_text, labels=("endpoint", "method")):
+            return Counter(name, help_text, labels, namespace=METRIC_PREFIX, registry=self.registry)
+
+        self.requests = add_counter("requests", "Requests handled.",
+                                    ("endpoint", "method", "status"))
+        self.latency = Histogram("request_duration_seconds", "Request latency.",
+                                 ("endpoint", "method"), namespace=METRIC_PREFIX,
+                                 buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.queries = add_counter("db_queries", "SQL statements executed.")
+        self.db_seconds = add_counter("db_duration_seconds", "Time spent executing SQL.")
+        self.serialization_seconds = add_counter("serialization_duration_seconds",
+                                                 "Time spent serializing responses.")
+        self.n_plus_one_requests = add_counter(
+            "n_plus_one_requests",
+            "Requests that repeated one SQL statement more than the N+1 threshold.")
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault("N_PLUS_ONE_THRESHOLD", N_PLUS_ONE_THRESHOLD)
+        app.json_encoder = get_timed_json_encoder(app.json_encoder)
+
+        request_started.connect(self._request_started, app)
+        request_finished.connect(self._request_finished, app)
+
+    def _request_started(self, sender, **extra):
+        g.request_metrics = RequestMetrics()
+
+    def _request_finished(self, sender, response, **extra):
+        metrics = g.pop("request_metrics", None)
+        if metrics is None:
+            return
+
+        latency = time.perf_counter() - metrics.start
+        # Unmatched URLs share one label so 404s can't create unbounded series
+        endpoint = request.endpoint or ""
+        method = request.method
+
+        repeated = metrics.get_repeated_statements(sender.config["N_PLUS_ONE_THRESHOLD"])
+        for statement, count in repeated:
+            sender.logger.warning("Possible N+1 query in %s %s: ran %d times: %s",
+                                  method, request.path, count, " ".join(statement.split()))
+
+        self.requests.labels(endpoint, method, response.status_code).inc()
+        self.latency.labels(endpoint, method).observe(latency)
+        self.queries.labels(endpoint, method).inc(metrics.query_count)
+        self.db_seconds.labels(endpoint, method).inc(metrics.db_seconds)
+        self.serialization_seconds.labels(endpoint, method).inc(metrics.serialization_seconds)
+        if repeated:
+            self.n_plus_one_requests.labels(endpoint, method).inc()
+
+        if sender.debug:
+            response.headers["Server-Timing"] = (
+                f"db;desc=\"{metrics.query_count} queries\";dur={metrics.db_seconds * 1000:.1f}, "
+                f"serialize;dur={metrics.serialization_seconds * 1000:.1f}, "
+                f"total;dur={latency * 1000:.1f}")
+
+    def render_metrics(self):
+        """Return the aggregated metrics in the Prometheus text format."""
+
+        if not is_multiprocess():
+            return generate_latest(self.registry)
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+        return generate_latest(registry)
@@ -0,0 +1,26 @@
+"""Modules that are imported on first use instead of at startup."""
+
+import importlib
+
+
+class LazyModule:
+    """Stand-in for a module that imports it the first time an attribute is read.
+
+    For modules that are slow to import and not needed by every process
+    that imports the module using them, e.g. schemas = LazyModule("schemas").
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, name):
+        if self._module is None:
+            # import_module holds the import lock, so concurrent first uses
+            # import the module once
+            self._module = importlib.import_module(self._name)
+
+        return getattr(self._module, name)
+
+    def __repr__(self):
+        return f"<LazyModule {self._name!r}>"
@@ -0,0 +1,18 @@
+"""Script to bring an existing database's schema up to date.
+
+Run after pulling model changes: python3 migrate.py
+"""
+
+from model import connect_to_db, db
+from migrations import LATEST_VERSION, get_version, upgrade
+import server
+
+connect_to_db(server.app, echo=False)
+
+with db.engine.connect() as connection:
+    print(f"Database is at version {get_version(connection)}")
+
+    for version, description in upgrade(connection):
+        print(f"Applied {version}: {description}")
+
+    print(f"Database is up to date (version {LATEST_VERSION})")
@@ -0,0 +1,182 @@
+"""Versioned schema migrations for existing databases.
+
+A new database gets the whole schema from db.create_all() and is stamped
+with the latest version. An existing database is brought up to date by
+running the migrations newer than its version (python3 migrate.py). When
+a model change adds a column, index or constraint, add a migration here
+that makes the same change.
+"""
+
+from model import db
+
+
+# (version, description, SQL statements); versions must only ever increase
+MIGRATIONS = [
+    (1, "Add numeric hike coordinates", [
+        "ALTER TABLE hikes ADD COLUMN IF NOT EXISTS lat DOUBLE PRECISION",
+        "ALTER TABLE hikes ADD COLUMN IF NOT EXISTS lng DOUBLE PRECISION",
+        # Fill them from the latitude/longitude strings
+        """
+        UPDATE hikes
+        SET lat = CAST(NULLIF(TRIM(latitude), '') AS DOUBLE PRECISION),
+            lng = CAST(NULLIF(TRIM(longitude), '') AS DOUBLE PRECISION)
+        WHERE lat IS NULL OR lng IS NULL
+        """,
+    ]),
+    (2, "Add indexes for paginated lists", [
+        "CREATE INDEX IF NOT EXISTS ix_hikes_lower_hike_name_hike_id ON hikes (lower(hike_name), hike_id)",
+        "CREATE INDEX IF NOT EXISTS ix_comments_hike_id_date_created ON comments (hike_id, date_created, comment_id)",
+        "CREATE INDEX IF NOT EXISTS ix_comments_user_id_date_created ON comments (user_id, date_created, comment_id)",
+        "CREATE INDEX IF NOT EXISTS ix_check_ins_user_id_date_hiked ON check_ins (user_id, date_hiked, check_in_id)",
+    ]),
+    (3, "Add foreign key indexes and association table unique indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_pets_user_id ON pets (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_hikes_state ON hikes (state)",
+        "CREATE INDEX IF NOT EXISTS ix_check_ins_hike_id ON check_ins (hike_id)",
+        "CREATE INDEX IF NOT EXISTS ix_bookmarks_lists_user_id ON bookmarks_lists (user_id)",
+        # Keep the first of any duplicate rows before adding the unique indexes
+        """
+        DELETE FROM pets_check_ins duplicate
+        USING pets_check_ins original
+        WHERE duplicate.pet_id = original.pet_id
+          AND duplicate.check_in_id = original.check_in_id
+          AND duplicate.pet_check_in_id > original.pet_check_in_id
+        """,
+        """
+        DELETE FROM hikes_bookmarks_lists duplicate
+        USING hikes_bookmarks_lists original
+        WHERE duplicate.bookmarks_list_id = original.bookmarks_list_id
+          AND duplicate.hike_id = original.hike_id
+          AND duplicate.hike_bookmarks_list_id > original.hike_bookmarks_list_id
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_pets_check_ins_pet_id_check_in_id ON pets_check_ins (pet_id, check_in_id)",
+        "CREATE INDEX IF NOT EXISTS ix_pets_check_ins_check_in_id ON pets_check_ins (check_in_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_hikes_bookmarks_lists_bookmarks_list_id_hike_id ON hikes_bookmarks_lists (bookmarks_list_id, hike_id)",
+        "CREATE INDEX IF NOT EXISTS ix_hikes_bookmarks_lists_hike_id ON hikes_bookmarks_lists (hike_id)",
+    ]),
+    # Fill the new tables afterwards with python3 rebuild_stats.py
+    (4, "Add materialized hiking stats", [
+        """
+        CREATE TABLE IF NOT EXISTS hiking_stats (
+            subject VARCHAR PRIMARY KEY,
+            total_miles DOUBLE PRECISION NOT NULL DEFAULT 0,
+            hike_count INTEGER NOT NULL DEFAULT 0,
+            total_time DOUBLE PRECISION NOT NULL DEFAULT 0,
+            distinct_hikes INTEGER NOT NULL DEFAULT 0,
+            streak_weeks INTEGER NOT NULL DEFAULT 0,
+            longest_streak_weeks INTEGER NOT NULL DEFAULT 0,
+            last_hiked DATE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS hiking_stats_months (
+            subject VARCHAR NOT NULL,
+            month DATE NOT NULL,
+            miles DOUBLE PRECISION NOT NULL DEFAULT 0,
+            hike_count INTEGER NOT NULL DEFAULT 0,
+            total_time DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (subject, month)
+        )
+        """,
+    ]),
+    # Fill the new table afterwards with python3 rebuild_stats.py
+    (5, "Add hike activity counters", [
+        """
+        CREATE TABLE IF NOT EXISTS hike_activity (
+            hike_id INTEGER PRIMARY KEY REFERENCES hikes (hike_id),
+            check_in_count INTEGER NOT NULL DEFAULT 0,
+            comment_count INTEGER NOT NULL DEFAULT 0,
+            bookmark_count INTEGER NOT NULL DEFAULT 0,
+            trending_score DOUBLE PRECISION NOT NULL DEFAULT 0
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_hike_activity_check_in_count_hike_id ON hike_activity (check_in_count, hike_id)",
+        "CREATE INDEX IF NOT EXISTS ix_hike_activity_comment_count_hike_id ON hike_activity (comment_count, hike_id)",
+        "CREATE INDEX IF NOT EXISTS ix_hike_activity_bookmark_count_hike_id ON hike_activity (bookmark_count, hike_id)",
+        "CREATE INDEX IF NOT EXISTS ix_hike_activity_trending_score_hike_id ON hike_activity (trending_score, hike_id)",
+    ]),
+    (6, "Add pending pet image uploads", [
+        "ALTER TABLE pets ADD COLUMN IF NOT EXISTS img_status VARCHAR",
+        "ALTER TABLE pets ADD COLUMN IF NOT EXISTS img_upload_id VARCHAR",
+    ]),
+    (7, "Add pet image variants", [
+        "ALTER TABLE pets ADD COLUMN IF NOT EXISTS img_medium_url VARCHAR",
+        "ALTER TABLE pets ADD COLUMN IF NOT EXISTS img_thumb_url VARCHAR",
+    ]),
+    (8, "Add hike catalog keys", [
+        "ALTER TABLE hikes ADD COLUMN IF NOT EXISTS catalog_key VARCHAR",
+        "UPDATE hikes SET catalog_key = hike_name || '|' || COALESCE(resources, '') WHERE catalog_key IS NULL",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_hikes_catalog_key ON hikes (catalog_key)",
+    ]),
+    # Scores were sums of weights from 2022-01-01; python3 rebuild_stats.py
+    # afterwards also clamps activity dated in the future to today
+    (9, "Store trending scores as logs", [
+        """
+        UPDATE hike_activity
+        SET trending_score = CASE WHEN trending_score > 0
+                                  THEN ln(trending_score) + (DATE '2022-01-01' - DATE '2000-01-01') / 7.0 * ln(2)
+                                  ELSE 0 END
+        """,
+    ]),
+    # Read by @conditional ETags and bumped by every flush that changes data
+    (10, "Add change versions", [
+        "CREATE TABLE IF NOT EXISTS change_versions (scope VARCHAR PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+schema_migrations = db.Table(
+    "schema_migrations",
+    db.Column("version", db.Integer, primary_key=True, autoincrement=False),
+    db.Column("description", db.String, nullable=False),
+    db.Column("applied_at", db.DateTime, server_default=db.func.now(), nullable=False),
+)
+
+
+def get_version(connection):
+    """Return the latest migration version applied to the database, or 0."""
+
+    schema_migrations.create(connection, checkfirst=True)
+
+    version = connection.execute(db.select([db.func.max(schema_migrations.c.version)])).scalar()
+
+    return version or 0
+
+
+def upgrade(connection):
+    """Apply the migrations newer than the database's version, in order.
+
+    Each migration runs in its own transaction with its version row, so a
+    failed migration leaves the database at the previous version. Return
+    the list of (version, description) applied.
+    """
+
+    applied = []
+
+    for version, description, statements in MIGRATIONS:
+        if version <= get_version(connection):
+            continue
+
+        with connection.begin():
+            for statement in statements:
+                connection.execute(db.text(statement))
+
+            connection.execute(schema_migrations.insert().values(version=version,
+                                                                 description=description))
+
+        applied.append((version, description))
+
+    return applied
+
+
+def stamp(connection):
+    """Record every migration as applied, for a database made by db.create_all()."""
+
+    current_version = get_version(connection)
+
+    with connection.begin():
+        for version, description, _ in MIGRATIONS:
+            if version > current_version:
+                connection.execute(schema_migrations.insert().values(version=version,
+                                                                     description=description))
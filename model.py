@@ -1,13 +1,111 @@
 """Models for pup journey app."""
 
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from flask import Flask, current_app, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import func, inspect, tuple_
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, validates
 
 import datetime
+import os
 
 
-db = SQLAlchemy()
+# Engine settings, each overridable in app.config or by an environment
+# variable of the same name. Pool settings don't apply to SQLite.
+DATABASE_CONFIG_DEFAULTS = {
+    "DATABASE_POOL_SIZE": 10,
+    "DATABASE_MAX_OVERFLOW": 10,
+    "DATABASE_POOL_TIMEOUT": 10,  # seconds to wait for a free connection
+    "DATABASE_POOL_RECYCLE": 1800,  # seconds before a connection is replaced
+    "DATABASE_POOL_PRE_PING": 1,  # test connections before using them
+    "DATABASE_STATEMENT_TIMEOUT_MS": 0,  # 0 means statements never time out
+}
+
+
+class RoutingSession(SignallingSession):
+    """Session that runs a read-only request's queries on the read replica.
+
+    Flushes always go to the primary. See replica.py.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and has_app_context():
+            router = current_app.extensions.get("replica_router")
+            engine = router.get_request_engine() if router is not None else None
+
+            if engine is not None:
+                return engine
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
+
+
+def get_keyset_page(query, columns, limit, after=None, descending=True):
+    """Return up to limit + 1 rows of query, ordered by columns, after a cursor.
+
+    after holds the columns' values for the last row of the previous page.
+    The extra row tells the caller whether there's another page.
+    """
+
+    key = tuple_(*columns)
+
+    if after is not None:
+        query = query.filter(key < tuple_(*after) if descending else key > tuple_(*after))
+
+    order_by = [column.desc() if descending else column.asc() for column in columns]
+
+    return query.order_by(*order_by).limit(limit + 1).all()
+
+
+def get_load_options(model, fields):
+    """Return loader options that load only the attributes in fields.
+
+    fields is a projection spec such as CompiledSchema.fields: column
+    names, plus "relationship.column" for columns of related objects
+    (a bare relationship name loads the related objects in full).
+    Related objects are joined for many-to-one relationships and
+    selectin-loaded for collections. Primary keys are always loaded.
+    """
+
+    mapper = inspect(model)
+    columns = []
+    related_fields = {}  # relationship name -> fields of the related model
+
+    for field in fields:
+        name, _, related_field = field.partition(".")
+
+        if name in mapper.relationships:
+            related_fields.setdefault(name, [])
+            if related_field:
+                related_fields[name].append(related_field)
+        elif name in mapper.column_attrs:
+            columns.append(getattr(model, name))
+        else:
+            # Not a column (e.g. a property), so it may read any of them
+            columns = None
+            break
+
+    options = [db.load_only(*columns)] if columns else []
+
+    for name, relationship_fields in related_fields.items():
+        relationship = mapper.relationships[name]
+        attribute = getattr(model, name)
+
+        loader = db.selectinload(attribute) if relationship.uselist else db.joinedload(attribute)
+        if relationship_fields:
+            loader = loader.options(*get_load_options(relationship.mapper.class_,
+                                                      relationship_fields))
+
+        options.append(loader)
+
+    return options
 
 
 class User(db.Model):
@@ -48,6 +146,12 @@ class User(db.Model):
 
         return db.session.query(cls).filter(cls.email == email).first()
 
+    @classmethod
+    def get_user_by_id(cls, user_id):
+        """Return a user by id."""
+
+        return db.session.query(cls).get(user_id)
+
 
 class Pet(db.Model):
     """A pet."""
@@ -62,6 +166,19 @@ class Pet(db.Model):
     breed = db.Column(db.String, nullable=True)
     pet_img_url = db.Column(db.String, nullable=True)
     img_public_id = db.Column(db.String, nullable=True)
+    # Smaller variants of pet_img_url (see images.py); None for images
+    # uploaded before variants existed
+    img_medium_url = db.Column(db.String, nullable=True)
+    img_thumb_url = db.Column(db.String, nullable=True)
+    # While a new image uploads in the background (see uploads.py),
+    # img_status is "pending" and img_upload_id identifies the upload;
+    # img_status is "failed" if it never made it
+    img_status = db.Column(db.String, nullable=True)
+    img_upload_id = db.Column(db.String, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_pets_user_id", "user_id"),
+    )
 
     # user = User object
     # (db.relationship("Pets", backref="user") on User model)
@@ -99,6 +216,22 @@ class Pet(db.Model):
 
         return db.session.query(cls).get(pet_id)
 
+    @classmethod
+    def get_pets_by_ids_for_user_id(cls, pet_ids, user_id):
+        """Return a dictionary of pet_id -> pet for the user's pets in pet_ids.
+
+        Pets that don't exist or belong to another user are left out.
+        """
+
+        if not pet_ids:
+            return {}
+
+        pets = (db.session.query(cls)
+                          .filter(cls.pet_id.in_(pet_ids), cls.user_id == user_id)
+                          .all())
+
+        return {pet.pet_id: pet for pet in pets}
+
     @classmethod
     def get_check_ins_by_pet_id(cls, pet_id):
         """Return all check ins for a given pet id"""
@@ -109,6 +242,53 @@ class Pet(db.Model):
 
         return sorted(pet.check_ins, key=lambda x: x.date_hiked, reverse=True)
 
+    @classmethod
+    def get_check_ins_by_pet_for_user_id(cls, user_id, fields=None):
+        """Return a dictionary of pet_id -> check ins for all of a user's pets.
+
+        Uses a single query over pets_check_ins joined to check_ins; each
+        pet's check ins are ordered by date_hiked, most recent first.
+
+        fields is an optional list of CheckIn column names; if given, each
+        check in is a lightweight row with just those columns instead of
+        a CheckIn object.
+        """
+
+        if fields:
+            check_in_columns = [getattr(CheckIn, field) for field in fields]
+        else:
+            check_in_columns = [CheckIn]
+
+        rows = (db.session.query(PetCheckIn.pet_id, *check_in_columns)
+                          .join(CheckIn, PetCheckIn.check_in_id == CheckIn.check_in_id)
+                          .join(cls, PetCheckIn.pet_id == cls.pet_id)
+                          .filter(cls.user_id == user_id)
+                          .order_by(PetCheckIn.pet_id,
+                                    CheckIn.date_hiked.desc(),
+                                    CheckIn.check_in_id.desc())
+                          .all())
+
+        check_ins_by_pet = {}
+
+        for row in rows:
+            # A projected row's columns are read by name, like a CheckIn's attributes
+            check_in = row if fields else row[1]
+            check_ins_by_pet.setdefault(row.pet_id, []).append(check_in)
+
+        return check_ins_by_pet
+
+
+def get_catalog_key(hike_name, resources):
+    """Return the key a hike is matched on when the catalog is imported again."""
+
+    return f"{hike_name}|{resources or ''}"
+
+
+def get_default_catalog_key(context):
+    params = context.get_current_parameters()
+
+    return get_catalog_key(params["hike_name"], params.get("resources"))
+
 
 class Hike(db.Model):
     """A hike."""
@@ -125,6 +305,8 @@ class Hike(db.Model):
     description = db.Column(db.Text)
     latitude = db.Column(db.String)
     longitude = db.Column(db.String)
+    lat = db.Column(db.Float)  # latitude as a number, set with latitude
+    lng = db.Column(db.Float)  # longitude as a number, set with longitude
     address = db.Column(db.Text, nullable=False)
     city = db.Column(db.String)
     state = db.Column(db.String)
@@ -133,6 +315,15 @@ class Hike(db.Model):
     parking = db.Column(db.String)
     resources = db.Column(db.Text)
     hike_imgURL = db.Column(db.String)
+    # Identifies the hike across catalog imports (see catalog_loader.py)
+    catalog_key = db.Column(db.String, default=get_default_catalog_key)
+
+    __table_args__ = (
+        # Catalog pages are ordered by name
+        db.Index("ix_hikes_lower_hike_name_hike_id", func.lower(hike_name), hike_id),
+        db.Index("ix_hikes_state", "state"),
+        db.Index("ix_hikes_catalog_key", "catalog_key", unique=True),
+    )
 
     # comments = a list of Comment objects
     # (db.relationship("Hike", backref="comments") on Comment model)
@@ -147,6 +338,22 @@ class Hike(db.Model):
     def __repr__(self):
         return f"<Hike hike_id={self.hike_id} hike_name={self.hike_name}>"
 
+    @validates("latitude", "longitude")
+    def validate_coordinate(self, key, value):
+        """Keep the numeric lat/lng columns in sync with latitude/longitude."""
+
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = None
+
+        if key == "latitude":
+            self.lat = number
+        else:
+            self.lng = number
+
+        return value
+
     @classmethod
     def create_hike(cls, hike_name, area, difficulty,leash_rule, description, address, \
         latitude, longitude, city, state, miles, path, parking, resources, hike_imgURL):
@@ -178,6 +385,15 @@ class Hike(db.Model):
 
         return db.session.query(cls).order_by(func.lower(cls.hike_name).asc()).all()
 
+    @classmethod
+    def get_hike_ids_page(cls, limit, after=None):
+        """Return a page of (lowercase hike_name, hike_id) rows ordered by name."""
+
+        query = db.session.query(func.lower(cls.hike_name), cls.hike_id)
+
+        return get_keyset_page(query, [func.lower(cls.hike_name), cls.hike_id], limit, after,
+                               descending=False)
+
     @classmethod
     def get_hike_by_id(cls, hike_id):
         """Return hike by id."""
@@ -185,41 +401,15 @@ class Hike(db.Model):
         return db.session.query(cls).get(hike_id)
 
     @classmethod
-    def get_hikes_by_advanced_search(cls, keyword, difficulties, leash_rules, areas, cities, state, length_min, length_max, parking
-    ):
-        """Return hikes by query search"""
-
-        queries = []
+    def get_hikes_by_ids(cls, hike_ids):
+        """Return a dictionary of hike_id -> hike for the hikes in hike_ids."""
 
-        if keyword != "":
-            queries.append(cls.hike_name.ilike(f"%{keyword}%"))
-        if difficulties != []:
-            queries.append(cls.difficulty.in_(difficulties))
-        if leash_rules != []:
-            queries.append(cls.leash_rule.in_(leash_rules))
-        if areas != []:
-            queries.append(cls.area.in_(areas))
-        if cities != []:
-            queries.append(cls.city.in_(cities))
-        if state != "":
-            queries.append(cls.state == state)
-        if length_min != "":
-            queries.append(cls.miles >= length_min)
-        if length_max != "":
-            queries.append(cls.miles <= length_max)
-        if len(parking) == 1:
-            queries.append(cls.parking.ilike(f"%{parking[0]}%"))
-        elif len(parking) == 2:
-            queries.append(cls.parking.ilike(f"%{parking[0]}%") | \
-            cls.parking.ilike(f"%{parking[1]}%"))
+        if not hike_ids:
+            return {}
 
-        return db.session.query(cls).filter(*queries).order_by(cls.hike_name.asc()).all()
+        hikes = db.session.query(cls).filter(cls.hike_id.in_(hike_ids)).all()
 
-    @classmethod
-    def get_hike_by_keyword(cls, keyword):
-        """Return hikes by keyword."""
-
-        return db.session.query(cls).filter(cls.hike_name.ilike(f"%{keyword}%")).all()
+        return {hike.hike_id: hike for hike in hikes}
 
 
 class Comment(db.Model):
@@ -238,6 +428,12 @@ class Comment(db.Model):
     hike = db.relationship("Hike", backref="comments")
     user = db.relationship("User", backref="comments")
 
+    __table_args__ = (
+        # Comment pages are ordered newest first
+        db.Index("ix_comments_hike_id_date_created", "hike_id", "date_created", "comment_id"),
+        db.Index("ix_comments_user_id_date_created", "user_id", "date_created", "comment_id"),
+    )
+
     def __repr__(self):
         return f"<Comment comment_id={self.comment_id} body={self.body}>"
 
@@ -263,6 +459,36 @@ class Comment(db.Model):
                           .order_by(cls.date_created.desc())
                           .all())
 
+    @classmethod
+    def get_comments_with_hike_and_user_by_user_id(cls, user_id):
+        """Return all comments by user_id with their hike and user loaded."""
+
+        return (db.session.query(cls)
+                          .options(db.joinedload("hike"), db.joinedload("user"))
+                          .filter_by(user_id=user_id)
+                          .order_by(cls.date_created.desc())
+                          .all())
+
+    @classmethod
+    def get_comments_page_by_user_id(cls, user_id, limit, after=None):
+        """Return a page of a user's comments, newest first, with their hike and user loaded."""
+
+        query = (db.session.query(cls)
+                           .options(db.joinedload("hike"), db.joinedload("user"))
+                           .filter_by(user_id=user_id))
+
+        return get_keyset_page(query, [cls.date_created, cls.comment_id], limit, after)
+
+    @classmethod
+    def get_comments_page_by_hike_id(cls, hike_id, limit, after=None):
+        """Return a page of a hike's comments, newest first, with their hike and user loaded."""
+
+        query = (db.session.query(cls)
+                           .options(db.joinedload("hike"), db.joinedload("user"))
+                           .filter_by(hike_id=hike_id))
+
+        return get_keyset_page(query, [cls.date_created, cls.comment_id], limit, after)
+
     @classmethod
     def get_comment_by_hike_id(cls, hike_id):
         """Return all comments by hike_id."""
@@ -297,6 +523,12 @@ class CheckIn(db.Model):
     hike = db.relationship("Hike", backref="check_ins")
     user = db.relationship("User", backref="check_ins")
 
+    __table_args__ = (
+        # Check in pages are ordered most recent hike first
+        db.Index("ix_check_ins_user_id_date_hiked", "user_id", "date_hiked", "check_in_id"),
+        db.Index("ix_check_ins_hike_id", "hike_id"),
+    )
+
     pets = db.relationship(
         "Pet", secondary="pets_check_ins", backref="check_ins"
     )
@@ -328,14 +560,69 @@ class CheckIn(db.Model):
                          .get(check_in_id))
 
     @classmethod
-    def get_check_ins_by_param(cls, *args):
-        """Return all check ins for given parameters"""
+    def get_check_ins_with_hike_and_pets_by_user_id(cls, user_id, fields=None):
+        """Return all check ins by user_id with their hike and pets loaded.
+
+        Pass a projection spec as fields to load only those attributes; it
+        should include "pets" and "hike" fields.
+        """
+
+        if fields:
+            options = get_load_options(cls, fields)
+        else:
+            options = [db.joinedload("hike"), db.selectinload("pets")]
+
+        return (db.session.query(cls)
+                          .options(*options)
+                          .filter_by(user_id=user_id)
+                          .order_by(cls.date_hiked.desc(), cls.check_in_id.desc())
+                          .all())
+
+    @classmethod
+    def get_check_ins_with_hike_and_pets_by_ids(cls, check_in_ids):
+        """Return the check ins for check_in_ids, in the same order, with their hike and pets loaded."""
+
+        check_ins = (db.session.query(cls)
+                               .options(db.joinedload("hike"), db.selectinload("pets"))
+                               .filter(cls.check_in_id.in_(check_in_ids))
+                               .all())
+        check_ins_by_id = {check_in.check_in_id: check_in for check_in in check_ins}
+
+        return [check_ins_by_id[check_in_id] for check_in_id in check_in_ids]
+
+    @classmethod
+    def get_check_ins_page_by_user_id(cls, user_id, limit, after=None, fields=None):
+        """Return a page of a user's check ins, most recent first, with their hike and pets loaded.
+
+        Pass a projection spec as fields to load only those attributes.
+        """
+
+        if fields:
+            options = get_load_options(cls, fields)
+        else:
+            options = [db.joinedload("hike"), db.selectinload("pets")]
+
+        query = (db.session.query(cls)
+                           .options(*options)
+                           .filter_by(user_id=user_id))
+
+        return get_keyset_page(query, [cls.date_hiked, cls.check_in_id], limit, after)
+
+    @classmethod
+    def get_check_ins_by_param(cls, *args, fields=None):
+        """Return all check ins for given parameters
+
+        Pass a projection spec as fields to load only those attributes
+        (see get_load_options).
+        """
 
         queries = [getattr(cls, attr)==val for attr, val in args]
+        options = get_load_options(cls, fields) if fields else []
 
         return (db.session.query(cls)
+                          .options(*options)
                           .filter(*queries)
-                          .order_by(cls.date_hiked.desc())
+                          .order_by(cls.date_hiked.desc(), cls.check_in_id.desc())
                           .all())
 
 
@@ -350,6 +637,10 @@ class BookmarksList(db.Model):
     bookmarks_list_name = db.Column(db.String, unique=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), nullable=False)
 
+    __table_args__ = (
+        db.Index("ix_bookmarks_lists_user_id", "user_id"),
+    )
+
     hikes = db.relationship(
         "Hike", secondary="hikes_bookmarks_lists", backref="bookmarks_lists"
     )
@@ -382,6 +673,30 @@ class BookmarksList(db.Model):
                           .order_by(func.lower(cls.bookmarks_list_name).asc())
                           .all())
 
+    @classmethod
+    def get_bookmarks_lists_with_hikes_by_user_id(cls, user_id):
+        """Return all bookmarks lists by user_id with their hikes loaded."""
+
+        return (db.session.query(cls)
+                          .options(db.selectinload("hikes"))
+                          .filter_by(user_id=user_id)
+                          .order_by(func.lower(cls.bookmarks_list_name).asc())
+                          .all())
+
+    @classmethod
+    def get_bookmarks_list_ids_for_user_id(cls, bookmarks_list_ids, user_id):
+        """Return the set of ids in bookmarks_list_ids owned by user_id."""
+
+        if not bookmarks_list_ids:
+            return set()
+
+        rows = (db.session.query(cls.bookmarks_list_id)
+                          .filter(cls.bookmarks_list_id.in_(bookmarks_list_ids),
+                                  cls.user_id == user_id)
+                          .all())
+
+        return {bookmarks_list_id for bookmarks_list_id, in rows}
+
     @classmethod
     def get_bookmarks_lists_by_user_id_and_hike_id(cls, user_id, hike_id):
         """Return all bookmarks lists objects for a given user_id and hike_id."""
@@ -413,6 +728,13 @@ class PetCheckIn(db.Model):
     pet_id = db.Column(db.Integer, db.ForeignKey("pets.pet_id"), nullable=False)
     check_in_id = db.Column(db.Integer, db.ForeignKey("check_ins.check_in_id"), nullable=False)
 
+    __table_args__ = (
+        # A pet is on a check in at most once; the unique index also
+        # serves lookups by pet_id
+        db.Index("uq_pets_check_ins_pet_id_check_in_id", "pet_id", "check_in_id", unique=True),
+        db.Index("ix_pets_check_ins_check_in_id", "check_in_id"),
+    )
+
     @classmethod
     def create_pet_check_in(cls, pet_id, check_in_id):
         """Create and return a new pet check in object."""
@@ -443,6 +765,14 @@ class HikeBookmarksList(db.Model):
         db.Integer, db.ForeignKey("bookmarks_lists.bookmarks_list_id"), nullable=False
     )
 
+    __table_args__ = (
+        # A hike is on a bookmarks list at most once; the unique index also
+        # serves lookups by bookmarks_list_id
+        db.Index("uq_hikes_bookmarks_lists_bookmarks_list_id_hike_id",
+                 "bookmarks_list_id", "hike_id", unique=True),
+        db.Index("ix_hikes_bookmarks_lists_hike_id", "hike_id"),
+    )
+
     # hike
     # bookmarks_list
 
@@ -464,10 +794,257 @@ class HikeBookmarksList(db.Model):
         return (db.session.query(cls).filter(cls.hike_id==hike_id,
                                              cls.bookmarks_list_id==bookmarks_list_id).all())
 
-def connect_to_db(flask_app, db_uri="postgresql:///pupjourney", echo=True):
+    @classmethod
+    def update_hikes_bookmarks_lists(cls, user_id, pairs_to_add, pairs_to_remove):
+        """Add and remove hikes on a user's bookmarks lists.
+
+        pairs_to_add and pairs_to_remove are sets of (hike_id, bookmarks_list_id)
+        for bookmarks lists owned by user_id. The current rows are read with one
+        query, then the missing pairs are added with one bulk insert and the
+        present ones removed with one bulk delete. Pairs in both sets are added.
+
+        Return the sets of pairs actually added and removed.
+        """
+
+        pairs = pairs_to_add | pairs_to_remove
+
+        if not pairs:
+            return set(), set()
+
+        rows = (db.session.query(cls.hike_bookmarks_list_id, cls.hike_id, cls.bookmarks_list_id)
+                          .filter(cls.hike_id.in_({hike_id for hike_id, _ in pairs}),
+                                  cls.bookmarks_list_id.in_({bookmarks_list_id for _, bookmarks_list_id in pairs}))
+                          .all())
+
+        # (hike_id, bookmarks_list_id) -> ids of its rows
+        existing = {}
+        for hike_bookmarks_list_id, hike_id, bookmarks_list_id in rows:
+            existing.setdefault((hike_id, bookmarks_list_id), []).append(hike_bookmarks_list_id)
+
+        added = pairs_to_add - existing.keys()
+        removed = (pairs_to_remove - pairs_to_add) & existing.keys()
+
+        if added:
+            db.session.execute(cls.__table__.insert(),
+                               [{"hike_id": hike_id, "bookmarks_list_id": bookmarks_list_id}
+                                for hike_id, bookmarks_list_id in sorted(added)])
+
+        if removed:
+            row_ids = [row_id for pair in removed for row_id in existing[pair]]
+            db.session.execute(cls.__table__.delete()
+                                            .where(cls.hike_bookmarks_list_id.in_(row_ids)))
+
+        if added or removed:
+            # Bulk statements skip the session's flush events, so bump the
+            # change versions here
+            scopes = {f"user:{user_id}"}
+            scopes |= {f"bookmarks_list:{bookmarks_list_id}" for _, bookmarks_list_id in added | removed}
+            ChangeVersion.bump_versions(db.session.connection(), scopes)
+
+        return added, removed
+
+
+class ChangeVersion(db.Model):
+    """Change counter for a scope of data (e.g. "user:1", "catalog")."""
+
+    __tablename__ = "change_versions"
+
+    scope = db.Column(db.String, primary_key=True, nullable=False)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<Change Version scope={self.scope} version={self.version}>"
+
+    @classmethod
+    def get_versions(cls, scopes):
+        """Return a dictionary of scope -> version for the given scopes."""
+
+        rows = db.session.query(cls.scope, cls.version).filter(cls.scope.in_(scopes)).all()
+
+        return {scope: version for scope, version in rows}
+
+    @classmethod
+    def bump_versions(cls, connection, scopes):
+        """Increment the version of each scope using the given connection."""
+
+        for scope in sorted(scopes):
+            increment_row(connection, cls.__table__, {"scope": scope}, {"version": 1})
+
+
+class HikeActivity(db.Model):
+    """Check in, comment and bookmark counts and trending score for a hike.
+
+    Kept up to date by activity.update_hike_activity() whenever check ins,
+    comments or bookmarks change, so hikes can be ordered by popularity
+    with an index scan.
+    """
+
+    __tablename__ = "hike_activity"
+
+    hike_id = db.Column(db.Integer, db.ForeignKey("hikes.hike_id"), primary_key=True,
+                        autoincrement=False, nullable=False)
+    check_in_count = db.Column(db.Integer, default=0, nullable=False)
+    comment_count = db.Column(db.Integer, default=0, nullable=False)
+    bookmark_count = db.Column(db.Integer, default=0, nullable=False)
+    # Log of the sum of 2 ** (days from activity.TRENDING_EPOCH / TRENDING_HALF_LIFE_DAYS)
+    # over the hike's check ins and comments; every score decays at the same
+    # rate, so ordering by it orders by decayed activity
+    trending_score = db.Column(db.Float, default=0, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_hike_activity_check_in_count_hike_id", "check_in_count", "hike_id"),
+        db.Index("ix_hike_activity_comment_count_hike_id", "comment_count", "hike_id"),
+        db.Index("ix_hike_activity_bookmark_count_hike_id", "bookmark_count", "hike_id"),
+        db.Index("ix_hike_activity_trending_score_hike_id", "trending_score", "hike_id"),
+    )
+
+    # Sort option -> column hikes are ordered by, most active first
+    SORT_COLUMNS = {
+        "check_ins": "check_in_count",
+        "comments": "comment_count",
+        "bookmarks": "bookmark_count",
+        "trending": "trending_score",
+    }
+
+    def __repr__(self):
+        return f"<Hike Activity hike_id={self.hike_id} check_in_count={self.check_in_count}>"
+
+    @classmethod
+    def get_hike_ids(cls, sort):
+        """Return the ids of hikes with activity rows, ordered by a sort option."""
+
+        column = getattr(cls, cls.SORT_COLUMNS[sort])
+        rows = db.session.query(cls.hike_id).order_by(column.desc(), cls.hike_id.desc()).all()
+
+        return [hike_id for hike_id, in rows]
+
+    @classmethod
+    def get_hike_ids_page(cls, sort, limit, after=None):
+        """Return a page of (sort value, hike_id) rows ordered by a sort option."""
+
+        column = getattr(cls, cls.SORT_COLUMNS[sort])
+        query = db.session.query(column, cls.hike_id)
+
+        return get_keyset_page(query, [column, cls.hike_id], limit, after)
+
+
+class HikingStats(db.Model):
+    """Hiking totals for a subject (a user or pet, e.g. "user:1", "pet:2").
+
+    Kept up to date by stats.update_hiking_stats() whenever check ins change.
+    """
+
+    __tablename__ = "hiking_stats"
+
+    subject = db.Column(db.String, primary_key=True, nullable=False)
+    total_miles = db.Column(db.Float, default=0, nullable=False)
+    hike_count = db.Column(db.Integer, default=0, nullable=False)
+    total_time = db.Column(db.Float, default=0, nullable=False)
+    distinct_hikes = db.Column(db.Integer, default=0, nullable=False)
+    # Consecutive weeks with a hike, ending with the week of last_hiked
+    streak_weeks = db.Column(db.Integer, default=0, nullable=False)
+    longest_streak_weeks = db.Column(db.Integer, default=0, nullable=False)
+    last_hiked = db.Column(db.Date, nullable=True)
+
+    def __repr__(self):
+        return f"<Hiking Stats subject={self.subject} hike_count={self.hike_count}>"
+
+    @classmethod
+    def get_stats_by_subject(cls, subjects):
+        """Return a dictionary of subject -> (HikingStats, [HikingStatsMonth, ...]).
+
+        Subjects without any check ins are left out. Months are in order.
+        """
+
+        stats_by_subject = {stats.subject: (stats, [])
+                            for stats in db.session.query(cls).filter(cls.subject.in_(subjects)).all()}
+
+        months = (db.session.query(HikingStatsMonth)
+                  .filter(HikingStatsMonth.subject.in_(list(stats_by_subject)))
+                  .order_by(HikingStatsMonth.subject, HikingStatsMonth.month)
+                  .all())
+
+        for month in months:
+            stats_by_subject[month.subject][1].append(month)
+
+        return stats_by_subject
+
+
+class HikingStatsMonth(db.Model):
+    """Hiking totals for a subject in one month."""
+
+    __tablename__ = "hiking_stats_months"
+
+    subject = db.Column(db.String, primary_key=True, nullable=False)
+    # First day of the month
+    month = db.Column(db.Date, primary_key=True, nullable=False)
+    miles = db.Column(db.Float, default=0, nullable=False)
+    hike_count = db.Column(db.Integer, default=0, nullable=False)
+    total_time = db.Column(db.Float, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<Hiking Stats Month subject={self.subject} month={self.month}>"
+
+
+def increment_row(connection, table, key, increments):
+    """Add increments to the columns of the row with the given primary key.
+
+    key and increments are dictionaries of column name -> value. A missing
+    row is inserted with the increments as its values.
+    """
+
+    if connection.dialect.name == "postgresql":
+        # Imported here: the dialect is loaded once connected to Postgres
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+        stmt = pg_insert(table).values(**key, **increments)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c[name] for name in key],
+            set_={name: table.c[name] + value for name, value in increments.items()}))
+        return
+
+    result = connection.execute(table.update()
+                                     .where(*[table.c[name] == value for name, value in key.items()])
+                                     .values({name: table.c[name] + value
+                                              for name, value in increments.items()}))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(**key, **increments))
+
+
+def set_database_config_defaults(config):
+    """Fill in missing DATABASE_* settings from the environment or DATABASE_CONFIG_DEFAULTS."""
+
+    for name, default in DATABASE_CONFIG_DEFAULTS.items():
+        config.setdefault(name, int(os.environ.get(name, default)))
+
+
+def get_engine_options(db_uri, config):
+    """Return create_engine() options for a database from the app's DATABASE_* settings."""
+
+    set_database_config_defaults(config)
+    options = {"pool_pre_ping": bool(config["DATABASE_POOL_PRE_PING"])}
+
+    if make_url(db_uri).get_backend_name() == "sqlite":
+        return options
+
+    options.update(pool_size=config["DATABASE_POOL_SIZE"],
+                   max_overflow=config["DATABASE_MAX_OVERFLOW"],
+                   pool_timeout=config["DATABASE_POOL_TIMEOUT"],
+                   pool_recycle=config["DATABASE_POOL_RECYCLE"])
+
+    # Set for every session (connection) when it's opened
+    if config["DATABASE_STATEMENT_TIMEOUT_MS"]:
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={config['DATABASE_STATEMENT_TIMEOUT_MS']}"}
+
+    return options
+
+
+def connect_to_db(flask_app, db_uri="postgresql:///pupjourney", echo=False):
     flask_app.config["SQLALCHEMY_DATABASE_URI"] = db_uri
     flask_app.config["SQLALCHEMY_ECHO"] = echo
     flask_app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    flask_app.config["SQLALCHEMY_ENGINE_OPTIONS"] = get_engine_options(db_uri, flask_app.config)
     
     db.app = flask_app
     db.init_app(flask_app)
@@ -509,8 +1086,9 @@ if __name__ == "__main__":
 
     from server import app
 
-    # Call connect_to_db(app, echo=False) if your program output gets
-    # too annoying; this will tell SQLAlchemy not to print out every
-    # query it executes.
+    # Print out every query SQLAlchemy executes in the interactive session;
+    # call connect_to_db(app) instead if your program output gets too
+    # annoying. The server leaves echo off and reports query counts and
+    # timings at /metrics instead.
 
-    connect_to_db(app)
+    connect_to_db(app, echo=True)
@@ -0,0 +1,71 @@
+"""Keyset (cursor) pagination helpers for list endpoints."""
+
+import base64
+import json
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(values):
+    """Return an opaque cursor for the sort key values of a page's last row."""
+
+    values = [value.isoformat() if hasattr(value, "isoformat") else value for value in values]
+
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, parsers):
+    """Return the sort key values in a cursor, each converted by its parser.
+
+    Raise ValueError if the cursor is malformed.
+    """
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError("Invalid cursor")
+
+        return tuple(parse(value) for parse, value in zip(parsers, values))
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def get_page_args(args, parsers):
+    """Return (limit, after) from request args, or None if the request isn't paginated.
+
+    A request is paginated when it has a limit or a cursor. after is the
+    decoded cursor, or None for the first page. Raise ValueError if
+    either arg is invalid.
+    """
+
+    if "limit" not in args and "cursor" not in args:
+        return None
+
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("Invalid limit")
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(args["cursor"], parsers) if args.get("cursor") else None
+
+    return limit, after
+
+
+def split_page(rows, limit, get_key):
+    """Split up to limit + 1 rows into (page, next cursor).
+
+    get_key returns the sort key values of a row; the next cursor is None
+    on the last page.
+    """
+
+    if len(rows) <= limit:
+        return rows, None
+
+    page = rows[:limit]
+
+    return page, encode_cursor(get_key(page[-1]))
@@ -0,0 +1,80 @@
+"""Import-time profile of the app's startup, from python -X importtime.
+
+Every gunicorn master, CLI script and test run imports server (and
+through it model), so modules that are slow to import and only needed
+by some requests are imported on first use instead (see lazy.py).
+
+Run: python3 profile_startup.py [module]
+
+To check every module in IMPORT_TIME_BUDGET_MS imports within its budget,
+e.g. on the machine that runs the server, run:
+python3 profile_startup.py --check
+"""
+
+from collections import namedtuple
+import os
+import subprocess
+import sys
+
+
+# Best-of-three time to import a module in a fresh interpreter
+IMPORT_TIME_BUDGET_MS = {"server": 750, "model": 600}
+
+# Modules that importing server mustn't import
+DEFERRED_MODULES = ["schemas", "marshmallow", "flask_marshmallow", "cloudinary", "PIL", "redis"]
+
+ImportTime = namedtuple("ImportTime", ["module", "self_ms", "cumulative_ms"])
+
+
+def get_import_times(module):
+    """Return an ImportTime for each module imported by importing module, in import order."""
+
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             cwd=os.path.dirname(os.path.abspath(__file__)),
+                             capture_output=True, text=True, check=True)
+    import_times = []
+
+    # Lines look like "import time:       123 |       4567 |   package.module"
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("| imported package"):
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        import_times.append(ImportTime(name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+
+    return import_times
+
+
+def get_startup_ms(module, runs=3):
+    """Return the fastest of several times to import module, in milliseconds."""
+
+    return min(get_import_times(module)[-1].cumulative_ms for _ in range(runs))
+
+
+def get_over_budget():
+    """Return {module: startup ms} of the modules in IMPORT_TIME_BUDGET_MS over their budget."""
+
+    startup_ms = {module: get_startup_ms(module) for module in IMPORT_TIME_BUDGET_MS}
+
+    return {module: ms for module, ms in startup_ms.items() if ms > IMPORT_TIME_BUDGET_MS[module]}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--check"]:
+        over_budget = get_over_budget()
+
+        for module, ms in over_budget.items():
+            print(f"import {module}: {ms:.0f} ms (budget {IMPORT_TIME_BUDGET_MS[module]} ms)")
+
+        sys.exit(1 if over_budget else 0)
+
+    module = sys.argv[1] if len(sys.argv) > 1 else "server"
+    import_times = get_import_times(module)
+
+    print(f"{'module':<48}{'self ms':>10}{'total ms':>10}")
+    for import_time in sorted(import_times, key=lambda x: x.cumulative_ms, reverse=True)[:20]:
+        print(f"{import_time.module:<48}{import_time.self_ms:>10.1f}{import_time.cumulative_ms:>10.1f}")
+
+    budget_ms = IMPORT_TIME_BUDGET_MS.get(module)
+    print(f"\nimport {module}: {get_startup_ms(module):.0f} ms"
+          + (f" (budget {budget_ms} ms)" if budget_ms else ""))
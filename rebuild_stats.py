@@ -0,0 +1,20 @@
+"""Script to recompute users' and pets' hiking stats and hikes' activity counters.
+
+Run after migrating to the stats and activity tables, or to repair
+counters that have drifted from the check ins, comments and bookmarks:
+python3 rebuild_stats.py
+"""
+
+from model import connect_to_db, db
+from stats import rebuild_hiking_stats
+from activity import rebuild_hike_activity
+import server
+
+connect_to_db(server.app, echo=False)
+
+with db.engine.begin() as connection:
+    subject_count = rebuild_hiking_stats(connection)
+    hike_count = rebuild_hike_activity(connection)
+
+print(f"Rebuilt hiking stats for {subject_count} users and pets")
+print(f"Rebuilt activity counters for {hike_count} hikes")
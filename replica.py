@@ -0,0 +1,122 @@
+"""Read replica routing for read-only endpoints.
+
+Views decorated with @read_only run their queries on the database at
+app.config["DATABASE_REPLICA_URI"] (model.RoutingSession picks the
+engine). Without a replica configured, or while it's unreachable, they
+run on the primary like every other view. Only endpoints that serve the
+shared catalog are read-only, so users still read their own writes from
+the primary right away.
+"""
+
+from functools import wraps
+import os
+import threading
+import time
+
+from flask import current_app, g
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from model import db, get_engine_options
+
+
+# Seconds to send read-only requests to the primary after the replica fails
+REPLICA_RETRY_SECONDS = 30
+
+
+class ReplicaRouter:
+    """Hold the replica engine and whether read-only requests may use it."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._engine = None
+        self._engine_uri = None
+        self._down_until = 0.0
+        self.app = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault("DATABASE_REPLICA_URI", os.environ.get("DATABASE_REPLICA_URI"))
+        app.config.setdefault("REPLICA_RETRY_SECONDS", REPLICA_RETRY_SECONDS)
+        app.extensions["replica_router"] = self
+
+    def get_engine(self):
+        """Return the replica engine, or None if no replica is configured.
+
+        The engine is created on first use, so worker processes don't
+        share its connections.
+        """
+
+        uri = self.app.config["DATABASE_REPLICA_URI"]
+        if not uri:
+            return None
+
+        with self._lock:
+            if self._engine_uri != uri:
+                if self._engine is not None:
+                    self._engine.dispose()
+                self._engine = create_engine(uri, **get_engine_options(uri, self.app.config))
+                self._engine_uri = uri
+                self._down_until = 0.0
+
+            return self._engine
+
+    def is_available(self):
+        return time.monotonic() >= self._down_until
+
+    def mark_down(self, error):
+        """Send read-only requests to the primary for REPLICA_RETRY_SECONDS."""
+
+        self._down_until = time.monotonic() + self.app.config["REPLICA_RETRY_SECONDS"]
+        self.app.logger.warning("Read replica failed, using the primary for %ss: %s",
+                                self.app.config["REPLICA_RETRY_SECONDS"], error)
+
+    def get_request_engine(self):
+        """Return the replica engine if the current request should query it, else None."""
+
+        if not g.get("read_only"):
+            return None
+
+        engine = self.get_engine()
+        if engine is None or not self.is_available():
+            return None
+
+        g.replica_used = True
+
+        return engine
+
+
+def read_only(view):
+    """Run a view's queries on the read replica, falling back to the primary.
+
+    If the replica fails with an OperationalError (e.g. it's unreachable),
+    the view is run again on the primary.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        router = current_app.extensions.get("replica_router")
+        if router is None:
+            return view(*args, **kwargs)
+
+        g.read_only = True
+
+        try:
+            return view(*args, **kwargs)
+        except OperationalError as error:
+            if not g.get("replica_used"):
+                raise
+
+            router.mark_down(error)
+            db.session.rollback()
+            g.read_only = False
+
+            return view(*args, **kwargs)
+        finally:
+            g.pop("read_only", None)
+            g.pop("replica_used", None)
+
+    return wrapper
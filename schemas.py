@@ -0,0 +1,127 @@
+"""Marshmallow schemas and the compiled serializers built from them.
+
+Building the schemas introspects every mapped column, and importing
+marshmallow is slow, so server.py imports this module on first use
+rather than at startup. Once imported, the schemas are shared by every
+request (and, with a preloading server, by every worker).
+"""
+
+from flask_marshmallow import Marshmallow
+from marshmallow import fields
+
+from model import User, CheckIn, Pet, HikeBookmarksList, PetCheckIn, Hike, BookmarksList, Comment
+from instrumentation import TimedDumpMixin
+from serializers import CompiledSchema
+
+
+ma = Marshmallow()
+
+
+class UserSchema(TimedDumpMixin, ma.SQLAlchemyAutoSchema):
+    """User Schema"""
+    class Meta:
+        model = User
+        load_instance = True
+
+    pets = fields.List(fields.Nested("PetSchema", exclude=("user",)))
+    bookmarks_lists = fields.List(fields.Nested("BookmarksListSchema", exclude=("user",)))
+    comments = fields.List(fields.Nested("CommentSchema", exclude=("user",)))
+    check_ins = fields.List(fields.Nested("CheckInSchema", exclude=("user",)))
+
+
+class PetSchema(TimedDumpMixin, ma.SQLAlchemyAutoSchema):
+    """Pet Schema"""
+    class Meta:
+        model = Pet
+        include_fk = True
+        load_instance = True
+        exclude = ("img_upload_id",)
+
+    check_ins = fields.Nested("PetCheckInSchema", many=True)
+
+
+class HikeSchema(TimedDumpMixin, ma.SQLAlchemyAutoSchema):
+    """Hike Schema"""
+    class Meta:
+        model = Hike
+        load_instance = True
+        exclude = ("catalog_key",)
+
+    comments = fields.List(fields.Nested("CommentSchema", exclude=("hike", "user",)))
+    check_ins = fields.List(fields.Nested("CheckInSchema", exclude=("hike", "pets",)))
+    bookmarks_lists = fields.List(fields.Nested("BookmarksListSchema", exclude=("hikes",)))
+
+
+class CommentSchema(TimedDumpMixin, ma.SQLAlchemyAutoSchema):
+    """Comment Schema"""
+    class Meta:
+        model = Comment
+        include_fk = True
+        load_instance = True
+
+    hike = fields.Nested(HikeSchema(exclude=("check_ins", "comments", "bookmarks_lists",)))
+    user = fields.Nested(UserSchema(exclude=("pets", "check_ins", "comments", "bookmarks_lists",)))
+
+
+class CheckInSchema(TimedDumpMixin, ma.SQLAlchemyAutoSchema):
+    """Check In Schema"""
+    class Meta:
+        model = CheckIn
+        include_fk = True
+        load_instance = True
+
+    hike = fields.Nested(HikeSchema(exclude=("check_ins", "comments", "bookmarks_lists")))
+    user = fields.Nested(UserSchema(exclude=("pets", "check_ins", "comments", "bookmarks_lists",)))
+    pets = fields.Nested("PetCheckInSchema", many=True)
+
+
+class PetCheckInSchema(TimedDumpMixin, ma.SQLAlchemyAutoSchema):
+    """Pet Check In Schema"""
+    class Meta:
+        model = PetCheckIn
+        include_fk = True
+        load_instance = True
+
+    check_in = fields.Nested(CheckInSchema)
+
+
+class HikeBookmarksListSchema(TimedDumpMixin, ma.SQLAlchemyAutoSchema):
+    """Hike Bookmarks List Schema"""
+    class Meta:
+        model = HikeBookmarksList
+        include_fk = True
+        load_instance = True
+
+    hike = fields.Nested(HikeSchema(exclude=("check_ins", "comments", "bookmarks_lists",)))
+
+
+class BookmarksListSchema(TimedDumpMixin, ma.SQLAlchemyAutoSchema):
+    """Bookmarks List Schema"""
+    class Meta:
+        model = BookmarksList
+        include_fk = True
+        load_instance = True
+
+    hikes = fields.List(fields.Nested(HikeBookmarksListSchema))
+
+
+# Compiled serializers for the hot read endpoints, built once at import.
+# Each dumps exactly what the schema it's built from would.
+HIKE_RELATIONSHIPS = ["comments", "check_ins", "bookmarks_lists"]
+USER_CHECK_IN_FIELDS = ["check_in_id", "date_hiked", "hike_id", "miles_completed", "notes",
+                        "total_time", "hike.hike_name", "hike.latitude", "hike.longitude"]
+
+hikes_serializer = CompiledSchema(HikeSchema(many=True, exclude=HIKE_RELATIONSHIPS))
+comments_serializer = CompiledSchema(CommentSchema(many=True))
+check_ins_serializer = CompiledSchema(CheckInSchema(many=True, exclude=["pets"]))
+user_check_ins_serializer = CompiledSchema(CheckInSchema(many=True, only=USER_CHECK_IN_FIELDS))
+check_in_graph_serializer = CompiledSchema(CheckInSchema(many=True,
+                                                         only=["date_hiked", "miles_completed"]))
+pets_serializer = CompiledSchema(PetSchema(many=True, exclude=["check_ins"]))
+pet_names_serializer = CompiledSchema(PetSchema(only=["pet_id", "pet_name"]))
+bookmarks_lists_serializer = CompiledSchema(BookmarksListSchema(many=True, exclude=["hikes"]))
+
+# Projection spec for loading the check ins in /user_check_ins.json, with
+# the pets serialize_user_check_ins adds to them
+USER_CHECK_IN_PROJECTION = (user_check_ins_serializer.fields
+                            + tuple(f"pets.{field}" for field in pets_serializer.fields))
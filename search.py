@@ -0,0 +1,198 @@
+"""In-process full-text search over the hike catalog (inverted index + BM25)."""
+
+from bisect import bisect_left
+import math
+import re
+import threading
+
+
+# Fields searched, with the weight of a term appearing in each field
+FIELD_WEIGHTS = {"hike_name": 3.0, "area": 2.0, "city": 2.0, "description": 1.0}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Query terms matched by prefix or with one typo score less than exact matches
+PREFIX_WEIGHT = 0.7
+TYPO_WEIGHT = 0.5
+MIN_TYPO_LENGTH = 4
+MAX_PREFIX_TERMS = 50
+
+# Dropped from queries; a query of nothing but stopwords has no terms
+STOPWORDS = {"a", "an", "and", "at", "in", "of", "on", "the", "to"}
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Return the lowercase alphanumeric tokens in text."""
+
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def get_query_terms(query):
+    """Return the terms of a search query searched for: its tokens, less stopwords.
+
+    A query without any (e.g. "" or "the") filters nothing, so callers
+    show every hike for it.
+    """
+
+    return [token for token in tokenize(query) if token not in STOPWORDS]
+
+
+def get_deletes(term):
+    """Return the variants of term with one character deleted."""
+
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+class SearchIndex:
+    """Inverted index of hike fields, ranked with BM25.
+
+    sync() follows the catalog cache and only re-indexes hikes that were
+    added, changed or removed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.generation = None
+
+        self._hikes = {}  # hike_id -> serialized hike as last indexed
+        self._postings = {}  # term -> {hike_id: weighted term frequency}
+        self._lengths = {}  # hike_id -> weighted number of terms
+        self._total_length = 0.0
+
+        self._terms = []  # sorted vocabulary, for prefix matches
+        self._deletes = {}  # one-deletion variant -> terms, for typo matches
+        self._terms_stale = False
+
+    def _add_hike(self, hike):
+        hike_id = hike["hike_id"]
+        frequencies = {}
+        length = 0.0
+
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(hike[field]):
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+                length += weight
+
+        for term, frequency in frequencies.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                self._terms_stale = True
+            self._postings[term][hike_id] = frequency
+
+        self._lengths[hike_id] = length
+        self._total_length += length
+        self._hikes[hike_id] = hike
+
+    def _remove_hike(self, hike_id):
+        hike = self._hikes.pop(hike_id)
+        self._total_length -= self._lengths.pop(hike_id)
+
+        terms = {term for field in FIELD_WEIGHTS for term in tokenize(hike[field])}
+
+        for term in terms:
+            postings = self._postings[term]
+            del postings[hike_id]
+            if not postings:
+                del self._postings[term]
+                self._terms_stale = True
+
+    def _rebuild_terms(self):
+        self._terms = sorted(self._postings)
+        self._deletes = {}
+
+        for term in self._terms:
+            if len(term) >= MIN_TYPO_LENGTH:
+                for variant in get_deletes(term) | {term}:
+                    self._deletes.setdefault(variant, set()).add(term)
+
+        self._terms_stale = False
+
+    def sync(self, snapshot):
+        """Bring the index up to date with a CatalogSnapshot."""
+
+        if snapshot.generation == self.generation:
+            return
+
+        with self._lock:
+            if snapshot.generation == self.generation:
+                return
+
+            for hike_id in list(self._hikes):
+                if snapshot.hikes_by_id.get(hike_id) != self._hikes[hike_id]:
+                    self._remove_hike(hike_id)
+
+            for hike_id, hike in snapshot.hikes_by_id.items():
+                if hike_id not in self._hikes:
+                    self._add_hike(hike)
+
+            if self._terms_stale:
+                self._rebuild_terms()
+
+            self.generation = snapshot.generation
+
+    def _expand(self, token):
+        """Return {term: weight} for the indexed terms a query token matches."""
+
+        expansions = {}
+
+        if token in self._postings:
+            expansions[token] = 1.0
+
+        start = bisect_left(self._terms, token)
+        for term in self._terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(token):
+                break
+            expansions.setdefault(term, PREFIX_WEIGHT)
+
+        if not expansions and len(token) >= MIN_TYPO_LENGTH:
+            # Terms within one insertion, deletion or substitution
+            for variant in get_deletes(token) | {token}:
+                for term in self._deletes.get(variant, ()):
+                    expansions.setdefault(term, TYPO_WEIGHT)
+
+        return expansions
+
+    def _score(self, term, hike_id, frequency):
+        document_count = len(self._hikes)
+        postings_count = len(self._postings[term])
+        idf = math.log(1 + (document_count - postings_count + 0.5) / (postings_count + 0.5))
+
+        average_length = self._total_length / document_count
+        norm = K1 * (1 - B + B * self._lengths[hike_id] / average_length)
+
+        return idf * frequency * (K1 + 1) / (frequency + norm)
+
+    def search(self, query):
+        """Return [(hike_id, score), ...] for hikes matching every query term, best first."""
+
+        tokens = get_query_terms(query)
+
+        if not tokens:
+            return []
+
+        with self._lock:
+            scores = None
+
+            for token in tokens:
+                token_scores = {}
+
+                for term, weight in self._expand(token).items():
+                    for hike_id, frequency in self._postings[term].items():
+                        score = weight * self._score(term, hike_id, frequency)
+                        if score > token_scores.get(hike_id, 0.0):
+                            token_scores[hike_id] = score
+
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {hike_id: score + token_scores[hike_id]
+                              for hike_id, score in scores.items() if hike_id in token_scores}
+
+                if not scores:
+                    return []
+
+            return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
@@ -1,9 +1,10 @@
 """Script to seed database."""
 
 import os
-import json
 
-from model import (connect_to_db, db, User, Pet, Hike, BookmarksList)
+from model import (connect_to_db, db, User, Pet, BookmarksList)
+from migrations import stamp
+from catalog_loader import load_catalog
 import server
 
 # Run dropdb and createdb to re-create database
@@ -14,83 +15,29 @@ os.system("createdb pupjourney")
 connect_to_db(server.app)
 db.create_all()
 
-# Load data from data/hikes.json and save it to a variable:
-with open("data/hikes.json") as f:
-    hike_data = json.loads(f.read())
+# create_all made the latest schema, so no migrations need to run on it
+with db.engine.connect() as connection:
+    stamp(connection)
 
-# Now, hike_data will be a list of dictionaries that look like this:
+# Load the hikes in data/hikes.json, a list of dictionaries that look like this:
 
-# [{"name": "Cedar Grove and Vista View Point in Griffith Park",
-#   "difficulty": "TBD",
-#   "leash_rule": "Hikers, dogs",
+# [{"hike_name": "Cedar Grove and Vista View Point in Griffith Park",
+#   "area": "Los Angeles Area - Griffith Park",
+#   "difficulty": "easy",
+#   "leash_rule": "On leash",
 #   "description": "This hike on the southeast side of Griffith Park follows paved and
 #                   unpaved trails to two park attractions, a quiet grove with a picnic
 #                   area and a helipad with panoramic views",
-#   "features": "",
+#   "latitude": "34.11865",
+#   "miles": "2.3",
 #   ...},
 #   ...
 #   ]
 
-
-# Create hikes, store them in list so we can use them
-hikes_in_db = []
-for hike in hike_data:
-    # unpack hike data
-    (
-        hike_name,
-        area,
-        difficulty,
-        leash_rule,
-        description,
-        address,
-        latitude,
-        longitude,
-        city,
-        state,
-        miles,
-        path,
-        parking,
-        resources,
-        hike_imgURL,
-    ) = (
-        hike["hike_name"],
-        hike["area"],
-        hike["difficulty"],
-        hike["leash_rule"],
-        hike["description"],
-        hike["address"],
-        hike["latitude"],
-        hike["longitude"],
-        hike["city"],
-        hike["state"],
-        hike["miles"],
-        hike["path"],
-        hike["parking"],
-        hike["resources"],
-        hike["hike_imgURL"],
-    )
-
-    # create hike variable with create_hike function from crud.py
-    db_hike = Hike.create_hike(
-        hike_name,
-        area,
-        difficulty,
-        leash_rule,
-        description,
-        address,
-        latitude,
-        longitude,
-        city,
-        state,
-        float(miles),
-        path,
-        parking,
-        resources,
-        hike_imgURL,
-    )
-
-    # append db_movie to hikes_in_db list
-    hikes_in_db.append(db_hike)
+# load_catalog also gives every hike an activity row so it's listed in
+# popularity pages
+with open("data/hikes.json") as f, db.engine.begin() as connection:
+    load_catalog(connection, f)
 
 test_user = User.create_user("Test User 1", "test@test", "test")
 test_pet1 = Pet.create_pet(test_user, "Test Pet1", "female", None, "Shiba Inu",
@@ -104,7 +51,6 @@ test_bookmarks_list = BookmarksList.create_bookmarks_list(
 )
 test_user2 = User.create_user("Test User 2", "test2@test2", "test2")
 
-db.session.add_all(hikes_in_db)
 db.session.add_all([test_user, test_user2, test_pet1, test_pet2, test_bookmarks_list])
 
 db.session.commit()
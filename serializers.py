@@ -0,0 +1,183 @@
+"""Compiled dump functions for marshmallow schemas on hot read paths.
+
+CompiledSchema(schema) compiles a schema instance (with its only/exclude
+already applied) into a dump() that builds the same dictionaries
+as schema.dump() for model objects, without marshmallow's per-field
+dispatch. Number, string, boolean and date fields are converted inline;
+nested schemas are compiled the first time they're dumped; any other
+field falls back to its own serialize().
+
+CompiledSchema.fields is the schema's projection spec: the attributes it
+reads, which queries can pass to model.get_load_options() to load only
+those columns.
+"""
+
+import re
+
+from marshmallow import fields, missing
+from marshmallow.utils import ensure_text_type
+from werkzeug.utils import cached_property
+
+from instrumentation import timed_serialization
+
+
+# Fields whose _serialize is a plain conversion of a non-None value
+NUMBER_FIELDS = (fields.Integer, fields.Float)
+DATE_FIELDS = (fields.DateTime, fields.Date)
+
+
+class LazyDump:
+    """Dump function for a nested schema, compiled on first use.
+
+    Schemas nest each other in cycles (e.g. check in -> pets -> check in),
+    so nested schemas are only compiled when there's data to dump.
+    """
+
+    def __init__(self, field):
+        self._field = field
+        self._dump = None
+
+    def __call__(self, obj):
+        if self._dump is None:
+            schema = self._field.schema
+            self._dump = compile_dump(schema)
+
+        return self._dump(obj)
+
+
+def get_converter(field):
+    """Return (expression, namespace) converting a non-None `value` like field._serialize.
+
+    Return None if the field must fall back to field.serialize().
+    """
+
+    field_type = type(field)
+
+    if field_type in NUMBER_FIELDS and not field.as_string:
+        return "num_type(value)", {"num_type": field.num_type}
+
+    if field_type is fields.String:
+        return "value if value.__class__ is str else ensure_text_type(value)", {
+            "ensure_text_type": ensure_text_type}
+
+    if field_type is fields.Boolean:
+        return "serialize(value, None, None)", {"serialize": field._serialize}
+
+    if field_type in DATE_FIELDS:
+        format_func = field.SERIALIZATION_FUNCS.get(field.format or field.DEFAULT_FORMAT)
+        if format_func is not None:
+            return "format_func(value)", {"format_func": format_func}
+
+    if field_type is fields.Nested:
+        many = field.many or field.schema.many
+        dump = LazyDump(field)
+        if many:
+            return "[dump(item) for item in value]", {"dump": dump}
+        return "dump(value)", {"dump": dump}
+
+    if (field_type is fields.List and type(field.inner) is fields.Nested
+            and not (field.inner.many or field.inner.schema.many)):
+        return "[None if item is None else dump(item) for item in value]", {
+            "dump": LazyDump(field.inner)}
+
+    return None
+
+
+def get_nested_schema(field):
+    """Return the schema a Nested or List(Nested) field dumps with, or None."""
+
+    if type(field) is fields.List:
+        field = field.inner
+
+    if isinstance(field, fields.Nested):
+        return field.schema
+
+    return None
+
+
+def get_field_names(schema, parents=()):
+    """Return the attributes a schema dumps, e.g. ("check_in_id", "hike.hike_name").
+
+    A nested schema's attributes are prefixed with its field's attribute.
+    A nested schema that's already being expanded (a cycle) is returned by
+    name only, meaning the whole related object.
+    """
+
+    field_names = []
+
+    for field_name, field in schema.dump_fields.items():
+        attribute = field.attribute or field_name
+        nested_schema = get_nested_schema(field)
+
+        if nested_schema is None or type(nested_schema) in parents:
+            field_names.append(attribute)
+            continue
+
+        nested_field_names = get_field_names(nested_schema, parents + (type(schema),))
+        field_names.extend(f"{attribute}.{name}" for name in nested_field_names)
+
+    return tuple(field_names)
+
+
+def compile_dump(schema):
+    """Return a function that dumps one object like schema.dump(obj, many=False)."""
+
+    if any(hooks for (tag, _), hooks in schema._hooks.items() if tag in ("pre_dump", "post_dump")):
+        raise ValueError(f"{type(schema).__name__} has pre/post dump hooks and can't be compiled")
+
+    namespace = {"MISSING": missing, "get_attribute": schema.get_attribute}
+    lines = ["def dump(obj):", "    data = {}"]
+
+    for i, (field_name, field) in enumerate(schema.dump_fields.items()):
+        key = field.data_key if field.data_key is not None else field_name
+        attribute = field.attribute or field_name
+        converter = get_converter(field)
+
+        if converter is None or "." in attribute or field.dump_default is not missing:
+            namespace[f"field_{i}"] = field
+            lines.append(f"    value = field_{i}.serialize({field_name!r}, obj, accessor=get_attribute)")
+            lines.append("    if value is not MISSING:")
+            lines.append(f"        data[{key!r}] = value")
+            continue
+
+        # Give each field's helpers their own names in the namespace
+        expression, converter_namespace = converter
+        for name, value in converter_namespace.items():
+            expression = re.sub(rf"\b{name}\b", f"{name}_{i}", expression)
+            namespace[f"{name}_{i}"] = value
+
+        lines.append(f"    value = getattr(obj, {attribute!r}, MISSING)")
+        lines.append("    if value is not MISSING:")
+        lines.append(f"        data[{key!r}] = None if value is None else {expression}")
+
+    lines.append("    return data")
+
+    exec("\n".join(lines), namespace)
+
+    return namespace["dump"]
+
+
+class CompiledSchema:
+    """Drop-in replacement for a schema instance's dump()."""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.many = schema.many
+        self._dump = compile_dump(schema)
+
+    @cached_property
+    def fields(self):
+        """The attributes dump() reads, e.g. ("check_in_id", "hike.hike_name")."""
+
+        return get_field_names(self.schema)
+
+    def dump(self, obj, *, many=None):
+        """Return obj serialized like self.schema.dump(obj, many=many)."""
+
+        many = self.many if many is None else many
+        dump = self._dump
+
+        with timed_serialization():
+            if many:
+                return [dump(item) for item in obj]
+            return dump(obj)
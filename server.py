@@ -1,118 +1,233 @@
 """Server for pup journey app."""
 
-from flask import Flask, render_template, jsonify, request, flash, session, redirect
+from flask import Flask, render_template, jsonify, request, flash, session, redirect, g
 from flask_sqlalchemy import SQLAlchemy
-import cloudinary.uploader
+import gc
+import hmac
+import math
 import os
 from datetime import datetime
 
-from model import (connect_to_db, db, User, CheckIn, Pet, HikeBookmarksList,
+from model import (connect_to_db, db, User, CheckIn, Pet, HikeBookmarksList, HikeActivity,
 PetCheckIn, Hike, BookmarksList, Comment)
+from catalog import CatalogCache
+from conditional import conditional, PUBLIC_REVALIDATE
+from facets import FacetIndex
+from search import SearchIndex, get_query_terms
+from suggest import SuggestIndex, DEFAULT_LIMIT, MAX_LIMIT
+from geo import GeoIndex
+from pagination import get_page_args, split_page
+from stats import get_check_in_stats, update_hiking_stats, delete_hiking_stats, get_hiking_stats
+from activity import get_sort_scope, update_hike_activity
+from instrumentation import Instrumentation
+from uploads import ImageUploader, CloudinaryClient, LocalImageClient
+from replica import ReplicaRouter, read_only
+from sessions import ServerSessions, MemorySessionStore, RedisSessionStore
+from lazy import LazyModule
 
 from jinja2 import StrictUndefined
-
-from flask_marshmallow import Marshmallow
-from marshmallow import fields
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 
 
 app = Flask(__name__)
 
-ma = Marshmallow(app)
+instrumentation = Instrumentation(app)
+replica_router = ReplicaRouter(app)
+
+# Imported on first use: building the schemas is slow, and scripts that
+# import server (e.g. seed_database.py) may never serialize anything
+schemas = LazyModule("schemas")
 
 
 app.secret_key = "dev"
 app.jinja_env.undefined = StrictUndefined
 
-CLOUDINARY_KEY = os.environ["CLOUDINARY_KEY"]
-CLOUDINARY_SECRET = os.environ["CLOUDINARY_SECRET"]
 CLOUD_NAME = "hbpupjourney"
-GOOGLE_KEY = os.environ["GOOGLE_KEY"]
 
+# Statement timeout for the web server's database sessions
+WEB_STATEMENT_TIMEOUT_MS = 10000
+
+# Settings read from environment variables of the same name. create_app()
+# checks the required ones are set.
+ENVIRONMENT_SETTINGS = ["DATABASE_URI", "SECRET_KEY", "GOOGLE_KEY", "IMAGE_STORAGE",
+                        "CLOUDINARY_KEY", "CLOUDINARY_SECRET", "SESSION_STORE", "SESSION_REDIS_URL",
+                        "METRICS_TOKEN"]
+
+app.config.update({name: os.environ.get(name, app.config.get(name))
+                   for name in ENVIRONMENT_SETTINGS})
+
+image_uploader = ImageUploader(app)
+server_sessions = ServerSessions(app)
+
+# Each request reads the change versions it needs afresh, once (see
+# conditional.get_change_versions); the app context can outlive a request
+app.before_request(lambda: g.pop("change_versions", None))
+
+
+def load_catalog_hikes():
+    """Return all hikes serialized for the catalog cache."""
+
+    hikes = Hike.get_hikes()
+
+    return schemas.hikes_serializer.dump(hikes)
+
+
+catalog_cache = CatalogCache(load_catalog_hikes)
+facet_index = FacetIndex()
+
+
+def get_facet_index():
+    """Return the facet index, synced with the current hike catalog."""
+
+    catalog = catalog_cache.get()
+    facet_index.sync(catalog)
+
+    return facet_index, catalog
+
+
+search_index = SearchIndex()
+
+
+def get_search_index():
+    """Return the search index, synced with the current hike catalog."""
+
+    catalog = catalog_cache.get()
+    search_index.sync(catalog)
+
+    return search_index, catalog
+
+
+suggest_index = SuggestIndex()
+
+
+def get_suggest_index():
+    """Return the suggest index, synced with the current hike catalog."""
+
+    suggest_index.sync(catalog_cache.get())
+
+    return suggest_index
+
+
+geo_index = GeoIndex()
+
+
+def get_geo_index():
+    """Return the geo index, synced with the current hike catalog."""
+
+    geo_index.sync(catalog_cache.get())
+
+    return geo_index
+
+
+def get_image_client(config):
+    """Return the client pet images are stored with.
+
+    IMAGE_STORAGE=local keeps them in static/uploads instead of Cloudinary.
+    """
+
+    if config["IMAGE_STORAGE"] == "local":
+        return LocalImageClient(os.path.join(app.static_folder, "uploads"), "/static/uploads")
+
+    return CloudinaryClient(CLOUD_NAME, config["CLOUDINARY_KEY"], config["CLOUDINARY_SECRET"])
+
+
+def get_session_store(config):
+    """Return the store sessions are kept in.
+
+    SESSION_STORE=memory keeps them in the process instead of Redis, for
+    development with one process.
+    """
+
+    if config["SESSION_STORE"] == "memory":
+        return MemorySessionStore()
+
+    return RedisSessionStore(config["SESSION_REDIS_URL"])
+
+
+def get_missing_settings(config):
+    """Return the names of required settings that aren't set."""
 
-class UserSchema(ma.SQLAlchemyAutoSchema):
-    """User Schema"""
-    class Meta:
-        model = User
-        load_instance = True
+    required = ["GOOGLE_KEY"]
+    if config["IMAGE_STORAGE"] != "local":
+        required += ["CLOUDINARY_KEY", "CLOUDINARY_SECRET"]
+    if config["SESSION_STORE"] != "memory":
+        required += ["SESSION_REDIS_URL"]
 
-    pets = fields.List(fields.Nested("PetSchema", exclude=("user",)))
-    bookmarks_lists = fields.List(fields.Nested("BookmarksListSchema", exclude=("user",)))
-    comments = fields.List(fields.Nested("CommentSchema", exclude=("user",)))
-    check_ins = fields.List(fields.Nested("CheckInSchema", exclude=("user",)))
+    return [name for name in required if not config[name]]
 
 
-class PetSchema(ma.SQLAlchemyAutoSchema):
-    """Pet Schema"""
-    class Meta:
-        model = Pet
-        include_fk = True
-        load_instance = True
+def create_app(config=None):
+    """Configure the app and connect it to its database, then return it.
 
-    check_ins = fields.Nested("PetCheckInSchema", many=True)
+    config is a mapping of settings (e.g. {"DATABASE_URI": ...}) that
+    take precedence over the environment. Raise RuntimeError if a
+    required setting is missing, before any request can fail on it.
+    """
+
+    app.config.update(config or {})
+
+    missing = get_missing_settings(app.config)
+    if missing:
+        raise RuntimeError(f"Missing settings: {', '.join(missing)} "
+                           "(set them as environment variables)")
 
+    # Scripts run without a statement timeout; web requests shouldn't hold
+    # a connection for long
+    app.config.setdefault("DATABASE_STATEMENT_TIMEOUT_MS", int(os.environ.get(
+        "DATABASE_STATEMENT_TIMEOUT_MS", WEB_STATEMENT_TIMEOUT_MS)))
 
-class HikeSchema(ma.SQLAlchemyAutoSchema):
-    """Hike Schema"""
-    class Meta:
-        model = Hike
-        load_instance = True
+    image_uploader.client = get_image_client(app.config)
+    server_sessions.store = get_session_store(app.config)
+    connect_to_db(app, app.config["DATABASE_URI"] or "postgresql:///pupjourney")
 
-    comments = fields.List(fields.Nested("CommentSchema", exclude=("hike", "user",)))
-    check_ins = fields.List(fields.Nested("CheckInSchema", exclude=("hike", "pets",)))
-    bookmarks_lists = fields.List(fields.Nested("BookmarksListSchema", exclude=("hikes",)))
+    return app
 
 
-class CommentSchema(ma.SQLAlchemyAutoSchema):
-    """Comment Schema"""
-    class Meta:
-        model = Comment
-        include_fk = True
-        load_instance = True
+def warm_caches():
+    """Load the hike catalog (importing the schemas) and build its indexes.
+
+    Run in a pre-forking server's master process, so workers start with
+    them and share their memory copy-on-write. The database connections
+    used are closed, so no worker inherits them.
+    """
 
-    hike = fields.Nested(HikeSchema(exclude=("check_ins", "comments", "bookmarks_lists",)))
-    user = fields.Nested(UserSchema(exclude=("pets", "check_ins", "comments", "bookmarks_lists",)))
+    with app.app_context():
+        get_facet_index()
+        get_search_index()
+        get_suggest_index()
+        get_geo_index()
 
+    db.session.remove()
+    db.engine.dispose()
 
-class CheckInSchema(ma.SQLAlchemyAutoSchema):
-    """Check In Schema"""
-    class Meta:
-        model = CheckIn
-        include_fk = True
-        load_instance = True
+    # Move everything loaded so far out of the garbage collector's reach,
+    # so collections in the workers don't write to (and copy) its pages
+    gc.freeze()
 
-    hike = fields.Nested(HikeSchema(exclude=("check_ins", "comments", "bookmarks_lists")))
-    user = fields.Nested(UserSchema(exclude=("pets", "check_ins", "comments", "bookmarks_lists",)))
-    pets = fields.Nested("PetCheckInSchema", many=True)
 
+def after_fork(resume_uploads=False):
+    """Set up a forked worker process. Pass resume_uploads in one worker only."""
 
-class PetCheckInSchema(ma.SQLAlchemyAutoSchema):
-    """Pet Check In Schema"""
-    class Meta:
-        model = PetCheckIn
-        include_fk = True
-        load_instance = True
+    image_uploader.after_fork()
 
-    check_in = fields.Nested(CheckInSchema)
+    if resume_uploads:
+        image_uploader.resume()
 
 
-class HikeBookmarksListSchema(ma.SQLAlchemyAutoSchema):
-    """Hike Bookmarks List Schema"""
-    class Meta:
-        model = HikeBookmarksList
-        include_fk = True
-        load_instance = True
+def search_catalog_hikes(search_term):
+    """Return the serialized hikes matching a search term, best match first.
 
-    hike = fields.Nested(HikeSchema(exclude=("check_ins", "comments", "bookmarks_lists",)))
+    An empty search term, or one of only stopwords (e.g. "the"), returns
+    every hike in catalog order.
+    """
 
+    index, catalog = get_search_index()
 
-class BookmarksListSchema(ma.SQLAlchemyAutoSchema):
-    """Bookmarks List Schema"""
-    class Meta:
-        model = BookmarksList
-        include_fk = True
-        load_instance = True
+    if not get_query_terms(search_term):
+        return catalog.hikes
 
-    hikes = fields.List(fields.Nested(HikeBookmarksListSchema))
+    return [catalog.hikes_by_id[hike_id] for hike_id, _ in index.search(search_term)]
 
 
 @app.route("/")
@@ -126,12 +241,10 @@ def homepage():
 def dashboard():
     """View dashboard."""
 
-    if "user_email" in session:
-        user = User.get_user_by_email(session["user_email"])
-
+    if g.user is not None:
         return render_template("dashboard.html",
-                                user=user,
-                                GOOGLE_KEY=GOOGLE_KEY)
+                                user=g.user,
+                                GOOGLE_KEY=app.config["GOOGLE_KEY"])
 
     flash("You must log in to view your dashboard.")
 
@@ -139,49 +252,186 @@ def dashboard():
 
 
 @app.route("/hikes")
+@read_only
 def all_hikes():
     """View all hikes."""
 
-    search_hikes = Hike.get_hikes()
+    search_hikes = catalog_cache.get().hikes
     user_id = session.get("user_id", None)
 
     return render_template("all_hikes.html", user_id=user_id, search_hikes=search_hikes)
 
 
 @app.route("/hikes/search", methods=["GET"])
+@read_only
 def search_box():
     """Search for hikes by search term"""
 
-    search_term = request.args.get("search_term")
-    search_hikes = Hike.get_hike_by_keyword(search_term)
+    search_term = request.args.get("search_term", "")
+    search_hikes = search_catalog_hikes(search_term)
     user_id = session.get("user_id", None)
 
     return render_template("all_hikes.html", user_id=user_id, search_hikes=search_hikes)
 
 
+@app.route("/hikes/search.json")
+@read_only
+@conditional("catalog", cache_control=PUBLIC_REVALIDATE)
+def search_json():
+    """Return hikes matching a search term, best match first.
+
+    Searches hike names, descriptions, areas and cities, matching words by
+    prefix and with up to one typo.
+    """
+
+    search_term = request.args.get("search_term", "")
+
+    return jsonify({"hikes": search_catalog_hikes(search_term)})
+
+
+@app.route("/hikes/suggest")
+@read_only
+@conditional("catalog", cache_control=PUBLIC_REVALIDATE)
+def suggest_hikes():
+    """Return hike name, area and city suggestions for a typed prefix"""
+
+    prefix = request.args.get("q", "")
+    limit = request.args.get("limit", DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    suggestions = get_suggest_index().suggest(prefix, limit)
+
+    return jsonify({"suggestions": suggestions})
+
+
+# Defaults and limits for /hikes/nearby and /hikes/in_bbox
+DEFAULT_RADIUS_MILES = 25
+MAX_RADIUS_MILES = 500
+DEFAULT_GEO_LIMIT = 50
+MAX_GEO_LIMIT = 300
+
+
+def get_geo_args(*names):
+    """Return the named query args as floats, or None if any is missing or invalid."""
+
+    try:
+        values = [float(request.args[name]) for name in names]
+    except (KeyError, ValueError):
+        return None
+
+    if any(math.isnan(value) or math.isinf(value) for value in values):
+        return None
+
+    return values
+
+
+def serialize_hikes_with_distance(results):
+    """Return the serialized hikes from [(distance, hike), ...] with their distance in miles."""
+
+    return [dict(hike, distance=round(distance, 2)) for distance, hike in results]
+
+
+@app.route("/hikes/nearby")
+@read_only
+@conditional("catalog", cache_control=PUBLIC_REVALIDATE)
+def get_nearby_hikes():
+    """Return hikes within radius miles of lat/lng, nearest first"""
+
+    coordinates = get_geo_args("lat", "lng")
+    if coordinates is None or not (-90 <= coordinates[0] <= 90 and -180 <= coordinates[1] <= 180):
+        return jsonify({"success": False, "error": "lat and lng are required"}), 400
+
+    lat, lng = coordinates
+    radius = request.args.get("radius", DEFAULT_RADIUS_MILES, type=float)
+    radius = max(0.0, min(radius, MAX_RADIUS_MILES))
+    limit = request.args.get("limit", DEFAULT_GEO_LIMIT, type=int)
+    limit = max(1, min(limit, MAX_GEO_LIMIT))
+
+    results = get_geo_index().nearby(lat, lng, radius, limit)
+
+    return jsonify({"hikes": serialize_hikes_with_distance(results)})
+
+
+@app.route("/hikes/in_bbox")
+@read_only
+@conditional("catalog", cache_control=PUBLIC_REVALIDATE)
+def get_hikes_in_bbox():
+    """Return hikes inside a map viewport, nearest its center first
+
+    Takes the viewport's south, west, north and east edges.
+    """
+
+    bounds = get_geo_args("south", "west", "north", "east")
+    if bounds is None:
+        return jsonify({"success": False, "error": "south, west, north and east are required"}), 400
+
+    south, west, north, east = bounds
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        return jsonify({"success": False, "error": "Invalid bounding box"}), 400
+
+    limit = request.args.get("limit", DEFAULT_GEO_LIMIT, type=int)
+    limit = max(1, min(limit, MAX_GEO_LIMIT))
+
+    results = get_geo_index().in_bbox(south, west, north, east, limit)
+
+    return jsonify({"hikes": serialize_hikes_with_distance(results)})
+
+
 @app.route("/hikes/advanced_search", methods=["GET"])
+@read_only
+@conditional("catalog", "hike_activity:{sort}", cache_control=PUBLIC_REVALIDATE)
 def advanced_search():
-    """Search for hikes"""
+    """Search for hikes
+
+    Hikes are ordered by how well they match the keyword, if any, else by
+    name. The sort arg orders them as in /all_hikes.json instead.
+    """
 
     keyword = request.args.get("keyword", "")
-    difficulties = request.args.getlist("difficulty")
-    leash_rules = request.args.getlist("leash_rule")
-    areas = request.args.getlist("area")
-    cities = request.args.getlist("city")
-    state = request.args.get("state", "")
+    sort = request.args.get("sort")
+    if sort is not None and sort not in HIKE_SORT_CURSORS:
+        return jsonify({"success": False, "error": "Invalid sort"}), 400
+
     length_min = request.args.get("length_min", "")
     length_max = request.args.get("length_max", "")
-    parking = request.args.getlist("parking")
-
-    # Populate the list of hike objects that fulfill the search criteria
-    search_hikes = Hike.get_hikes_by_advanced_search(
-        keyword, difficulties, leash_rules, areas,
-        cities, state, length_min, length_max, parking)
-
-    hikes_schema = HikeSchema(many=True, exclude=["comments", "check_ins", "bookmarks_lists"])
-    hikes_json = hikes_schema.dump(search_hikes)
+    filters = {
+        "difficulty": request.args.getlist("difficulty"),
+        "leash_rule": request.args.getlist("leash_rule"),
+        "area": request.args.getlist("area"),
+        "city": request.args.getlist("city"),
+        "state": [request.args.get("state")] if request.args.get("state") else [],
+        "parking": request.args.getlist("parking"),
+    }
+
+    try:
+        length_min = float(length_min) if length_min != "" else None
+        length_max = float(length_max) if length_max != "" else None
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid length"}), 400
+
+    # Rank the hikes matching the keyword, if any
+    ranked_hike_ids = None
+    if get_query_terms(keyword):
+        index, _ = get_search_index()
+        ranked_hike_ids = [hike_id for hike_id, _ in index.search(keyword)]
+
+    # Intersect the facet bitsets of hikes that fulfill the search criteria
+    index, catalog = get_facet_index()
+    search_hike_ids, facet_counts = index.search(filters, ranked_hike_ids, length_min, length_max)
+
+    if sort is not None and sort != "name":
+        matched = set(search_hike_ids)
+        hikes_json = [hike for hike in get_hikes_by_activity(catalog, sort)
+                      if hike["hike_id"] in matched]
+    elif ranked_hike_ids is not None and sort is None:
+        matched = set(search_hike_ids)
+        hikes_json = [catalog.hikes_by_id[hike_id] for hike_id in ranked_hike_ids
+                      if hike_id in matched]
+    else:
+        hikes_json = sorted((catalog.hikes_by_id[hike_id] for hike_id in search_hike_ids),
+                            key=lambda hike: hike["hike_name"])
 
-    return jsonify({"hikes": hikes_json})
+    return jsonify({"hikes": hikes_json, "facets": facet_counts})
 
 
 @app.route("/hikes/<hike_id>")
@@ -191,15 +441,14 @@ def show_hike(hike_id):
     hike = Hike.get_hike_by_id(hike_id)
     user_id = session.get("user_id", None)
 
-    return render_template("hike_details.html", user_id=user_id, hike=hike, GOOGLE_KEY=GOOGLE_KEY)
+    return render_template("hike_details.html", user_id=user_id, hike=hike, GOOGLE_KEY=app.config["GOOGLE_KEY"])
 
 
 @app.route("/edit-user", methods=["POST"])
 def edit_user():
     """Edit a user"""
 
-    logged_in_email = session.get("user_email")
-    user = User.get_user_by_email(logged_in_email)
+    user = g.user
 
     full_name = request.form.get("full_name")
     email = request.form.get("email")
@@ -217,7 +466,6 @@ def edit_user():
             )
         else:
             user.email = email
-            session["user_email"] = user.email
             flash("Email updated ✓")
 
     if password != "":
@@ -233,8 +481,7 @@ def edit_user():
 def add_pet():
     """Create a pet profile"""
 
-    logged_in_email = session.get("user_email")
-    user = User.get_user_by_email(logged_in_email)
+    user = g.user
 
     form_data = request.form.to_dict("formData")
     pet_name = form_data["petName"]
@@ -249,19 +496,6 @@ def add_pet():
         birthday = None
     if breed == "":
         breed = None
-    if my_file is None:
-        pet_img_url = None
-        img_public_id = None
-    else:
-        # save the uploaded file to Cloudinary by making an API request
-        result = cloudinary.uploader.upload(
-            my_file,
-            api_key=CLOUDINARY_KEY,
-            api_secret=CLOUDINARY_SECRET,
-            cloud_name=CLOUD_NAME,
-        )
-        pet_img_url = result["secure_url"]
-        img_public_id = result["public_id"]
 
     pet = Pet.create_pet(
         user,
@@ -269,14 +503,20 @@ def add_pet():
         gender,
         birthday,
         breed,
-        pet_img_url,
-        img_public_id,
+        None,
+        None,
         [],
     )
+    if my_file: # the image is uploaded to Cloudinary in the background
+        image_uploader.stage_pet_image(pet, my_file)
+
     db.session.add(pet)
     db.session.commit()
 
-    pet_schema = PetSchema()
+    if pet.img_status is not None:
+        image_uploader.upload_pet_image(pet)
+
+    pet_schema = schemas.PetSchema()
     pet_json = pet_schema.dump(pet)
 
     return jsonify({"success": True, "petAdded": pet_json})
@@ -301,29 +541,15 @@ def edit_pet(pet_id):
     if breed != "":
         pet.breed = breed
 
-    if my_file: # if user uploads new image file, delete old image from cloudinary
-    # then upload new image
-        img_public_id = pet.img_public_id
-        if img_public_id:
-            cloudinary.uploader.destroy(
-                img_public_id,
-                api_key=CLOUDINARY_KEY,
-                api_secret=CLOUDINARY_SECRET,
-                cloud_name=CLOUD_NAME,
-        )
-        # save the uploaded file to Cloudinary by making an API request
-        result = cloudinary.uploader.upload(
-            my_file,
-            api_key=CLOUDINARY_KEY,
-            api_secret=CLOUDINARY_SECRET,
-            cloud_name=CLOUD_NAME,
-        )
-
-        pet.pet_img_url = result["secure_url"]
-        pet.img_public_id = result["public_id"]
+    if my_file: # upload the new image in the background; the old image
+    # is deleted from Cloudinary once it's replaced
+        image_uploader.stage_pet_image(pet, my_file)
 
     db.session.commit()
 
+    if my_file:
+        image_uploader.upload_pet_image(pet)
+
     return jsonify({"success": True})
 
 
@@ -333,63 +559,127 @@ def delete_pet(pet_id):
 
     pet = Pet.get_pet_by_id(pet_id)
     img_public_id = pet.img_public_id
-    if img_public_id:
-        cloudinary.uploader.destroy(
-            img_public_id,
-            api_key=CLOUDINARY_KEY,
-            api_secret=CLOUDINARY_SECRET,
-            cloud_name=CLOUD_NAME,
-        )
 
+    # The pet's check ins stay on the user's stats
     pet.check_ins.clear()
+    delete_hiking_stats([f"pet:{pet.pet_id}"])
 
     db.session.delete(pet)
     db.session.commit()
 
+    # An upload still in progress destroys its own image when it finds
+    # the pet gone
+    if img_public_id:
+        image_uploader.destroy_image(img_public_id)
+
     return jsonify({"success": True})
 
 
-@app.route("/hikes/<hike_id>/add-check-in", methods=["POST"])
-def add_hike_check_in(hike_id):
-    """Add check in for a hike."""
+# Most check ins a single /add-check-ins request may create
+MAX_BULK_CHECK_INS = 1000
 
-    logged_in_email = session.get("user_email")
-    user = User.get_user_by_email(logged_in_email)
-    hike = Hike.get_hike_by_id(hike_id)
-    pets_checked = request.get_json().get("allPetOptions") # list of objects (select, pet_name, pet_id)
-    date_hiked = request.get_json().get("dateHiked")
-    miles_completed = request.get_json().get("milesCompleted")
-    total_time = request.get_json().get("totalTime")
-    notes = request.get_json().get("notes")
+ADDED_CHECK_IN_FIELDS = ["check_in_id",
+                         "date_hiked",
+                         "hike_id",
+                         "miles_completed",
+                         "notes",
+                         "pets",
+                         "total_time",
+                         "hike.hike_name",
+                         "hike.latitude",
+                         "hike.longitude"]
 
-    if total_time == "":
-        total_time = None
 
-    pets_to_check_in = []
-    pets_not_checked_in = []
+def get_selected_pet_ids(pet_options):
+    """Return the pet_ids of the selected pets.
 
-    for pet in pets_checked:
-        select, _, pet_id = pet
-        pet_obj = Pet.get_pet_by_id(pet[pet_id])
-        if pet[select] is True:
-            pets_to_check_in.append(pet_obj)
-        else:
-            pets_not_checked_in.append(pet_obj)
+    pet_options is a list of objects (select, pet_name, pet_id).
+    """
 
-    check_in = CheckIn.create_check_in(
-        user,
-        hike,
-        pets_to_check_in,
-        date_hiked,
-        miles_completed,
-        total_time,
-        notes
-    )
+    return [pet["pet_id"] for pet in pet_options if pet["select"]]
+
+
+def create_check_ins(user, check_ins_data):
+    """Create and return check ins for a user.
+
+    check_ins_data is a list of dictionaries with hike_id, pet_ids,
+    date_hiked, miles_completed, total_time and notes. The hikes and pets
+    of every check in are loaded with one query each, the check ins and
+    their pets_check_ins rows are inserted in a single flush, and the new
+    check ins are returned with their hike and pets loaded.
+
+    Raise ValueError if a hike doesn't exist or a pet isn't the user's.
+    """
 
-    db.session.add(check_in)
+    try:
+        for data in check_ins_data:
+            data["hike_id"] = int(data["hike_id"])
+            data["pet_ids"] = list(dict.fromkeys(int(pet_id) for pet_id in data["pet_ids"]))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid hike or pet id")
+
+    hike_ids = {data["hike_id"] for data in check_ins_data}
+    pet_ids = {pet_id for data in check_ins_data for pet_id in data["pet_ids"]}
+
+    hikes_by_id = Hike.get_hikes_by_ids(hike_ids)
+    pets_by_id = Pet.get_pets_by_ids_for_user_id(pet_ids, user.user_id)
+
+    if len(hikes_by_id) != len(hike_ids):
+        raise ValueError("Unknown hike")
+
+    if len(pets_by_id) != len(pet_ids):
+        raise ValueError("Unknown pet")
+
+    check_ins = []
+
+    for data in check_ins_data:
+        total_time = data["total_time"]
+        if total_time == "":
+            total_time = None
+
+        check_in = CheckIn.create_check_in(
+            user,
+            hikes_by_id[data["hike_id"]],
+            [pets_by_id[pet_id] for pet_id in data["pet_ids"]],
+            data["date_hiked"],
+            data["miles_completed"],
+            total_time,
+            data["notes"]
+        )
+        check_ins.append(check_in)
+
+    db.session.add_all(check_ins)
+    db.session.flush()
+    check_in_ids = [check_in.check_in_id for check_in in check_ins]
+    stats_added = get_check_in_stats(check_in_ids)
+    update_hiking_stats(added=stats_added)
+    update_hike_activity(check_ins_added=stats_added)
     db.session.commit()
 
-    check_in_schema = CheckInSchema()
+    # Reload in one go rather than refreshing each expired check in
+    return CheckIn.get_check_ins_with_hike_and_pets_by_ids(check_in_ids)
+
+
+@app.route("/hikes/<hike_id>/add-check-in", methods=["POST"])
+def add_hike_check_in(hike_id):
+    """Add check in for a hike."""
+
+    user = g.user
+    data = request.get_json()
+
+    try:
+        check_in, = create_check_ins(user, [{
+            "hike_id": hike_id,
+            "pet_ids": get_selected_pet_ids(data.get("allPetOptions")),
+            "date_hiked": data.get("dateHiked"),
+            "miles_completed": data.get("milesCompleted"),
+            "total_time": data.get("totalTime"),
+            "notes": data.get("notes"),
+        }])
+    except ValueError as error:
+        return jsonify({"success": False, "error": str(error)}), 400
+
+    check_in_schema = schemas.CheckInSchema()
     check_in_json = check_in_schema.dump(check_in)
 
     return jsonify({"checkInAdded": check_in_json})
@@ -399,58 +689,59 @@ def add_hike_check_in(hike_id):
 def add_check_in():
     """Add check in for a hike."""
 
-    logged_in_email = session.get("user_email")
-    user = User.get_user_by_email(logged_in_email)
-    hike_id = request.get_json().get("hikeId")
-    # pets_checked = list of objects [(select, pet_name, pet_id), ...]
-    pets_checked = request.get_json().get("allPetOptions")
-    date_hiked = request.get_json().get("dateHiked")
-    miles_completed = request.get_json().get("milesCompleted")
-    total_time = request.get_json().get("totalTime")
-    notes = request.get_json().get("notes")
+    user = g.user
+    data = request.get_json()
+
+    try:
+        check_in, = create_check_ins(user, [{
+            "hike_id": data.get("hikeId"),
+            # allPetOptions = list of objects [(select, pet_name, pet_id), ...]
+            "pet_ids": get_selected_pet_ids(data.get("allPetOptions")),
+            "date_hiked": data.get("dateHiked"),
+            "miles_completed": data.get("milesCompleted"),
+            "total_time": data.get("totalTime"),
+            "notes": data.get("notes"),
+        }])
+    except ValueError as error:
+        return jsonify({"success": False, "error": str(error)}), 400
+
+    check_in_schema = schemas.CheckInSchema(only=ADDED_CHECK_IN_FIELDS)
+    check_in_json = check_in_schema.dump(check_in)
 
-    hike = Hike.get_hike_by_id(hike_id)
+    return jsonify({"checkInAdded": check_in_json})
 
-    if total_time == "":
-        total_time = None
 
-    pets_to_check_in = []
-    pets_not_checked_in = []
+@app.route("/add-check-ins", methods=["POST"])
+def add_check_ins():
+    """Add many check ins at once, e.g. when importing from a GPS watch.
 
-    for pet in pets_checked:
-        select, _, pet_id = pet
-        pet_obj = Pet.get_pet_by_id(pet[pet_id])
-        if pet[select]:
-            pets_to_check_in.append(pet_obj)
-        else:
-            pets_not_checked_in.append(pet_obj)
+    Expects {"checkIns": [{hikeId, petIds, dateHiked, milesCompleted,
+    totalTime, notes}, ...]}. Either every check in is added or none are.
+    """
 
-    check_in = CheckIn.create_check_in(
-        user,
-        hike,
-        pets_to_check_in,
-        date_hiked,
-        miles_completed,
-        total_time,
-        notes
-    )
+    user = g.user
+    check_ins_json = request.get_json().get("checkIns") or []
 
-    db.session.add(check_in)
-    db.session.commit()
+    if len(check_ins_json) > MAX_BULK_CHECK_INS:
+        return jsonify({"success": False,
+                        "error": f"At most {MAX_BULK_CHECK_INS} check ins per request"}), 400
 
-    check_in_schema = CheckInSchema(only=["check_in_id",
-                                          "date_hiked",
-                                          "hike_id",
-                                          "miles_completed",
-                                          "notes",
-                                          "pets",
-                                          "total_time",
-                                          "hike.hike_name",
-                                          "hike.latitude",
-                                          "hike.longitude"])
-    check_in_json = check_in_schema.dump(check_in)
+    try:
+        check_ins = create_check_ins(user, [{
+            "hike_id": check_in_json.get("hikeId"),
+            "pet_ids": check_in_json.get("petIds") or [],
+            "date_hiked": check_in_json.get("dateHiked"),
+            "miles_completed": check_in_json.get("milesCompleted"),
+            "total_time": check_in_json.get("totalTime"),
+            "notes": check_in_json.get("notes"),
+        } for check_in_json in check_ins_json])
+    except ValueError as error:
+        return jsonify({"success": False, "error": str(error)}), 400
 
-    return jsonify({"checkInAdded": check_in_json})
+    check_in_schema = schemas.CheckInSchema(many=True, only=ADDED_CHECK_IN_FIELDS)
+    check_ins_json = check_in_schema.dump(check_ins)
+
+    return jsonify({"checkInsAdded": check_ins_json})
 
 
 @app.route("/edit-check-in/<check_in_id>", methods=["POST"])
@@ -458,6 +749,7 @@ def edit_check_in(check_in_id):
     """Edit a check in"""
 
     check_in = CheckIn.get_check_in_by_id(check_in_id)
+    stats_before = get_check_in_stats([check_in.check_in_id])
 
     pets_hike_status = request.get_json().get("petHikeStatus") # [{select: t/f, pet_name: <>, pet_id: <>}]
     date_hiked = request.get_json().get("dateHiked")
@@ -496,6 +788,10 @@ def edit_check_in(check_in_id):
         check_in.total_time = total_time
         check_in.notes = notes
 
+    db.session.flush()
+    stats_after = get_check_in_stats([check_in.check_in_id])
+    update_hiking_stats(removed=stats_before, added=stats_after)
+    update_hike_activity(check_ins_removed=stats_before, check_ins_added=stats_after)
     db.session.commit()
 
     return jsonify({"success": True})
@@ -506,9 +802,13 @@ def delete_check_in(check_in_id):
     """Delete a check-in"""
 
     check_in = CheckIn.get_check_in_by_id(check_in_id)
+    stats_before = get_check_in_stats([check_in.check_in_id])
     check_in.pets.clear()
 
     db.session.delete(check_in)
+    db.session.flush()
+    update_hiking_stats(removed=stats_before)
+    update_hike_activity(check_ins_removed=stats_before)
     db.session.commit()
 
     return jsonify({"success": True})
@@ -553,6 +853,7 @@ def delete_bookmarks_list(bookmarks_list_id):
     bookmarks_list = BookmarksList.get_bookmarks_list_by_id(
         bookmarks_list_id
     )
+    update_hike_activity(bookmarks_removed=[hike.hike_id for hike in bookmarks_list.hikes])
     bookmarks_list.hikes.clear()
 
     db.session.delete(bookmarks_list)
@@ -561,54 +862,100 @@ def delete_bookmarks_list(bookmarks_list_id):
     return jsonify({"success": True})
 
 
+def get_membership_changes(data, options_key, id_key, add_key, remove_key):
+    """Return the sets of ids to add and remove from a membership update.
+
+    data either has compact add/remove id lists under add_key and
+    remove_key, or the full list of options (select, <name>, <id_key>)
+    under options_key, where selected options are added and the rest removed.
+    """
+
+    if options_key in data:
+        options = data[options_key]
+        return ({int(option[id_key]) for option in options if option["select"]},
+                {int(option[id_key]) for option in options if not option["select"]})
+
+    return ({int(option_id) for option_id in data.get(add_key) or []},
+            {int(option_id) for option_id in data.get(remove_key) or []})
+
+
+def update_hikes_bookmarks_lists(user_id, pairs_to_add, pairs_to_remove):
+    """Check and apply (hike_id, bookmarks_list_id) membership changes.
+
+    Return an error response if a hike doesn't exist or a bookmarks list
+    isn't the user's, otherwise None.
+    """
+
+    bookmarks_list_ids = {bookmarks_list_id for _, bookmarks_list_id in pairs_to_add | pairs_to_remove}
+    hikes_by_id = catalog_cache.get().hikes_by_id
+
+    if BookmarksList.get_bookmarks_list_ids_for_user_id(bookmarks_list_ids, user_id) != bookmarks_list_ids:
+        return jsonify({"success": False, "error": "Unknown bookmarks list"}), 400
+
+    if any(hike_id not in hikes_by_id for hike_id, _ in pairs_to_add):
+        return jsonify({"success": False, "error": "Unknown hike"}), 400
+
+    added, removed = HikeBookmarksList.update_hikes_bookmarks_lists(user_id, pairs_to_add, pairs_to_remove)
+    update_hike_activity(bookmarks_removed=[hike_id for hike_id, _ in removed],
+                         bookmarks_added=[hike_id for hike_id, _ in added])
+    db.session.commit()
+
+    return None
+
+
 @app.route("/<bookmarks_list_id>/add-hikes", methods=["POST"])
 def add_hikes_to_existing_bookmarks_list(bookmarks_list_id):
-    """Add hikes to an existing bookmarks list"""
-
-    hikes = request.get_json().get("allHikesOptions") # list of Hike objects
-    bookmarks_list = BookmarksList.get_bookmarks_list_by_id(bookmarks_list_id)
-    bookmarks_list_hikes = bookmarks_list.hikes
-
-    for hike in hikes:
-        hike_obj = Hike.get_hike_by_id(hike["hike_id"])
-        if hike["select"] and hike_obj not in bookmarks_list_hikes:
-            # if selected and no relationship, create relationship
-            hike_bookmark = HikeBookmarksList.create_hike_bookmarks_list(hike["hike_id"], bookmarks_list_id)
-            db.session.add(hike_bookmark)
-        elif not hike["select"] and hike_obj in bookmarks_list_hikes:
-            # if unselected and there's a relationship, delete relationship
-            hike_bookmarks = HikeBookmarksList.get_hike_bookmarks_list_by_hike_id_bookmarks_list_id(hike["hike_id"], bookmarks_list_id)
-            for hike_bookmark in hike_bookmarks:
-                db.session.delete(hike_bookmark)
+    """Add hikes to an existing bookmarks list
 
-    db.session.commit()
+    Expects {"addHikeIds": [...], "removeHikeIds": [...]} or the full
+    {"allHikesOptions": [(select, hike_name, hike_id), ...]}.
+    """
 
-    return jsonify({"success": True})
+    user_id = session.get("user_id")
+    bookmarks_list_id = int(bookmarks_list_id)
+
+    try:
+        add_hike_ids, remove_hike_ids = get_membership_changes(
+            request.get_json(), "allHikesOptions", "hike_id", "addHikeIds", "removeHikeIds"
+        )
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Invalid hike id"}), 400
+
+    error = update_hikes_bookmarks_lists(
+        user_id,
+        {(hike_id, bookmarks_list_id) for hike_id in add_hike_ids},
+        {(hike_id, bookmarks_list_id) for hike_id in remove_hike_ids}
+    )
+
+    return error or jsonify({"success": True})
 
 
 @app.route("/hikes/<hike_id>/add-hike-to-existing-list", methods=["POST"])
 def add_hike_to_existing_bookmarks_list(hike_id):
-    """Add hike to an existing bookmarks list"""
+    """Add hike to an existing bookmarks list
 
-    hike = Hike.get_hike_by_id(hike_id)
-    bookmarks_list_options = request.get_json().get("allBookmarksListOptions") # list of Bookmarks List objects
-
-    for bookmarks_list in bookmarks_list_options:
-        bookmarks_list_obj = BookmarksList.get_bookmarks_list_by_id(bookmarks_list["bookmarks_list_id"])
-        bookmarks_list_hikes = bookmarks_list_obj.hikes
-        if bookmarks_list["select"] and hike not in bookmarks_list_hikes:
-            # if selected, check if there's already a relationship, else add relationship
-            hike_bookmark = HikeBookmarksList.create_hike_bookmarks_list(hike_id, bookmarks_list["bookmarks_list_id"])
-            db.session.add(hike_bookmark)
-        elif not bookmarks_list["select"] and hike in bookmarks_list_hikes:
-            # if unselected and there's a relationship, delete relationship
-            hike_bookmarks = HikeBookmarksList.get_hike_bookmarks_list_by_hike_id_bookmarks_list_id(hike_id, bookmarks_list["bookmarks_list_id"])
-            for hike_bookmark in hike_bookmarks:
-                db.session.delete(hike_bookmark)
+    Expects {"addBookmarksListIds": [...], "removeBookmarksListIds": [...]} or the full
+    {"allBookmarksListOptions": [(select, bookmarks_list_name, bookmarks_list_id), ...]}.
+    """
 
-    db.session.commit()
+    user_id = session.get("user_id")
+    hike_id = int(hike_id)
 
-    return jsonify({"success": True})
+    try:
+        add_bookmarks_list_ids, remove_bookmarks_list_ids = get_membership_changes(
+            request.get_json(), "allBookmarksListOptions", "bookmarks_list_id",
+            "addBookmarksListIds", "removeBookmarksListIds"
+        )
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Invalid bookmarks list id"}), 400
+
+    error = update_hikes_bookmarks_lists(
+        user_id,
+        {(hike_id, bookmarks_list_id) for bookmarks_list_id in add_bookmarks_list_ids},
+        {(hike_id, bookmarks_list_id) for bookmarks_list_id in remove_bookmarks_list_ids}
+    )
+
+    return error or jsonify({"success": True})
 
 
 @app.route("/hikes/<hike_id>/add-hike-to-new-list", methods=["POST"])
@@ -623,6 +970,8 @@ def add_hike_to_new_bookmarks_list(hike_id):
         bookmarks_list_name, user_id, hikes)
 
     db.session.add(hike_bookmark)
+    db.session.flush()
+    update_hike_activity(bookmarks_added=[hike.hike_id for hike in hikes])
     db.session.commit()
 
     return jsonify({"success": True})
@@ -638,6 +987,8 @@ def remove_hike(bookmarks_list_id, hike_id):
 
     for hikes_bookmarks_list in hikes_bookmarks_lists:
         db.session.delete(hikes_bookmarks_list)
+    update_hike_activity(bookmarks_removed=[hikes_bookmarks_list.hike_id
+                                            for hikes_bookmarks_list in hikes_bookmarks_lists])
     db.session.commit()
 
     return jsonify({"success": True})
@@ -647,8 +998,7 @@ def remove_hike(bookmarks_list_id, hike_id):
 def add_comment():
     """Add a comment for a hike"""
 
-    logged_in_email = session.get("user_email")
-    user = User.get_user_by_email(logged_in_email)
+    user = g.user
     hike_id = request.get_json().get("hikeId")
     hike = Hike.get_hike_by_id(hike_id)
     comment_body = request.get_json().get("commentBody")
@@ -656,9 +1006,11 @@ def add_comment():
     comment = Comment.create_comment(
         user, hike, comment_body, date_created=datetime.now(), edit=False, date_edited=None)
     db.session.add(comment)
+    db.session.flush()
+    update_hike_activity(comments_added=[comment])
     db.session.commit()
 
-    comment_schema = CommentSchema()
+    comment_schema = schemas.CommentSchema()
     comment_json = comment_schema.dump(comment)
 
     return jsonify({"commentAdded": comment_json, "login": True})
@@ -685,6 +1037,8 @@ def delete_comment(comment_id):
     comment = Comment.get_comment_by_comment_id(comment_id)
 
     db.session.delete(comment)
+    db.session.flush()
+    update_hike_activity(comments_removed=[comment])
     db.session.commit()
 
     return jsonify({"success": True})
@@ -721,10 +1075,12 @@ def process_login():
     if not user or user.password != password:
         flash("The email or password is incorrect.")
     else:
-        # Log in user by storing the user's email in session
-        session["user_email"] = user.email
+        # Log in user by storing the user's id in a new session
+        session.regenerate()
         session["user_id"] = user.user_id
         session["login"] = True
+        g.user = user
+        server_sessions.cache_user(user)
         flash(f"Welcome back, {user.full_name}!")
 
     return redirect(request.referrer)
@@ -738,37 +1094,170 @@ def process_logout():
     """
 
     session.clear()
+    session.regenerate()
 
     flash("Successfully logged out!")
     return redirect(request.referrer)
 
 
+# Parsers for the sort key values in each list's page cursors
+HIKE_CURSOR = [str, int]
+COMMENT_CURSOR = [datetime.fromisoformat, int]
+CHECK_IN_CURSOR = [lambda date_hiked: datetime.fromisoformat(date_hiked).date(), int]
+
+# Sort options for hike listings, with the parsers for their page cursors
+HIKE_SORT_CURSORS = {"name": HIKE_CURSOR,
+                     "check_ins": [int, int],
+                     "comments": [int, int],
+                     "bookmarks": [int, int],
+                     "trending": [float, int]}
+
+
+def get_hikes_by_activity(catalog, sort):
+    """Return the catalog's hikes ordered by a hike activity sort option, most active first.
+
+    Hikes that don't have an activity row yet come last, ordered by name.
+    """
+
+    hike_ids = HikeActivity.get_hike_ids(sort)
+    hikes_json = [catalog.hikes_by_id[hike_id] for hike_id in hike_ids
+                  if hike_id in catalog.hikes_by_id]
+
+    if len(hikes_json) < len(catalog.hikes):
+        ranked_hike_ids = set(hike_ids)
+        hikes_json.extend(hike for hike in catalog.hikes if hike["hike_id"] not in ranked_hike_ids)
+
+    return hikes_json
+
+
+def serialize_comments(comments):
+    """Return comments serialized as in /user_comments.json."""
+
+    return schemas.comments_serializer.dump(comments)
+
+
+def serialize_user_check_ins(check_ins):
+    """Return check ins serialized as in /user_check_ins.json."""
+
+    check_ins_json = schemas.user_check_ins_serializer.dump(check_ins)
+
+    for idx, check_in in enumerate(check_ins):
+        pets_json = schemas.pets_serializer.dump(sorted(check_in.pets, key=lambda x: x.pet_name.lower()))
+        check_ins_json[idx]["pets"] = pets_json
+
+    return check_ins_json
+
+
+def serialize_pet_profiles(pets, stats_by_subject):
+    """Return pets serialized as in /pets.json.
+
+    stats_by_subject is a dictionary of subject -> stats JSON from
+    get_hiking_stats() that includes each pet.
+    """
+
+    pets_json = schemas.pets_serializer.dump(pets)
+
+    for idx, pet in enumerate(pets):
+        pets_json[idx]["stats"] = stats_by_subject[f"pet:{pet.pet_id}"]
+
+    return pets_json
+
+
+def serialize_check_ins_by_pets(pets, check_ins_by_pet):
+    """Return each pet's check ins serialized as in /check-ins-by-pets.json.
+
+    check_ins_by_pet is a dictionary of pet_id -> list of check ins, most
+    recent first.
+    """
+
+    # Formatted for graph component data:
+        # {"pet_id": <pet_id>,
+        #  "pet_name": <pet_name>,
+        #  "data": [
+        #       {"date_hiked": <date_hiked>, "miles_completed": <miles_completed>},
+        #       ...
+        #   ]}
+
+    check_in_data = []
+
+    for pet in pets:
+        pet_json = schemas.pet_names_serializer.dump(pet)
+        pet_json["data"] = schemas.check_in_graph_serializer.dump(check_ins_by_pet.get(pet.pet_id, []))
+        check_in_data.append(pet_json)
+
+    return check_in_data
+
+
+def serialize_user_bookmarks_lists(bookmarks_lists):
+    """Return bookmarks lists serialized as in /user_bookmarks_lists.json."""
+
+    bookmarks_json = schemas.bookmarks_lists_serializer.dump(bookmarks_lists)
+
+    for idx, bookmark in enumerate(bookmarks_lists):
+        sorted_hikes = sorted(bookmark.hikes, key=lambda x: (x.hike_name, x.difficulty))
+        bookmarks_json[idx]["hikes"] = schemas.hikes_serializer.dump(sorted_hikes)
+
+    return bookmarks_json
+
+
 @app.route("/hikes/<hike_id>/comments.json")
+@conditional("hike:{hike_id}", "users", "catalog", cache_control=PUBLIC_REVALIDATE)
 def get_hike_comments_json(hike_id):
-    """Return a JSON response for a hike's comments."""
+    """Return a JSON response for a hike's comments.
+
+    Pass limit and/or cursor to get one page, newest first, with the
+    cursor for the next page in nextCursor.
+    """
+
+    try:
+        page_args = get_page_args(request.args, COMMENT_CURSOR)
+    except ValueError as error:
+        return jsonify({"success": False, "error": str(error)}), 400
+
+    if page_args is None:
+        comments = Comment.get_comment_by_hike_id(hike_id)
 
-    comments = Comment.get_comment_by_hike_id(hike_id)
+        return jsonify({"comments": serialize_comments(comments)})
 
-    comments_schema = CommentSchema(many=True)
-    comments_json = comments_schema.dump(comments)
+    limit, after = page_args
+    comments = Comment.get_comments_page_by_hike_id(hike_id, limit, after)
+    comments, next_cursor = split_page(comments, limit,
+                                       lambda comment: (comment.date_created, comment.comment_id))
 
-    return jsonify({"comments": comments_json})
+    return jsonify({"comments": serialize_comments(comments), "nextCursor": next_cursor})
 
 
 @app.route("/user_comments.json")
+@conditional("user:{user_id}", "users", "catalog")
 def get_user_comments_json():
-    """Return a JSON response for all user's comments."""
+    """Return a JSON response for all user's comments.
+
+    Pass limit and/or cursor to get one page, newest first, with the
+    cursor for the next page in nextCursor.
+    """
 
     user_id = session.get("user_id")
-    comments = Comment.get_comment_by_user_id(user_id)
 
-    comments_schema = CommentSchema(many=True)
-    comments_json = comments_schema.dump(comments)
+    try:
+        page_args = get_page_args(request.args, COMMENT_CURSOR)
+    except ValueError as error:
+        return jsonify({"success": False, "error": str(error)}), 400
 
-    return jsonify({"comments": comments_json})
+    if page_args is None:
+        comments = Comment.get_comment_by_user_id(user_id)
+
+        return jsonify({"comments": serialize_comments(comments)})
+
+    limit, after = page_args
+    comments = Comment.get_comments_page_by_user_id(user_id, limit, after)
+    comments, next_cursor = split_page(comments, limit,
+                                       lambda comment: (comment.date_created, comment.comment_id))
+
+    return jsonify({"comments": serialize_comments(comments), "nextCursor": next_cursor})
 
 
 @app.route("/check_in/<check_in_id>.json")
+@conditional("user:{user_id}", "catalog")
 def get_check_in_json(check_in_id):
     """Return a JSON response for a check in."""
 
@@ -776,15 +1265,14 @@ def get_check_in_json(check_in_id):
     check_in = CheckIn.get_check_in_by_id(check_in_id)
     pets = Pet.get_pets_by_user_id(user_id)
 
-    check_in_schema = CheckInSchema()
-    pet_schema = PetSchema(only=["pet_id","pet_name"])
+    check_in_schema = schemas.CheckInSchema()
 
     check_in_json = check_in_schema.dump(check_in)
     check_in_json["pets_not_on_hike"] = []
     check_in_json["pets"] = []
 
     for pet in pets:
-        pet_json = pet_schema.dump(pet)
+        pet_json = schemas.pet_names_serializer.dump(pet)
         if pet not in check_in.pets:
             check_in_json["pets_not_on_hike"].append(pet_json)
         else:
@@ -794,63 +1282,83 @@ def get_check_in_json(check_in_id):
 
 
 @app.route("/hikes/<hike_id>/user_check_ins.json")
+@conditional("user:{user_id}", "catalog")
 def get_hike_check_ins_json(hike_id):
     """Return a JSON response for a hike's check ins."""
     user_id = session.get("user_id")
 
     check_ins = CheckIn.get_check_ins_by_param(("user_id", user_id), ("hike_id", hike_id))
 
-    check_ins_schema = CheckInSchema(many=True)
-    check_ins_json = check_ins_schema.dump(check_ins)
+    check_ins_json = schemas.check_ins_serializer.dump(check_ins)
 
-    pets_schema = PetSchema(many=True, exclude=["check_ins"])
-    
     for idx, check_in in enumerate(check_ins):
-        pets_json = pets_schema.dump(sorted(check_in.pets, key=lambda x: x.pet_name.lower()))
+        pets_json = schemas.pets_serializer.dump(sorted(check_in.pets, key=lambda x: x.pet_name.lower()))
         check_ins_json[idx]["pets"] = pets_json
 
     return jsonify({"checkIns": check_ins_json})
 
 
 @app.route("/user_check_ins.json")
+@conditional("user:{user_id}", "catalog")
 def get_user_check_ins_json():
-    """Return a JSON response for a user's check ins."""
+    """Return a JSON response for a user's check ins.
+
+    Pass limit and/or cursor to get one page, most recent first, with the
+    cursor for the next page in nextCursor.
+    """
     user_id = session.get("user_id")
-    check_ins = CheckIn.get_check_ins_by_param(("user_id", user_id))
 
-    check_ins_schema = CheckInSchema(many=True, only=["check_in_id","date_hiked",\
-        "hike_id","miles_completed","notes","pets","total_time","hike.hike_name",\
-        "hike.latitude","hike.longitude"])
-    check_ins_json = check_ins_schema.dump(check_ins)
-    pets_schema = PetSchema(many=True, exclude=["check_ins"])
+    try:
+        page_args = get_page_args(request.args, CHECK_IN_CURSOR)
+    except ValueError as error:
+        return jsonify({"success": False, "error": str(error)}), 400
 
-    for idx, check_in in enumerate(check_ins):
-        pets_json = pets_schema.dump(sorted(check_in.pets, key=lambda x: x.pet_name.lower()))
-        check_ins_json[idx]["pets"] = pets_json
+    if page_args is None:
+        check_ins = CheckIn.get_check_ins_by_param(("user_id", user_id),
+                                                   fields=schemas.USER_CHECK_IN_PROJECTION)
 
-    return jsonify({"checkIns": check_ins_json})
+        return jsonify({"checkIns": serialize_user_check_ins(check_ins)})
+
+    limit, after = page_args
+    check_ins = CheckIn.get_check_ins_page_by_user_id(user_id, limit, after,
+                                                      fields=schemas.USER_CHECK_IN_PROJECTION)
+    check_ins, next_cursor = split_page(check_ins, limit,
+                                        lambda check_in: (check_in.date_hiked, check_in.check_in_id))
+
+    return jsonify({"checkIns": serialize_user_check_ins(check_ins), "nextCursor": next_cursor})
 
 
 @app.route("/pets.json")
+@conditional("user:{user_id}")
 def get_pets_json():
     """Return a JSON response with all pets given user."""
 
     user_id = session.get("user_id")
     pets = Pet.get_pets_by_user_id(user_id)
+    stats_by_subject = get_hiking_stats([f"pet:{pet.pet_id}" for pet in pets])
 
-    pets_schema = PetSchema(many=True)
-    pets_json = pets_schema.dump(pets)
+    return jsonify({"petProfiles": serialize_pet_profiles(pets, stats_by_subject)})
 
-    check_ins_schema = CheckInSchema(many=True, only=["miles_completed"])
 
-    for idx, pet in enumerate(pets):
-        check_ins_json = check_ins_schema.dump(pet.check_ins)
-        pets_json[idx]["check_ins"] = check_ins_json
+@app.route("/stats.json")
+@conditional("user:{user_id}")
+def get_stats_json():
+    """Return a JSON response with the hiking stats of the user and each of their pets."""
+
+    user_id = session.get("user_id")
+    pets = Pet.get_pets_by_user_id(user_id)
 
-    return jsonify({"petProfiles": pets_json})
+    user_subject = f"user:{user_id}"
+    stats_by_subject = get_hiking_stats([user_subject] + [f"pet:{pet.pet_id}" for pet in pets])
+
+    return jsonify({"userStats": stats_by_subject[user_subject],
+                    "petStats": [dict(stats_by_subject[f"pet:{pet.pet_id}"],
+                                      pet_id=pet.pet_id, pet_name=pet.pet_name)
+                                 for pet in pets]})
 
 
 @app.route("/check-ins-by-pets.json")
+@conditional("user:{user_id}")
 def get_check_ins_by_pets_json():
     """Return a JSON response with all check ins for each pet."""
 
@@ -862,32 +1370,59 @@ def get_check_ins_by_pets_json():
         #       ...
         #   ]}
 
-    pet_schema = PetSchema(only=["pet_id", "pet_name"])
-    check_ins_schema = CheckInSchema(many=True, only=["date_hiked", "miles_completed"])
+    user_id = session.get("user_id")
+    pets = Pet.get_pets_by_user_id(user_id)
+
+    check_ins_by_pet = Pet.get_check_ins_by_pet_for_user_id(
+        user_id, fields=schemas.check_in_graph_serializer.fields)
+
+    return jsonify({"petCheckIns": serialize_check_ins_by_pets(pets, check_ins_by_pet)})
+
+
+@app.route("/dashboard/bootstrap.json")
+@conditional("user:{user_id}", "users", "catalog")
+def get_dashboard_bootstrap_json():
+    """Return a JSON response with everything the dashboard needs.
+
+    Replaces the dashboard's separate fetches of /user_check_ins.json,
+    /check-ins-by-pets.json, /user_bookmarks_lists.json, /user_comments.json
+    and /pets.json with a fixed number of queries.
+    """
 
     user_id = session.get("user_id")
+
+    check_ins = CheckIn.get_check_ins_with_hike_and_pets_by_user_id(
+        user_id, fields=schemas.USER_CHECK_IN_PROJECTION)
     pets = Pet.get_pets_by_user_id(user_id)
+    bookmarks_lists = BookmarksList.get_bookmarks_lists_with_hikes_by_user_id(user_id)
+    comments = Comment.get_comments_with_hike_and_user_by_user_id(user_id)
 
-    check_in_data = []
+    stats_by_subject = get_hiking_stats([f"user:{user_id}"] + [f"pet:{pet.pet_id}" for pet in pets])
 
-    for pet in pets:
-        pet_json = pet_schema.dump(pet)
-        check_ins = Pet.get_check_ins_by_pet_id(pet.pet_id)
-        pet_json["data"] = check_ins_schema.dump(check_ins)
-        check_in_data.append(pet_json)
+    # check_ins is already ordered by most recent, so each pet's list is too
+    check_ins_by_pet = {}
+    for check_in in check_ins:
+        for pet in check_in.pets:
+            check_ins_by_pet.setdefault(pet.pet_id, []).append(check_in)
 
-    return jsonify({"petCheckIns": check_in_data})
+    return jsonify({"checkIns": serialize_user_check_ins(check_ins),
+                    "petCheckIns": serialize_check_ins_by_pets(pets, check_ins_by_pet),
+                    "bookmarksLists": serialize_user_bookmarks_lists(bookmarks_lists),
+                    "comments": serialize_comments(comments),
+                    "petProfiles": serialize_pet_profiles(pets, stats_by_subject),
+                    "userStats": stats_by_subject[f"user:{user_id}"]})
 
 
 @app.route("/<bookmarks_list_id>/hikes.json")
+@conditional("bookmarks_list:{bookmarks_list_id}", "catalog")
 def get_bookmarks_hikes_json(bookmarks_list_id):
     """Return a JSON response for a bookmarks list's hikes."""
 
     hikes_by_bookmark = BookmarksList.get_bookmarks_list_by_id(bookmarks_list_id)
-    bookmark_schema = BookmarksListSchema()
+    bookmark_schema = schemas.BookmarksListSchema()
     bookmark_json = bookmark_schema.dump(hikes_by_bookmark)
 
-    hikes_schema = HikeSchema(many=True, exclude=["comments", "check_ins", "bookmarks_lists"])
+    hikes_schema = schemas.HikeSchema(many=True, exclude=["comments", "check_ins", "bookmarks_lists"])
     hikes_json = hikes_schema.dump(sorted(hikes_by_bookmark.hikes, key=lambda x: x.hike_name))
 
     bookmark_json["hikes"] = hikes_json
@@ -896,6 +1431,7 @@ def get_bookmarks_hikes_json(bookmarks_list_id):
 
 
 @app.route("/hikes/<hike_id>/bookmarks.json")
+@conditional("user:{user_id}", "catalog")
 def get_hike_bookmarks_json(hike_id):
     """Return a JSON response for a hike's bookmarks."""
 
@@ -903,10 +1439,10 @@ def get_hike_bookmarks_json(hike_id):
 
     bookmarks_by_hike = BookmarksList.get_bookmarks_lists_by_user_id_and_hike_id(user_id, hike_id)
 
-    bookmarks_schema = BookmarksListSchema(many=True)
+    bookmarks_schema = schemas.BookmarksListSchema(many=True)
     bookmarks_json = bookmarks_schema.dump(bookmarks_by_hike)
 
-    hikes_schema = HikeSchema(many=True, exclude=["comments", "check_ins", "bookmarks_lists"])
+    hikes_schema = schemas.HikeSchema(many=True, exclude=["comments", "check_ins", "bookmarks_lists"])
 
     for idx, bookmark in enumerate(bookmarks_by_hike):
         hikes_json = hikes_schema.dump(sorted(bookmark.hikes, key=lambda x: x.hike_name))
@@ -916,71 +1452,138 @@ def get_hike_bookmarks_json(hike_id):
 
 
 @app.route("/user_bookmarks_lists.json")
+@conditional("user:{user_id}", "catalog")
 def get_user_bookmarks_lists():
     """Return a JSON response with all bookmarks lists for a user."""
 
     user_id = session.get("user_id")
     bookmarks_by_user = BookmarksList.get_bookmarks_lists_by_user_id(user_id)
 
-    bookmarks_schema = BookmarksListSchema(many=True)
-    bookmarks_json = bookmarks_schema.dump(bookmarks_by_user)
-
-    hikes_schema = HikeSchema(many=True, exclude=["comments", "check_ins", "bookmarks_lists"])
-
-    for idx, bookmark in enumerate(bookmarks_by_user):
-        sorted_hikes = sorted(bookmark.hikes, key=lambda x: (x.hike_name, x.difficulty))
-        hikes_json = hikes_schema.dump(sorted_hikes)
-        bookmarks_json[idx]["hikes"] = hikes_json
-
-    return jsonify({"bookmarksLists": bookmarks_json})
+    return jsonify({"bookmarksLists": serialize_user_bookmarks_lists(bookmarks_by_user)})
 
 
 @app.route("/hikes/<hike_id>.json")
+@read_only
+@conditional("catalog", cache_control=PUBLIC_REVALIDATE)
 def get_hike(hike_id):
     """Return a JSON response for a hike"""
 
-    # Populate the list of hike objects that fulfill the search criteria
+    hike_json = catalog_cache.get().hikes_by_id.get(int(hike_id)) if hike_id.isdigit() else None
+    if hike_json is not None:
+        return jsonify({"hike": hike_json})
+
     hike = Hike.get_hike_by_id(hike_id)
 
-    hike_schema = HikeSchema(exclude=["comments", "check_ins", "bookmarks_lists"])
+    hike_schema = schemas.HikeSchema(exclude=["comments", "check_ins", "bookmarks_lists"])
     hike_json = hike_schema.dump(hike)
 
     return jsonify({"hike": hike_json})
 
 
 @app.route("/all_hikes.json")
+@read_only
+@conditional("catalog", "hike_activity:{sort}", cache_control=PUBLIC_REVALIDATE)
 def get_all_hikes():
-    """Return a JSON response for all hikes"""
+    """Return a JSON response for all hikes
 
-    hikes = Hike.get_hikes()
+    Hikes are ordered by name, or by the sort arg: check_ins, comments,
+    bookmarks or trending, most active first. Pass limit and/or cursor to
+    get one page, with the cursor for the next page in nextCursor.
+    """
+
+    sort = request.args.get("sort", "name")
+    if sort not in HIKE_SORT_CURSORS:
+        return jsonify({"success": False, "error": "Invalid sort"}), 400
+
+    try:
+        page_args = get_page_args(request.args, HIKE_SORT_CURSORS[sort])
+    except ValueError as error:
+        return jsonify({"success": False, "error": str(error)}), 400
+
+    catalog = catalog_cache.get()
+
+    if page_args is None:
+        if sort == "name":
+            return app.response_class(catalog.body, mimetype=app.config["JSONIFY_MIMETYPE"])
+        return jsonify({"hikes": get_hikes_by_activity(catalog, sort)})
+
+    limit, after = page_args
+    if sort == "name":
+        rows = Hike.get_hike_ids_page(limit, after)
+    else:
+        rows = HikeActivity.get_hike_ids_page(sort, limit, after)
+    rows, next_cursor = split_page(rows, limit, tuple)
 
-    hikes_schema = HikeSchema(many=True, exclude=["comments", "check_ins", "bookmarks_lists"])
-    hikes_json = hikes_schema.dump(hikes)
+    hikes_json = [catalog.hikes_by_id[hike_id] for _, hike_id in rows
+                  if hike_id in catalog.hikes_by_id]
 
-    return jsonify({"hikes": hikes_json})
+    return jsonify({"hikes": hikes_json, "nextCursor": next_cursor})
 
 
 @app.route("/<state>/city_area.json")
+@read_only
+@conditional("catalog", cache_control=PUBLIC_REVALIDATE)
 def get_city_area(state):
     """Return cities and areas for a state"""
-    hikes_by_state = (db.session.query(Hike)
-                        .filter_by(state=state)
-                        .all())
 
-    areas = set()
-    cities = set()
+    index, _ = get_facet_index()
 
-    for hike in hikes_by_state:
-        areas.add(hike.area)
-        cities.add(hike.city)
-
-    areas = sorted(list(areas))
-    cities = sorted(list(cities))
+    areas = index.get_values("area", "state", state)
+    cities = index.get_values("city", "state", state)
 
     return jsonify({"areas": areas, "cities": cities})
 
 
+@app.route("/metrics")
+def metrics():
+    """Return request metrics in the Prometheus text format.
+
+    Scrapers send the METRICS_TOKEN setting as a bearer token. Without a
+    token, only local requests to the debug server are allowed: behind a
+    reverse proxy, every request comes from a local address.
+    """
+
+    token = app.config["METRICS_TOKEN"]
+
+    if token:
+        authorized = hmac.compare_digest(request.headers.get("Authorization", ""),
+                                         f"Bearer {token}")
+    else:
+        authorized = app.debug and request.remote_addr in ("127.0.0.1", "::1")
+
+    if not authorized:
+        return jsonify({"success": False, "error": "Not authorized"}), 403
+
+    return app.response_class(instrumentation.render_metrics(),
+                              mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/healthz")
+def liveness():
+    """Return 200 while the process can handle requests (liveness probe)."""
+
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readiness():
+    """Return 200 once the database is reachable and the catalog is loaded (readiness probe).
+
+    Return 503 while it isn't, so load balancers hold traffic back.
+    """
+
+    try:
+        db.session.execute(text("SELECT 1"))
+        catalog_cache.get()
+    except SQLAlchemyError as error:
+        app.logger.warning("Not ready: %s", error)
+        return jsonify({"status": "unavailable", "error": "Database unavailable"}), 503
+
+    return jsonify({"status": "ok"})
+
+
 if __name__ == "__main__":
     # DebugToolbarExtension(app)
-    connect_to_db(app)
+    create_app()
+    image_uploader.resume()
     app.run(host="0.0.0.0", debug=True)
@@ -0,0 +1,275 @@
+"""Server-side sessions and the logged in user.
+
+The session cookie holds only a random session id; the session's data is
+kept in a session store (Redis, or memory for development) under that
+id. A logged in session holds the user's user_id, and the user's details
+are cached in the store under their id, so g.user is resolved without a
+query. Committing a change to a user deletes their cached details, for
+every session of theirs at once.
+"""
+
+import json
+import re
+import secrets
+import threading
+import time
+
+from flask import current_app, g, has_app_context, session
+from flask.ctx import _AppCtxGlobals
+from flask.sessions import SecureCookieSession, SessionInterface, session_json_serializer
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from werkzeug.utils import cached_property
+
+from lazy import LazyModule
+from model import db, User
+
+
+redis = LazyModule("redis")
+
+SESSION_ID_BYTES = 32
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{43}")
+
+# Cached users expire even if nothing invalidates them (e.g. a change made
+# with SQL), so they can't stay stale for longer than this
+USER_CACHE_SECONDS = 3600
+
+# User columns cached in the store; any other attribute loads when read
+CACHED_USER_COLUMNS = ["user_id", "full_name", "email"]
+
+
+def get_session_key(sid):
+    return f"session:{sid}"
+
+
+def get_user_key(user_id):
+    return f"user:{user_id}"
+
+
+class MemorySessionStore:
+    """Keeps sessions in this process's memory, for development and tests.
+
+    Workers don't share it, so use Redis with more than one worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def get(self, key):
+        """Return the value stored under key, or None if there's none or it expired."""
+
+        with self._lock:
+            value, expires_at = self._values.get(key, (None, 0))
+
+            if value is not None and expires_at <= time.monotonic():
+                del self._values[key]
+                return None
+
+            return value
+
+    def set(self, key, value, seconds):
+        """Store a string under key for seconds."""
+
+        with self._lock:
+            self._values[key] = (value, time.monotonic() + seconds)
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+
+class RedisSessionStore:
+    """Keeps sessions in Redis, shared by every worker."""
+
+    def __init__(self, url):
+        # Connects on first use; redis-py opens new connections after a fork
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key):
+        """Return the value stored under key, or None if there's none or it expired."""
+
+        return self._client.get(key)
+
+    def set(self, key, value, seconds):
+        """Store a string under key for seconds."""
+
+        self._client.set(key, value, ex=seconds)
+
+    def delete(self, key):
+        self._client.delete(key)
+
+
+class ServerSession(SecureCookieSession):
+    """Session data kept in a session store under the session id sid.
+
+    sid is None until a new session is first saved.
+    """
+
+    def __init__(self, initial=None, sid=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.replaced_sid = None
+
+    def regenerate(self):
+        """Give the session a new id, so an id known before logging in is no use after."""
+
+        if self.replaced_sid is None:
+            self.replaced_sid = self.sid
+
+        self.sid = None
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """Load and save sessions in the store of a ServerSessions."""
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.session_cookie_name)
+
+        if sid and SESSION_ID_PATTERN.fullmatch(sid):
+            data = self.sessions.store.get(get_session_key(sid))
+            if data is not None:
+                return ServerSession(session_json_serializer.loads(data), sid)
+
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        store = self.sessions.store
+        name = app.session_cookie_name
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if session.replaced_sid is not None:
+            store.delete(get_session_key(session.replaced_sid))
+
+        if not session:
+            # Emptied, e.g. by logging out
+            if session.modified:
+                if session.sid is not None:
+                    store.delete(get_session_key(session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(SESSION_ID_BYTES)
+
+        lifetime = int(app.permanent_session_lifetime.total_seconds())
+        store.set(get_session_key(session.sid), session_json_serializer.dumps(dict(session)), lifetime)
+
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+
+
+class SessionGlobals(_AppCtxGlobals):
+    """flask.g, with the logged in user loaded the first time g.user is read."""
+
+    @cached_property
+    def user(self):
+        return current_app.extensions["server_sessions"].get_user(session.get("user_id"))
+
+
+class ServerSessions:
+    """Keep sessions in a session store and resolve the logged in user as g.user.
+
+    store is any object with get(key), set(key, value, seconds) and
+    delete(key), such as a RedisSessionStore. It's a MemorySessionStore
+    until one is given.
+    """
+
+    def __init__(self, app=None, store=None):
+        self.store = store
+        self.app = None
+
+        if app is not None:
+            self.init_app(app, store)
+
+    def init_app(self, app, store=None):
+        self.app = app
+        self.store = store or MemorySessionStore()
+        app.config.setdefault("USER_CACHE_SECONDS", USER_CACHE_SECONDS)
+        app.session_interface = ServerSessionInterface(self)
+        app.app_ctx_globals_class = SessionGlobals
+        app.extensions["server_sessions"] = self
+
+        # The app context (and g) can outlive a request, e.g. in tests
+        app.before_request(lambda: g.pop("user", None))
+
+    def get_user(self, user_id):
+        """Return the user with user_id, or None.
+
+        A cached user is added to db.session without a query; otherwise the
+        user is loaded and cached.
+        """
+
+        if user_id is None:
+            return None
+
+        data = self.store.get(get_user_key(user_id))
+
+        if data is None:
+            user = User.get_user_by_id(user_id)
+            if user is not None:
+                self.cache_user(user)
+            return user
+
+        user = User(**json.loads(data))
+        make_transient_to_detached(user)
+
+        return db.session.merge(user, load=False)
+
+    def cache_user(self, user):
+        """Cache a user's details for get_user()."""
+
+        data = json.dumps({name: getattr(user, name) for name in CACHED_USER_COLUMNS})
+        self.store.set(get_user_key(user.user_id), data, self.app.config["USER_CACHE_SECONDS"])
+
+    def forget_users(self, user_ids):
+        """Delete the cached details of users that changed."""
+
+        for user_id in user_ids:
+            self.store.delete(get_user_key(user_id))
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, user):
+    """Remember a changed user, to uncache once the change is committed.
+
+    after_update also fires when a pet or bookmarks list is appended to
+    one of the user's backrefs.
+    """
+
+    session = object_session(user)
+    if session.is_modified(user, include_collections=False):
+        session.info.setdefault("changed_user_ids", set()).add(user.user_id)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, user):
+    object_session(user).info.setdefault("changed_user_ids", set()).add(user.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_changed_users(session):
+    user_ids = session.info.pop("changed_user_ids", None)
+
+    if user_ids and has_app_context():
+        sessions = current_app.extensions.get("server_sessions")
+        if sessions is not None:
+            sessions.forget_users(user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("changed_user_ids", None)
@@ -4,7 +4,8 @@
 const AllHikesCheckInContainer = () => {
   const session_login = document.querySelector("#login").innerText;
 
-  const [checkIns, setCheckIns] = React.useState([]);
+  const [checkIns, getFirstPage, getNextPage, hasMore] =
+    usePagedList("checkIns");
 
   if (session_login === "True") {
     React.useEffect(() => {
@@ -13,11 +14,7 @@ const AllHikesCheckInContainer = () => {
   }
 
   const getCheckIns = () => {
-    fetch(`/user_check_ins.json`)
-      .then((response) => response.json())
-      .then((data) => {
-        setCheckIns(data.checkIns);
-      });
+    getFirstPage(`/user_check_ins.json`);
   };
 
   const allCheckIns = [];
@@ -98,7 +95,10 @@ const AllHikesCheckInContainer = () => {
           {session_login !== "True" ? (
             <div className="fw-300">Please log in to add a check in.</div>
           ) : (
-            <div>{allCheckIns}</div>
+            <div>
+              {allCheckIns}
+              <LoadMoreButton hasMore={hasMore} onClick={getNextPage} />
+            </div>
           )}
 
           <div
@@ -125,7 +125,8 @@ const AllHikesCheckInContainer = () => {
 
 const AllHikesCommentContainer = () => {
   const session_login = document.querySelector("#login").innerText;
-  const [comments, setComments] = React.useState([]);
+  const [comments, getFirstPage, getNextPage, hasMore] =
+    usePagedList("comments");
 
   if (session_login === "True") {
     React.useEffect(() => {
@@ -134,11 +135,7 @@ const AllHikesCommentContainer = () => {
   }
 
   const getComments = () => {
-    fetch(`/user_comments.json`)
-      .then((response) => response.json())
-      .then((data) => {
-        setComments(data.comments);
-      });
+    getFirstPage(`/user_comments.json`);
   };
 
   const allComments = [];
@@ -223,7 +220,10 @@ const AllHikesCommentContainer = () => {
           {session_login !== "True" ? (
             <div className="fw-300">Please log in to view your comments.</div>
           ) : (
-            <div>{allComments}</div>
+            <div>
+              {allComments}
+              <LoadMoreButton hasMore={hasMore} onClick={getNextPage} />
+            </div>
           )}
 
           <div
@@ -559,7 +559,9 @@ const AllHikesContainer = () => {
   const [allHikes, setAllHikes] = React.useState([]);
   const [searchHikes, setSearchHikes] = React.useState([]);
   const [sortParam, setSortParam] = React.useState("");
+  const [popularitySort, setPopularitySort] = React.useState("");
   const [keywordFilter, setKeywordFilter] = React.useState("");
+  const [suggestions, setSuggestions] = React.useState([]);
 
   const [error, setError] = React.useState(null);
   const [isLoaded, setIsLoaded] = React.useState(false);
@@ -568,12 +570,16 @@ const AllHikesContainer = () => {
     getSearchHikes();
   }, []);
 
-  const getSearchHikes = () => {
-    fetch("/all_hikes.json")
+  // Fetch all hikes, ordered by name or by a popularity sort
+  // (check_ins, comments, bookmarks or trending)
+  const getSearchHikes = (sort = "") => {
+    fetch(sort ? `/all_hikes.json?sort=${sort}` : "/all_hikes.json")
       .then((response) => response.json())
       .then(
         (responseJson) => {
           setIsLoaded(true);
+          setPopularitySort(sort);
+          setSortParam("");
           setAllHikes(responseJson.hikes);
           setSearchHikes(responseJson.hikes);
           const boldTableData = document.querySelectorAll("td>span.fw-400");
@@ -699,16 +705,41 @@ const AllHikesContainer = () => {
 
   console.log(searchHikes);
 
+  // Suggest hike names, areas and cities as the keyword is typed
+  React.useEffect(() => {
+    if (keywordFilter.trim() === "") {
+      setSuggestions([]);
+      return;
+    }
+    let current = true;
+    fetch(`/hikes/suggest?q=${encodeURIComponent(keywordFilter)}`)
+      .then((response) => response.json())
+      .then((responseJson) => {
+        if (current) {
+          setSuggestions(responseJson.suggestions);
+        }
+      });
+    return () => {
+      current = false;
+    };
+  }, [keywordFilter]);
+
   const getHikesByKeyword = () => {
-    setSearchHikes([
-      ...allHikes.filter((hike) =>
-        hike.hike_name.toLowerCase().includes(keywordFilter.toLowerCase())
-      ),
-    ]);
+    if (keywordFilter.trim() === "") {
+      setSortParam("");
+      setSearchHikes([...allHikes]);
+      return;
+    }
+    fetch(`/hikes/search.json?search_term=${encodeURIComponent(keywordFilter)}`)
+      .then((response) => response.json())
+      .then((responseJson) => {
+        setSortParam("");
+        setSearchHikes(responseJson.hikes);
+      });
   };
 
   const getFilteredHikes = (url) => {
-    fetch(url)
+    fetch(popularitySort ? `${url}&sort=${popularitySort}` : url)
       .then((response) => response.json())
       .then((responseJson) => {
         const { hikes } = responseJson;
@@ -753,6 +784,7 @@ const AllHikesContainer = () => {
                   name="search_term"
                   placeholder="Search by hike name"
                   aria-label="Search"
+                  list="hike-suggestions"
                   value={keywordFilter}
                   onChange={(event) => setKeywordFilter(event.target.value)}
                   style={{
@@ -762,6 +794,14 @@ const AllHikesContainer = () => {
                     marginTop: "4px",
                   }}
                 ></input>
+                <datalist id="hike-suggestions">
+                  {suggestions.map((suggestion) => (
+                    <option
+                      key={`${suggestion.type}-${suggestion.hike_id || suggestion.label}`}
+                      value={suggestion.label}
+                    />
+                  ))}
+                </datalist>
                 <button
                   className="btn btn-sm btn-outline-dark me-2"
                   role="button"
@@ -801,10 +841,24 @@ const AllHikesContainer = () => {
               </small>
             </a>
             &nbsp;
+            <select
+              className="form-select form-select-sm mt-1"
+              aria-label="Sort hikes"
+              value={popularitySort}
+              onChange={(event) => getSearchHikes(event.target.value)}
+              style={{ fontWeight: 300, width: "auto", height: "31px" }}
+            >
+              <option value="">sort by name</option>
+              <option value="trending">trending</option>
+              <option value="check_ins">most checked in</option>
+              <option value="comments">most commented</option>
+              <option value="bookmarks">most bookmarked</option>
+            </select>
+            &nbsp;
             <button
               className="btn btn-sm btn-outline-dark mt-1"
               role="button"
-              onClick={getSearchHikes}
+              onClick={() => getSearchHikes(popularitySort)}
             >
               <small style={{ fontWeight: 300 }}>clear filter</small>
             </button>
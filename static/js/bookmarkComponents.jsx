@@ -422,12 +422,14 @@ const AddMultHikesToExistingList = React.forwardRef((props, ref) => {
           ) {
             allHikeOptions.push({
               select: true,
+              on_list: true,
               hike_name: responseHike.hike_name,
               hike_id: responseHike.hike_id,
             });
           } else {
             allHikeOptions.push({
               select: false,
+              on_list: false,
               hike_name: responseHike.hike_name,
               hike_id: responseHike.hike_id,
             });
@@ -438,6 +440,22 @@ const AddMultHikesToExistingList = React.forwardRef((props, ref) => {
   };
 
   const addHikesToBookmarksList = () => {
+    // Only send the hikes whose checkbox changed
+    const addHikeIds = [];
+    const removeHikeIds = [];
+    for (const hikeOption of allHikesOptions) {
+      if (hikeOption.select && !hikeOption.on_list) {
+        addHikeIds.push(hikeOption.hike_id);
+      } else if (!hikeOption.select && hikeOption.on_list) {
+        removeHikeIds.push(hikeOption.hike_id);
+      }
+    }
+    setAllHikesOptions(
+      allHikesOptions.map((hikeOption) =>
+        Object.assign({}, hikeOption, { on_list: hikeOption.select })
+      )
+    );
+
     fetch(`/${props.bookmarks_list_id}/add-hikes`, {
       method: "POST",
       headers: {
@@ -445,7 +463,8 @@ const AddMultHikesToExistingList = React.forwardRef((props, ref) => {
         Accept: "application/json",
       },
       body: JSON.stringify({
-        allHikesOptions, // returns list of objects
+        addHikeIds,
+        removeHikeIds,
       }),
     }).then((response) => {
       response.json().then((jsonResponse) => {
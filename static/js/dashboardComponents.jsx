@@ -53,24 +53,22 @@ const ViewMonthYear = (props) => {
   }, []);
 
   const getYearOptions = () => {
-    fetch("/user_check_ins.json")
-      .then((response) => response.json())
-      .then((jsonResponse) => {
-        const { checkIns } = jsonResponse;
-        let years = [];
-        for (const checkIn of checkIns) {
-          const dateHiked = new Date(checkIn.date_hiked);
-          const year = dateHiked.getFullYear();
-          if (!years.includes(year)) {
-            years.push(year);
-          }
+    getDashboardData().then((jsonResponse) => {
+      const { checkIns } = jsonResponse;
+      let years = [];
+      for (const checkIn of checkIns) {
+        const dateHiked = new Date(checkIn.date_hiked);
+        const year = dateHiked.getFullYear();
+        if (!years.includes(year)) {
+          years.push(year);
         }
-        setYearOptions(
-          years.sort((a, b) => {
-            return b - a;
-          })
-        );
-      });
+      }
+      setYearOptions(
+        years.sort((a, b) => {
+          return b - a;
+        })
+      );
+    });
   };
 
   const changeMonthYearForm = () => {
@@ -346,48 +344,42 @@ const DashboardMainContainer = React.forwardRef((props, ref) => {
   }, []);
 
   const getCheckIns = () => {
-    fetch("/user_check_ins.json")
-      .then((response) => response.json())
-      .then(
-        (data) => {
-          setCheckIns(data.checkIns);
-          setIsLoadedCheckIns(true);
-        },
-        (error) => {
-          setIsLoadedCheckIns(true);
-          setErrorCheckIns(error);
-        }
-      );
+    refreshDashboardData().then(
+      (data) => {
+        setCheckIns(data.checkIns);
+        setIsLoadedCheckIns(true);
+      },
+      (error) => {
+        setIsLoadedCheckIns(true);
+        setErrorCheckIns(error);
+      }
+    );
   };
 
   const getBookmarksLists = () => {
-    fetch("/user_bookmarks_lists.json")
-      .then((response) => response.json())
-      .then(
-        (data) => {
-          setBookmarksLists(data.bookmarksLists);
-          setIsLoadedBookmarksLists(true);
-        },
-        (error) => {
-          setIsLoadedBookmarksLists(true);
-          setErrorBookmarksLists(error);
-        }
-      );
+    refreshDashboardData().then(
+      (data) => {
+        setBookmarksLists(data.bookmarksLists);
+        setIsLoadedBookmarksLists(true);
+      },
+      (error) => {
+        setIsLoadedBookmarksLists(true);
+        setErrorBookmarksLists(error);
+      }
+    );
   };
 
   const getComments = () => {
-    fetch("/user_comments.json")
-      .then((response) => response.json())
-      .then(
-        (data) => {
-          setComments(data.comments);
-          setIsLoadedComments(true);
-        },
-        (error) => {
-          setIsLoadedComments(true);
-          setErrorComments(error);
-        }
-      );
+    refreshDashboardData().then(
+      (data) => {
+        setComments(data.comments);
+        setIsLoadedComments(true);
+      },
+      (error) => {
+        setIsLoadedComments(true);
+        setErrorComments(error);
+      }
+    );
   };
 
   const parentGetGraphData = () => {
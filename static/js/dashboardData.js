@@ -0,0 +1,35 @@
+"use strict";
+
+// All dashboard components share one request to /dashboard/bootstrap.json
+// instead of each fetching /user_check_ins.json, /check-ins-by-pets.json,
+// /user_bookmarks_lists.json, /user_comments.json and /pets.json.
+
+let dashboardData = null; // promise for the latest bootstrap payload
+let dashboardDataRefreshed = false; // true for the rest of the current tick
+let dashboardRequestCount = 0; // number of bootstrap requests made by this page
+
+// Return the dashboard data, fetching it the first time it is needed
+function getDashboardData() {
+  if (dashboardData === null) {
+    return refreshDashboardData();
+  }
+  return dashboardData;
+}
+
+// Fetch the dashboard data again after a check in, pet profile, bookmarks
+// list or comment changes. Components that refresh in the same tick (e.g.
+// the map, graph and check ins after adding a check in) share one request.
+function refreshDashboardData() {
+  if (!dashboardDataRefreshed) {
+    dashboardDataRefreshed = true;
+    setTimeout(() => {
+      dashboardDataRefreshed = false;
+    }, 0);
+
+    dashboardRequestCount += 1;
+    dashboardData = fetch("/dashboard/bootstrap.json").then((response) =>
+      response.json()
+    );
+  }
+  return dashboardData;
+}
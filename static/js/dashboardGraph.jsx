@@ -18,18 +18,109 @@ const DashboardGraph = React.forwardRef((props, ref) => {
   }, []);
 
   const initGraph = () => {
-    fetch("/check-ins-by-pets.json")
-      .then((response) => response.json())
-      .then((responseJson) => {
+    getDashboardData().then((responseJson) => {
+      const { petCheckIns } = responseJson;
+
+      const all_data = [];
+
+      // let years = [];
+      // const currentDate = new Date();
+      // const currentYear = currentDate.getFullYear();
+
+      for (const petCheckIn of petCheckIns) {
+        const dateHiked = new Date(petCheckIn.date_hiked);
+        // const year = dateHiked.getFullYear();
+        // if (!years.includes(year)) {
+        //   years.push(year);
+        // }
+
+        // const orderedYears = years.sort((a, b) => {
+        //   return a - b;
+        // });
+        // setYearRange([orderedYears[0], currentYear]);
+
+        const label = petCheckIn.pet_name;
+        const data = petCheckIn.data.map((checkIn) => ({
+          x: checkIn.date_hiked,
+          y: checkIn.miles_completed,
+        }));
+
+        const lineColor = colors[Math.floor(Math.random() * colors.length)];
+
+        all_data.push({
+          label: label,
+          data: data,
+          fill: false,
+          lineTension: 0.4,
+          radius: 6,
+          borderColor: lineColor,
+          backgroundColor: lineColor,
+        });
+      }
+
+      const myLineChart = new Chart(
+        document.querySelector("#check-in-graph"),
+        {
+          type: "line",
+          data: {
+            datasets: all_data,
+          },
+          options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+              legend: { display: true, position: "bottom" },
+            },
+
+            scales: {
+              x: {
+                type: "time",
+                min: new Date(yearRange[0], 0),
+                max: new Date(yearRange[1], 11, 31),
+                time: {
+                  tooltipFormat: "LLLL dd", // Luxon format string
+                  unit: "day",
+                },
+                display: true,
+                title: {
+                  display: true,
+                  text: "Date",
+                },
+              },
+
+              y: {
+                min: 0,
+                suggestedMax: 20,
+                display: true,
+                ticks: {
+                  stepSize: 1,
+                },
+                title: {
+                  display: true,
+                  text: "Miles",
+                },
+              },
+            },
+          },
+        }
+      );
+
+      setMyChart(myLineChart);
+    });
+  };
+
+  React.useImperativeHandle(ref, () => ({
+    getGraphData() {
+      refreshDashboardData().then((responseJson) => {
         const { petCheckIns } = responseJson;
 
         const all_data = [];
-
         // let years = [];
         // const currentDate = new Date();
         // const currentYear = currentDate.getFullYear();
 
         for (const petCheckIn of petCheckIns) {
+          // set year range for viewing graph by all time
           const dateHiked = new Date(petCheckIn.date_hiked);
           // const year = dateHiked.getFullYear();
           // if (!years.includes(year)) {
@@ -60,104 +151,9 @@ const DashboardGraph = React.forwardRef((props, ref) => {
           });
         }
 
-        const myLineChart = new Chart(
-          document.querySelector("#check-in-graph"),
-          {
-            type: "line",
-            data: {
-              datasets: all_data,
-            },
-            options: {
-              responsive: true,
-              maintainAspectRatio: false,
-              plugins: {
-                legend: { display: true, position: "bottom" },
-              },
-
-              scales: {
-                x: {
-                  type: "time",
-                  min: new Date(yearRange[0], 0),
-                  max: new Date(yearRange[1], 11, 31),
-                  time: {
-                    tooltipFormat: "LLLL dd", // Luxon format string
-                    unit: "day",
-                  },
-                  display: true,
-                  title: {
-                    display: true,
-                    text: "Date",
-                  },
-                },
-
-                y: {
-                  min: 0,
-                  suggestedMax: 20,
-                  display: true,
-                  ticks: {
-                    stepSize: 1,
-                  },
-                  title: {
-                    display: true,
-                    text: "Miles",
-                  },
-                },
-              },
-            },
-          }
-        );
-
-        setMyChart(myLineChart);
+        myChart.data.datasets = all_data;
+        myChart.update();
       });
-  };
-
-  React.useImperativeHandle(ref, () => ({
-    getGraphData() {
-      fetch("/check-ins-by-pets.json")
-        .then((response) => response.json())
-        .then((responseJson) => {
-          const { petCheckIns } = responseJson;
-
-          const all_data = [];
-          // let years = [];
-          // const currentDate = new Date();
-          // const currentYear = currentDate.getFullYear();
-
-          for (const petCheckIn of petCheckIns) {
-            // set year range for viewing graph by all time
-            const dateHiked = new Date(petCheckIn.date_hiked);
-            // const year = dateHiked.getFullYear();
-            // if (!years.includes(year)) {
-            //   years.push(year);
-            // }
-
-            // const orderedYears = years.sort((a, b) => {
-            //   return a - b;
-            // });
-            // setYearRange([orderedYears[0], currentYear]);
-
-            const label = petCheckIn.pet_name;
-            const data = petCheckIn.data.map((checkIn) => ({
-              x: checkIn.date_hiked,
-              y: checkIn.miles_completed,
-            }));
-
-            const lineColor = colors[Math.floor(Math.random() * colors.length)];
-
-            all_data.push({
-              label: label,
-              data: data,
-              fill: false,
-              lineTension: 0.4,
-              radius: 6,
-              borderColor: lineColor,
-              backgroundColor: lineColor,
-            });
-          }
-
-          myChart.data.datasets = all_data;
-          myChart.update();
-        });
     },
     updateGraphView() {
       const view = document.querySelector(
@@ -210,33 +206,31 @@ const DashboardGraphContainer = React.forwardRef((props, ref) => {
   }, []);
 
   const getAllTimeGraphInfo = () => {
-    fetch("/user_check_ins.json")
-      .then((response) => response.json())
-      .then(
-        (data) => {
-          const { checkIns } = data;
-          setAllCheckIns(checkIns);
-
-          let initMiles = 0;
-
-          let totalMiles = checkIns.reduce(function (
-            previousValue,
-            currentValue
-          ) {
-            return previousValue + currentValue.miles_completed;
-          },
-          initMiles);
+    getDashboardData().then(
+      (data) => {
+        const { checkIns } = data;
+        setAllCheckIns(checkIns);
+
+        let initMiles = 0;
 
-          setGraphHeader("All Time");
-          setGraphCheckIns(checkIns);
-          setGraphCheckInsTotalMiles(totalMiles);
-          setIsLoaded(true);
+        let totalMiles = checkIns.reduce(function (
+          previousValue,
+          currentValue
+        ) {
+          return previousValue + currentValue.miles_completed;
         },
-        (error) => {
-          setIsLoaded(true);
-          setError(error);
-        }
-      );
+        initMiles);
+
+        setGraphHeader("All Time");
+        setGraphCheckIns(checkIns);
+        setGraphCheckInsTotalMiles(totalMiles);
+        setIsLoaded(true);
+      },
+      (error) => {
+        setIsLoaded(true);
+        setError(error);
+      }
+    );
   };
 
   const parentUpdateGraphView = () => {
@@ -244,41 +238,39 @@ const DashboardGraphContainer = React.forwardRef((props, ref) => {
   };
 
   const updateGraphInfo = () => {
-    fetch("/user_check_ins.json")
-      .then((response) => response.json())
-      .then((jsonResponse) => {
-        const { checkIns } = jsonResponse;
-
-        setAllCheckIns(checkIns);
-        const view = document.querySelector("input[name=graph-view]:checked");
-        if (view === null || view.value === "graph-all-view") {
-          getAllTimeGraphInfo();
-        } else if (view.value === "graph-month-view") {
-          const date = new Date(
-            document.querySelector("select[name=graph-month-view-year]").value,
-            document.querySelector("select[name=graph-month-view-month]")
-              .value - 1,
-            1,
-            0,
-            0
-          );
-          const monthName = date.toLocaleString("default", { month: "long" });
-          const month = date.getMonth();
-          const year = date.getFullYear();
-          const startDate = new Date(year, month, 1, 0, 0);
-          const endDate = new Date(new Date(year, month + 1, 1, 0, 0) - 1);
-          setGraphHeader(`${monthName} ${year}`);
-          filterCheckInsByDate(checkIns, startDate, endDate);
-        } else if (view.value === "graph-year-view") {
-          const year = document.querySelector(
-            "select[name=graph-year-view-year]"
-          ).value;
-          const startDate = new Date(year, 0);
-          const endDate = new Date(year, 11, 31);
-          setGraphHeader(`${year}`);
-          filterCheckInsByDate(checkIns, startDate, endDate);
-        }
-      });
+    refreshDashboardData().then((jsonResponse) => {
+      const { checkIns } = jsonResponse;
+
+      setAllCheckIns(checkIns);
+      const view = document.querySelector("input[name=graph-view]:checked");
+      if (view === null || view.value === "graph-all-view") {
+        getAllTimeGraphInfo();
+      } else if (view.value === "graph-month-view") {
+        const date = new Date(
+          document.querySelector("select[name=graph-month-view-year]").value,
+          document.querySelector("select[name=graph-month-view-month]")
+            .value - 1,
+          1,
+          0,
+          0
+        );
+        const monthName = date.toLocaleString("default", { month: "long" });
+        const month = date.getMonth();
+        const year = date.getFullYear();
+        const startDate = new Date(year, month, 1, 0, 0);
+        const endDate = new Date(new Date(year, month + 1, 1, 0, 0) - 1);
+        setGraphHeader(`${monthName} ${year}`);
+        filterCheckInsByDate(checkIns, startDate, endDate);
+      } else if (view.value === "graph-year-view") {
+        const year = document.querySelector(
+          "select[name=graph-year-view-year]"
+        ).value;
+        const startDate = new Date(year, 0);
+        const endDate = new Date(year, 11, 31);
+        setGraphHeader(`${year}`);
+        filterCheckInsByDate(checkIns, startDate, endDate);
+      }
+    });
   };
 
   const filterCheckInsByDate = (checkIns, startDate, endDate) => {
@@ -11,81 +11,79 @@ const DashboardMap = React.forwardRef((props, ref) => {
 
   // Initialize map with check ins from all time
   const initMap = () => {
-    fetch("/user_check_ins.json")
-      .then((response) => response.json())
-      .then((jsonResponse) => {
-        const basicMap = new google.maps.Map(
-          document.querySelector("#dashboard-map"),
-          {
-            zoom: 5,
-          }
-        );
-
-        basicMap.setZoom(5);
-
-        const { checkIns } = jsonResponse;
-        setAllCheckIns(checkIns);
-
-        const markers = [];
-        const uniqueHikes = [];
-
-        for (const currentCheckIn of checkIns) {
-          const { hike_name, latitude, longitude } = currentCheckIn.hike;
-          const hikeId = currentCheckIn.hike_id;
-          if (!uniqueHikes.includes(hikeId)) {
-            uniqueHikes.push(hikeId);
-            markers.push(
-              new google.maps.Marker({
-                position: {
-                  lat: Number(latitude),
-                  lng: Number(longitude),
-                },
-                title: hike_name,
-                map: basicMap,
-                icon: {
-                  // custom icon
-                  url: "/static/img/marker.svg",
-                  scaledSize: {
-                    width: 30,
-                    height: 30,
-                  },
-                },
-              })
-            );
-          }
+    getDashboardData().then((jsonResponse) => {
+      const basicMap = new google.maps.Map(
+        document.querySelector("#dashboard-map"),
+        {
+          zoom: 5,
         }
-        basicMap.setZoom(5);
+      );
 
-        const bounds = new google.maps.LatLngBounds();
+      basicMap.setZoom(5);
 
-        for (const marker of markers) {
-          bounds.extend(marker.position);
-          const markerInfo = `
-          <h6>${marker.title}</h6>
-          <p>
-            Located at: <code>${marker.position.lat()}</code>,
-            <code>${marker.position.lng()}</code>
-          </p>
-        `;
+      const { checkIns } = jsonResponse;
+      setAllCheckIns(checkIns);
 
-          const infoWindow = new google.maps.InfoWindow({
-            content: markerInfo,
-            maxWidth: 200,
-          });
+      const markers = [];
+      const uniqueHikes = [];
 
-          marker.addListener("click", () => {
-            infoWindow.open(basicMap, marker);
-          });
+      for (const currentCheckIn of checkIns) {
+        const { hike_name, latitude, longitude } = currentCheckIn.hike;
+        const hikeId = currentCheckIn.hike_id;
+        if (!uniqueHikes.includes(hikeId)) {
+          uniqueHikes.push(hikeId);
+          markers.push(
+            new google.maps.Marker({
+              position: {
+                lat: Number(latitude),
+                lng: Number(longitude),
+              },
+              title: hike_name,
+              map: basicMap,
+              icon: {
+                // custom icon
+                url: "/static/img/marker.svg",
+                scaledSize: {
+                  width: 30,
+                  height: 30,
+                },
+              },
+            })
+          );
         }
+      }
+      basicMap.setZoom(5);
+
+      const bounds = new google.maps.LatLngBounds();
+
+      for (const marker of markers) {
+        bounds.extend(marker.position);
+        const markerInfo = `
+        <h6>${marker.title}</h6>
+        <p>
+          Located at: <code>${marker.position.lat()}</code>,
+          <code>${marker.position.lng()}</code>
+        </p>
+      `;
+
+        const infoWindow = new google.maps.InfoWindow({
+          content: markerInfo,
+          maxWidth: 200,
+        });
+
+        marker.addListener("click", () => {
+          infoWindow.open(basicMap, marker);
+        });
+      }
 
-        basicMap.fitBounds(bounds);
-        basicMap.setZoom(5);
+      basicMap.fitBounds(bounds);
+      basicMap.setZoom(5);
 
-        setMapHikes(uniqueHikes);
-        setMapMarkers(markers);
-        setMapBounds(bounds);
-        setMyMap(basicMap);
-      });
+      setMapHikes(uniqueHikes);
+      setMapMarkers(markers);
+      setMapBounds(bounds);
+      setMyMap(basicMap);
+    });
   }
 
   const createMarkers = (checkIns) => {
@@ -229,47 +227,45 @@ const DashboardMap = React.forwardRef((props, ref) => {
         marker.setMap(null);
       }
       mapMarkers.length = 0;
-      fetch("/user_check_ins.json")
-        .then((response) => response.json())
-        .then((jsonResponse) => {
-          const { checkIns } = jsonResponse;
-          setAllCheckIns(checkIns);
-          const view = document.querySelector("input[name=map-view]:checked");
-          if (view === null || view.value === "map-all-view") {
-            createMarkers(checkIns);
-          } else if (view.value === "map-month-view") {
-            const date = new Date(
-              document.querySelector("select[name=map-month-view-year]").value,
-              document.querySelector("select[name=map-month-view-month]")
-                .value - 1,
-              1,
-              0,
-              0
-            );
-            const month = date.getMonth();
-            const year = date.getFullYear();
-            const startDate = new Date(year, month, 1, 0, 0);
-            const endDate = new Date(new Date(year, month + 1, 1, 0, 0) - 1);
-            const filteredCheckIns = filterCheckInsByDate(
-              checkIns,
-              startDate,
-              endDate
-            );
-            createMarkers(filteredCheckIns);
-          } else if (view.value === "map-year-view") {
-            const year = document.querySelector(
-              "select[name=map-year-view-year]"
-            ).value;
-            const startDate = new Date(year, 0);
-            const endDate = new Date(year, 11, 31);
-            const filteredCheckIns = filterCheckInsByDate(
-              checkIns,
-              startDate,
-              endDate
-            );
-            createMarkers(filteredCheckIns);
-          }
-        });
+      refreshDashboardData().then((jsonResponse) => {
+        const { checkIns } = jsonResponse;
+        setAllCheckIns(checkIns);
+        const view = document.querySelector("input[name=map-view]:checked");
+        if (view === null || view.value === "map-all-view") {
+          createMarkers(checkIns);
+        } else if (view.value === "map-month-view") {
+          const date = new Date(
+            document.querySelector("select[name=map-month-view-year]").value,
+            document.querySelector("select[name=map-month-view-month]")
+              .value - 1,
+            1,
+            0,
+            0
+          );
+          const month = date.getMonth();
+          const year = date.getFullYear();
+          const startDate = new Date(year, month, 1, 0, 0);
+          const endDate = new Date(new Date(year, month + 1, 1, 0, 0) - 1);
+          const filteredCheckIns = filterCheckInsByDate(
+            checkIns,
+            startDate,
+            endDate
+          );
+          createMarkers(filteredCheckIns);
+        } else if (view.value === "map-year-view") {
+          const year = document.querySelector(
+            "select[name=map-year-view-year]"
+          ).value;
+          const startDate = new Date(year, 0);
+          const endDate = new Date(year, 11, 31);
+          const filteredCheckIns = filterCheckInsByDate(
+            checkIns,
+            startDate,
+            endDate
+          );
+          createMarkers(filteredCheckIns);
+        }
+      });
 
       myMap.setZoom(5);
     },
@@ -293,58 +289,54 @@ const DashboardMapContainer = React.forwardRef((props, ref) => {
   const [isLoaded, setIsLoaded] = React.useState(false);
 
   React.useEffect(() => {
-    fetch(`/user_check_ins.json`)
-      .then((response) => response.json())
-      .then(
-        (data) => {
-          const { checkIns } = data;
-          setIsLoaded(true);
-          setCheckIns(checkIns);
-          countHikeOccurrences(checkIns);
-        },
-        (error) => {
-          setIsLoaded(true);
-          setError(error);
-        }
-      );
+    getDashboardData().then(
+      (data) => {
+        const { checkIns } = data;
+        setIsLoaded(true);
+        setCheckIns(checkIns);
+        countHikeOccurrences(checkIns);
+      },
+      (error) => {
+        setIsLoaded(true);
+        setError(error);
+      }
+    );
   }, []);
 
   const updateMapInfo = () => {
-    fetch("/user_check_ins.json")
-      .then((response) => response.json())
-      .then((jsonResponse) => {
-        const { checkIns } = jsonResponse;
-        setCheckIns(checkIns);
-        const view = document.querySelector("input[name=map-view]:checked");
-        if (view === null || view.value === "map-all-view") {
-          setMapHeader("Hikes Visited - All Time");
-          countHikeOccurrences(checkIns);
-        } else if (view.value === "map-month-view") {
-          const date = new Date(
-            document.querySelector("select[name=map-month-view-year]").value,
-            document.querySelector("select[name=map-month-view-month]").value -
-              1,
+    refreshDashboardData().then((jsonResponse) => {
+      const { checkIns } = jsonResponse;
+      setCheckIns(checkIns);
+      const view = document.querySelector("input[name=map-view]:checked");
+      if (view === null || view.value === "map-all-view") {
+        setMapHeader("Hikes Visited - All Time");
+        countHikeOccurrences(checkIns);
+      } else if (view.value === "map-month-view") {
+        const date = new Date(
+          document.querySelector("select[name=map-month-view-year]").value,
+          document.querySelector("select[name=map-month-view-month]").value -
             1,
-            0,
-            0
-          );
-          const monthName = date.toLocaleString("default", { month: "long" });
-          const month = date.getMonth();
-          const year = date.getFullYear();
-          const startDate = new Date(year, month, 1, 0, 0);
-          const endDate = new Date(new Date(year, month + 1, 1, 0, 0) - 1);
-          setMapHeader(`Hikes Visited - ${monthName} ${year}`);
-          filterCheckInsByDate(checkIns, startDate, endDate);
-        } else if (view.value === "map-year-view") {
-          const year = document.querySelector(
-            "select[name=map-year-view-year]"
-          ).value;
-          const startDate = new Date(year, 0);
-          const endDate = new Date(year, 11, 31);
-          setMapHeader(`Hikes Visited - ${year}`);
-          filterCheckInsByDate(checkIns, startDate, endDate);
-        }
-      });
+          1,
+          0,
+          0
+        );
+        const monthName = date.toLocaleString("default", { month: "long" });
+        const month = date.getMonth();
+        const year = date.getFullYear();
+        const startDate = new Date(year, month, 1, 0, 0);
+        const endDate = new Date(new Date(year, month + 1, 1, 0, 0) - 1);
+        setMapHeader(`Hikes Visited - ${monthName} ${year}`);
+        filterCheckInsByDate(checkIns, startDate, endDate);
+      } else if (view.value === "map-year-view") {
+        const year = document.querySelector(
+          "select[name=map-year-view-year]"
+        ).value;
+        const startDate = new Date(year, 0);
+        const endDate = new Date(year, 11, 31);
+        setMapHeader(`Hikes Visited - ${year}`);
+        filterCheckInsByDate(checkIns, startDate, endDate);
+      }
+    });
   }
 
   const filterCheckInsByDate = (checkIns, startDate, endDate) => {
@@ -264,12 +264,14 @@ const DetailsAddHikeToNewOrExistingList = React.forwardRef((props, ref) => {
           if (hikeOnList) {
             allListOptions.push({
               select: true,
+              on_list: true,
               bookmarks_list_name: bookmarksList.bookmarks_list_name,
               bookmarks_list_id: bookmarksList.bookmarks_list_id,
             });
           } else {
             allListOptions.push({
               select: false,
+              on_list: false,
               bookmarks_list_name: bookmarksList.bookmarks_list_name,
               bookmarks_list_id: bookmarksList.bookmarks_list_id,
             });
@@ -303,12 +305,14 @@ const DetailsAddHikeToNewOrExistingList = React.forwardRef((props, ref) => {
               if (hikeOnList) {
                 allListOptions.push({
                   select: true,
+                  on_list: true,
                   bookmarks_list_name: bookmarksList.bookmarks_list_name,
                   bookmarks_list_id: bookmarksList.bookmarks_list_id,
                 });
               } else {
                 allListOptions.push({
                   select: false,
+                  on_list: false,
                   bookmarks_list_name: bookmarksList.bookmarks_list_name,
                   bookmarks_list_id: bookmarksList.bookmarks_list_id,
                 });
@@ -325,6 +329,22 @@ const DetailsAddHikeToNewOrExistingList = React.forwardRef((props, ref) => {
   }));
 
   const addHikeExistingBookmarksList = () => {
+    // Only send the lists whose checkbox changed
+    const addBookmarksListIds = [];
+    const removeBookmarksListIds = [];
+    for (const bookmarksListOption of allBookmarksListOptions) {
+      if (bookmarksListOption.select && !bookmarksListOption.on_list) {
+        addBookmarksListIds.push(bookmarksListOption.bookmarks_list_id);
+      } else if (!bookmarksListOption.select && bookmarksListOption.on_list) {
+        removeBookmarksListIds.push(bookmarksListOption.bookmarks_list_id);
+      }
+    }
+    setAllBookmarksListOptions(
+      allBookmarksListOptions.map((bookmarksListOption) =>
+        Object.assign({}, bookmarksListOption, { on_list: bookmarksListOption.select })
+      )
+    );
+
     fetch(`/hikes/${hike_id}/add-hike-to-existing-list`, {
       method: "POST",
       headers: {
@@ -332,7 +352,8 @@ const DetailsAddHikeToNewOrExistingList = React.forwardRef((props, ref) => {
         Accept: "application/json",
       },
       body: JSON.stringify({
-        allBookmarksListOptions, // returns list of objects
+        addBookmarksListIds,
+        removeBookmarksListIds,
       }),
     }).then((response) => {
       response.json().then((jsonResponse) => {
@@ -697,7 +718,8 @@ const HikeDetailsCheckInContainer = () => {
 };
 
 const HikeDetailsCommentContainer = () => {
-  const [comments, setComments] = React.useState([]);
+  const [comments, getFirstPage, getNextPage, hasMore] =
+    usePagedList("comments");
 
   const hike_id = document.querySelector("#hike_id").innerText;
 
@@ -718,21 +740,15 @@ const HikeDetailsCommentContainer = () => {
   };
 
   const getHikeComments = () => {
-    fetch(`/hikes/${hike_id}/comments.json`)
-      .then((response) => response.json())
-      .then((data) => {
-        setComments(data.comments);
-        setCommentsHeader("Comments For This Hike");
-      });
+    getFirstPage(`/hikes/${hike_id}/comments.json`).then(() => {
+      setCommentsHeader("Comments For This Hike");
+    });
   };
 
   const getUserComments = () => {
-    fetch(`/user_comments.json`)
-      .then((response) => response.json())
-      .then((data) => {
-        setComments(data.comments);
-        setCommentsHeader("Your Comments for All Hikes");
-      });
+    getFirstPage(`/user_comments.json`).then(() => {
+      setCommentsHeader("Your Comments for All Hikes");
+    });
   };
 
   const allComments = [];
@@ -859,7 +875,10 @@ const HikeDetailsCommentContainer = () => {
           {session_login !== "True" ? (
             <div className="fw-300">Please log in to add a comment.</div>
           ) : null}
-          <div>{allComments}</div>
+          <div>
+            {allComments}
+            <LoadMoreButton hasMore={hasMore} onClick={getNextPage} />
+          </div>
 
           <div
             className="offcanvas-footer"
@@ -127,3 +127,54 @@ const FooterSearchBar = (props) => {
 //     </React.Fragment>
 //   );
 // }
+
+// Number of check ins or comments fetched per "load more" page
+const PAGE_SIZE = 20;
+
+// Fetch a paginated list endpoint one page at a time. getFirstPage(url)
+// replaces the list with its first page; getNextPage() appends the next.
+const usePagedList = (key) => {
+  const [items, setItems] = React.useState([]);
+  const [url, setUrl] = React.useState(null);
+  const [nextCursor, setNextCursor] = React.useState(null);
+
+  const getPage = (pageUrl, cursor, previousItems) => {
+    const params = new URLSearchParams({ limit: PAGE_SIZE });
+    if (cursor) {
+      params.set("cursor", cursor);
+    }
+
+    return fetch(`${pageUrl}?${params}`)
+      .then((response) => response.json())
+      .then((data) => {
+        setItems(previousItems.concat(data[key]));
+        setUrl(pageUrl);
+        setNextCursor(data.nextCursor);
+        return data;
+      });
+  };
+
+  const getFirstPage = (pageUrl) => getPage(pageUrl, null, []);
+
+  const getNextPage = () => getPage(url, nextCursor, items);
+
+  return [items, getFirstPage, getNextPage, nextCursor !== null];
+};
+
+const LoadMoreButton = (props) => {
+  if (!props.hasMore) {
+    return null;
+  }
+
+  return (
+    <div className="text-center my-3">
+      <button
+        type="button"
+        className="btn btn-sm btn-outline-dark fw-300"
+        onClick={props.onClick}
+      >
+        load more
+      </button>
+    </div>
+  );
+};
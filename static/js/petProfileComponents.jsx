@@ -1,5 +1,25 @@
 "use strict";
 
+// How often pet profiles are refetched while an image is uploading
+const PET_IMAGE_POLL_MS = 3000;
+
+// Refetch pet profiles until their images are done uploading in the background
+function usePendingPetImages(petProfiles, setPetProfiles) {
+  React.useEffect(() => {
+    if (!petProfiles.some((pet) => pet.img_status === "pending")) {
+      return;
+    }
+    const timeout = setTimeout(() => {
+      fetch("/pets.json")
+        .then((response) => response.json())
+        .then((data) => {
+          setPetProfiles(data.petProfiles);
+        });
+    }, PET_IMAGE_POLL_MS);
+    return () => clearTimeout(timeout);
+  }, [petProfiles]);
+}
+
 const PetProfile = (props) => {
   // Check if user wants to delete or not
   const deleteConfirm = () => {
@@ -29,13 +49,25 @@ const PetProfile = (props) => {
             {props.pet_img_URL !== null ? (
               <div>
                 <img
-                  src={props.pet_img_URL}
+                  src={props.img_thumb_url || props.pet_img_URL}
+                  srcSet={
+                    props.img_thumb_url !== null &&
+                    props.img_medium_url !== null
+                      ? `${props.img_thumb_url} 256w, ${props.img_medium_url} 640w`
+                      : undefined
+                  }
+                  sizes="8em"
                   alt="profile"
                   className="pet-profile-img"
                   id={`pet-img-${props.pet_id}`}
                 />
               </div>
             ) : null}
+            {props.img_status === "pending" ? (
+              <small className="fw-300">uploading photo...</small>
+            ) : props.img_status === "failed" ? (
+              <small className="fw-300">photo upload failed</small>
+            ) : null}
           </div>
           <div className="col-md-8">
             <div className="card-body">
@@ -93,12 +125,12 @@ const PetProfile = (props) => {
                   </div>
                 ) : null}
 
-                {props.check_ins.length !== 0 ? (
+                {props.hike_count !== 0 ? (
                   <React.Fragment>
                     <div>
                       <small>
-                        I've done {props.check_ins.length}{" "}
-                        {props.check_ins.length === 1 ? (
+                        I've done {props.hike_count}{" "}
+                        {props.hike_count === 1 ? (
                           <span>hike</span>
                         ) : (
                           <span>hikes</span>
@@ -428,6 +460,7 @@ const AddPetProfile = (props) => {
 // All Hikes and Hike Details Pet Profile container component
 const PetProfileContainer = React.forwardRef((props, ref) => {
   const [petProfiles, setPetProfiles] = React.useState([]);
+  usePendingPetImages(petProfiles, setPetProfiles);
 
   const session_login = document.querySelector("#login").innerText;
 
@@ -462,14 +495,7 @@ const PetProfileContainer = React.forwardRef((props, ref) => {
   const allEditPetProfiles = [];
 
   for (const currentPetProfile of petProfiles) {
-    let initial_miles = 0;
-    let total_miles = currentPetProfile.check_ins.reduce(function (
-      previousValue,
-      currentValue
-    ) {
-      return previousValue + currentValue.miles_completed;
-    },
-    initial_miles);
+    const total_miles = currentPetProfile.stats.total_miles;
 
     if (
       currentPetProfile.birthday !== null &&
@@ -487,7 +513,10 @@ const PetProfileContainer = React.forwardRef((props, ref) => {
           birthday={currentPetProfile.birthday}
           breed={currentPetProfile.breed}
           pet_img_URL={currentPetProfile.pet_img_url}
-          check_ins={currentPetProfile.check_ins}
+          img_medium_url={currentPetProfile.img_medium_url}
+          img_thumb_url={currentPetProfile.img_thumb_url}
+          hike_count={currentPetProfile.stats.hike_count}
+          img_status={currentPetProfile.img_status}
           total_miles={total_miles}
           getPetProfiles={getPetProfiles}
         />
@@ -512,8 +541,11 @@ const PetProfileContainer = React.forwardRef((props, ref) => {
           gender={currentPetProfile.gender}
           birthday={currentPetProfile.birthday}
           breed={currentPetProfile.breed}
-          pet_img_URL={currentPetProfile.pet_imgURL}
-          check_ins={currentPetProfile.check_ins}
+          pet_img_URL={currentPetProfile.pet_img_url}
+          img_medium_url={currentPetProfile.img_medium_url}
+          img_thumb_url={currentPetProfile.img_thumb_url}
+          hike_count={currentPetProfile.stats.hike_count}
+          img_status={currentPetProfile.img_status}
           total_miles={total_miles}
           getPetProfiles={getPetProfiles}
         />
@@ -600,6 +632,7 @@ const PetProfileContainer = React.forwardRef((props, ref) => {
 // Dashboard Pet Profile container component
 const DashboardPetProfileContainer = React.forwardRef((props, ref) => {
   const [petProfiles, setPetProfiles] = React.useState([]);
+  usePendingPetImages(petProfiles, setPetProfiles);
 
   const session_login = document.querySelector("#login").innerText;
 
@@ -609,22 +642,18 @@ const DashboardPetProfileContainer = React.forwardRef((props, ref) => {
 
   const getPetProfiles = () => {
     if (session_login === "True") {
-      fetch("/pets.json")
-        .then((response) => response.json())
-        .then((data) => {
-          setPetProfiles(data.petProfiles);
-        });
+      getDashboardData().then((data) => {
+        setPetProfiles(data.petProfiles);
+      });
     }
   };
 
   React.useImperativeHandle(ref, () => ({
     getPetProfiles() {
       if (session_login === "True") {
-        fetch("/pets.json")
-          .then((response) => response.json())
-          .then((data) => {
-            setPetProfiles(data.petProfiles);
-          });
+        refreshDashboardData().then((data) => {
+          setPetProfiles(data.petProfiles);
+        });
       }
     },
   }));
@@ -633,14 +662,7 @@ const DashboardPetProfileContainer = React.forwardRef((props, ref) => {
   const allEditPetProfiles = [];
 
   for (const currentPetProfile of petProfiles) {
-    let initial_miles = 0;
-    let total_miles = currentPetProfile.check_ins.reduce(function (
-      previousValue,
-      currentValue
-    ) {
-      return previousValue + currentValue.miles_completed;
-    },
-    initial_miles);
+    const total_miles = currentPetProfile.stats.total_miles;
 
     if (
       currentPetProfile.birthday !== null &&
@@ -657,8 +679,11 @@ const DashboardPetProfileContainer = React.forwardRef((props, ref) => {
           gender={currentPetProfile.gender}
           birthday={currentPetProfile.birthday}
           breed={currentPetProfile.breed}
-          pet_img_URL={currentPetProfile.pet_imgURL}
-          check_ins={currentPetProfile.check_ins}
+          pet_img_URL={currentPetProfile.pet_img_url}
+          img_medium_url={currentPetProfile.img_medium_url}
+          img_thumb_url={currentPetProfile.img_thumb_url}
+          hike_count={currentPetProfile.stats.hike_count}
+          img_status={currentPetProfile.img_status}
           total_miles={total_miles}
           getPetProfiles={getPetProfiles}
         />
@@ -683,8 +708,11 @@ const DashboardPetProfileContainer = React.forwardRef((props, ref) => {
           gender={currentPetProfile.gender}
           birthday={currentPetProfile.birthday}
           breed={currentPetProfile.breed}
-          pet_img_URL={currentPetProfile.pet_imgURL}
-          check_ins={currentPetProfile.check_ins}
+          pet_img_URL={currentPetProfile.pet_img_url}
+          img_medium_url={currentPetProfile.img_medium_url}
+          img_thumb_url={currentPetProfile.img_thumb_url}
+          hike_count={currentPetProfile.stats.hike_count}
+          img_status={currentPetProfile.img_status}
           total_miles={total_miles}
           getPetProfiles={getPetProfiles}
         />
@@ -0,0 +1,299 @@
+"""Materialized hiking statistics for users and pets.
+
+hiking_stats holds each user's and pet's totals (miles, hikes, time,
+distinct hikes and weekly streaks) and hiking_stats_months their totals
+per month, so reading them doesn't scan any check ins. Routes that
+change check ins pass the check ins before and after the change to
+update_hiking_stats() in the same transaction. rebuild_hiking_stats()
+recomputes every row from the check ins (python3 rebuild_stats.py) and
+bumps the change version of every user whose stats it replaced.
+"""
+
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import select
+
+from model import db, ChangeVersion, CheckIn, Pet, PetCheckIn, HikingStats, HikingStatsMonth, increment_row
+
+
+# The parts of a check in its subjects' stats depend on. subjects is a
+# tuple of its user's and pets' subjects, e.g. ("user:1", "pet:2").
+CheckInStats = namedtuple("CheckInStats",
+                          ["subjects", "hike_id", "date_hiked", "miles_completed", "total_time"])
+
+EMPTY_STATS = {"total_miles": 0,
+               "hike_count": 0,
+               "total_time": 0,
+               "distinct_hikes": 0,
+               "streak_weeks": 0,
+               "longest_streak_weeks": 0,
+               "last_hiked": None,
+               "months": []}
+
+
+def get_subjects(user_id, pet_ids):
+    """Return the subjects of a check in, e.g. ("user:1", "pet:2", "pet:3")."""
+
+    return (f"user:{user_id}",) + tuple(f"pet:{pet_id}" for pet_id in sorted(pet_ids))
+
+
+def get_user_scopes(connection, subjects):
+    """Return the change version scopes of the users of subjects, e.g. {"user:1"}.
+
+    A pet's stats are served to its user, so a pet subject maps to its
+    user's scope; pets that no longer exist are left out.
+    """
+
+    user_ids = set()
+    pet_ids = set()
+
+    for subject in subjects:
+        kind, subject_id = subject.split(":")
+        (user_ids if kind == "user" else pet_ids).add(int(subject_id))
+
+    if pet_ids:
+        user_ids.update(connection.execute(select(Pet.user_id).where(Pet.pet_id.in_(pet_ids))).scalars())
+
+    return {f"user:{user_id}" for user_id in user_ids}
+
+
+def get_week(day):
+    """Return the number of the week (starting on Monday) a date is in."""
+
+    return (day.toordinal() - 1) // 7
+
+
+def get_streaks(dates):
+    """Return (streak, longest streak) of consecutive weeks with a date.
+
+    The streak is the run ending with the week of the latest date.
+    """
+
+    streak = longest_streak = 0
+    previous_week = None
+
+    for week in sorted({get_week(day) for day in dates}):
+        if previous_week is not None and week == previous_week + 1:
+            streak += 1
+        else:
+            streak = 1
+        longest_streak = max(longest_streak, streak)
+        previous_week = week
+
+    return streak, longest_streak
+
+
+def get_check_in_stats(check_in_ids):
+    """Return a CheckInStats for each of the check ins that exist, as stored in the database."""
+
+    if not check_in_ids:
+        return []
+
+    pet_ids = defaultdict(list)
+
+    for check_in_id, pet_id in (db.session.query(PetCheckIn.check_in_id, PetCheckIn.pet_id)
+                                .filter(PetCheckIn.check_in_id.in_(check_in_ids))):
+        pet_ids[check_in_id].append(pet_id)
+
+    rows = (db.session.query(CheckIn.check_in_id, CheckIn.user_id, CheckIn.hike_id,
+                             CheckIn.date_hiked, CheckIn.miles_completed, CheckIn.total_time)
+            .filter(CheckIn.check_in_id.in_(check_in_ids))
+            .all())
+
+    return [CheckInStats(get_subjects(user_id, pet_ids[check_in_id]),
+                         hike_id, date_hiked, miles_completed, total_time or 0.0)
+            for check_in_id, user_id, hike_id, date_hiked, miles_completed, total_time in rows]
+
+
+class StatsTotals:
+    """Miles, hike count and time per subject and per (subject, month)."""
+
+    def __init__(self):
+        self.subjects = defaultdict(lambda: [0.0, 0, 0.0])
+        self.months = defaultdict(lambda: [0.0, 0, 0.0])
+
+    def add(self, check_in, sign=1):
+        """Add a CheckInStats to its subjects' totals, or subtract it if sign is -1."""
+
+        month = check_in.date_hiked.replace(day=1)
+
+        for subject in check_in.subjects:
+            for totals in (self.subjects[subject], self.months[(subject, month)]):
+                totals[0] += sign * check_in.miles_completed
+                totals[1] += sign
+                totals[2] += sign * check_in.total_time
+
+
+def refresh_subject(connection, subject):
+    """Recompute a subject's distinct hikes, streaks and last hike date.
+
+    These can't be updated from the changed check ins alone, so they're
+    recomputed from the subject's (hike, date) pairs, which for a user are
+    read from the (user_id, date_hiked) index.
+    """
+
+    kind, subject_id = subject.split(":")
+    stmt = select(CheckIn.hike_id, CheckIn.date_hiked).distinct()
+
+    if kind == "pet":
+        stmt = (stmt.join(PetCheckIn, PetCheckIn.check_in_id == CheckIn.check_in_id)
+                    .where(PetCheckIn.pet_id == int(subject_id)))
+    else:
+        stmt = stmt.where(CheckIn.user_id == int(subject_id))
+
+    rows = connection.execute(stmt).all()
+    dates = [date_hiked for _, date_hiked in rows]
+    streak, longest_streak = get_streaks(dates)
+
+    table = HikingStats.__table__
+    connection.execute(table.update()
+                            .where(table.c.subject == subject)
+                            .values(distinct_hikes=len({hike_id for hike_id, _ in rows}),
+                                    streak_weeks=streak,
+                                    longest_streak_weeks=longest_streak,
+                                    last_hiked=max(dates, default=None)))
+
+
+def update_hiking_stats(removed=(), added=()):
+    """Update the stats of the subjects of changed check ins.
+
+    removed and added are lists of CheckInStats from get_check_in_stats():
+    the changed check ins before and after the change (an edited check in
+    is in both). Totals are changed by the difference with atomic
+    increments; call this after the change is flushed and before it's
+    committed.
+    """
+
+    if sorted(removed) == sorted(added):
+        return
+
+    connection = db.session.connection()
+    totals = StatsTotals()
+
+    for check_in in removed:
+        totals.add(check_in, -1)
+    for check_in in added:
+        totals.add(check_in)
+
+    stats_table = HikingStats.__table__
+    months_table = HikingStatsMonth.__table__
+
+    for subject, (miles, hike_count, total_time) in sorted(totals.subjects.items()):
+        increment_row(connection, stats_table, {"subject": subject},
+                      {"total_miles": miles, "hike_count": hike_count, "total_time": total_time})
+
+    for (subject, month), (miles, hike_count, total_time) in sorted(totals.months.items()):
+        increment_row(connection, months_table, {"subject": subject, "month": month},
+                      {"miles": miles, "hike_count": hike_count, "total_time": total_time})
+
+    subjects = sorted(totals.subjects)
+
+    connection.execute(months_table.delete().where(months_table.c.subject.in_(subjects),
+                                                   months_table.c.hike_count <= 0))
+    connection.execute(stats_table.delete().where(stats_table.c.subject.in_(subjects),
+                                                  stats_table.c.hike_count <= 0))
+
+    for subject in subjects:
+        refresh_subject(connection, subject)
+
+
+def delete_hiking_stats(subjects):
+    """Delete the stats of subjects that are being deleted (e.g. a pet)."""
+
+    connection = db.session.connection()
+
+    for table in (HikingStats.__table__, HikingStatsMonth.__table__):
+        connection.execute(table.delete().where(table.c.subject.in_(subjects)))
+
+
+def rebuild_hiking_stats(connection):
+    """Replace all stats with stats recomputed from the check ins.
+
+    Return the number of subjects with stats.
+    """
+
+    pet_ids = defaultdict(list)
+    for check_in_id, pet_id in connection.execute(select(PetCheckIn.check_in_id, PetCheckIn.pet_id)):
+        pet_ids[check_in_id].append(pet_id)
+
+    totals = StatsTotals()
+    hike_ids = defaultdict(set)
+    dates = defaultdict(set)
+
+    for check_in_id, user_id, hike_id, date_hiked, miles_completed, total_time in connection.execute(
+            select(CheckIn.check_in_id, CheckIn.user_id, CheckIn.hike_id,
+                   CheckIn.date_hiked, CheckIn.miles_completed, CheckIn.total_time)):
+        check_in = CheckInStats(get_subjects(user_id, pet_ids[check_in_id]),
+                                hike_id, date_hiked, miles_completed, total_time or 0.0)
+        totals.add(check_in)
+
+        for subject in check_in.subjects:
+            hike_ids[subject].add(hike_id)
+            dates[subject].add(date_hiked)
+
+    stats_rows = []
+    for subject, (miles, hike_count, total_time) in totals.subjects.items():
+        streak, longest_streak = get_streaks(dates[subject])
+        stats_rows.append({"subject": subject,
+                           "total_miles": miles,
+                           "hike_count": hike_count,
+                           "total_time": total_time,
+                           "distinct_hikes": len(hike_ids[subject]),
+                           "streak_weeks": streak,
+                           "longest_streak_weeks": longest_streak,
+                           "last_hiked": max(dates[subject])})
+
+    month_rows = [{"subject": subject, "month": month,
+                   "miles": miles, "hike_count": hike_count, "total_time": total_time}
+                  for (subject, month), (miles, hike_count, total_time) in totals.months.items()]
+
+    # Users whose stats were rebuilt: those with stats before or after
+    subjects = set(connection.execute(select(HikingStats.subject)).scalars())
+    subjects.update(row["subject"] for row in stats_rows)
+
+    for table, rows in ((HikingStats.__table__, stats_rows),
+                        (HikingStatsMonth.__table__, month_rows)):
+        connection.execute(table.delete())
+        if rows:
+            connection.execute(table.insert(), rows)
+
+    # Their cached stats responses are stale now
+    ChangeVersion.bump_versions(connection, get_user_scopes(connection, subjects))
+
+    return len(stats_rows)
+
+
+def get_hiking_stats(subjects):
+    """Return a dictionary of subject -> stats JSON for each subject.
+
+    streak_weeks is the streak ending with the week of last_hiked; it's
+    only still going if that's this week or last week. The JSON doesn't
+    depend on today's date, so it stays valid for its ETag.
+    """
+
+    stats_by_subject = HikingStats.get_stats_by_subject(subjects)
+    stats_json = {}
+
+    for subject in subjects:
+        if subject not in stats_by_subject:
+            stats_json[subject] = dict(EMPTY_STATS, months=[])
+            continue
+
+        stats, months = stats_by_subject[subject]
+
+        stats_json[subject] = {
+            "total_miles": round(stats.total_miles, 2),
+            "hike_count": stats.hike_count,
+            "total_time": round(stats.total_time, 2),
+            "distinct_hikes": stats.distinct_hikes,
+            "streak_weeks": stats.streak_weeks,
+            "longest_streak_weeks": stats.longest_streak_weeks,
+            "last_hiked": stats.last_hiked.isoformat(),
+            "months": [{"month": month.month.strftime("%Y-%m"),
+                        "miles": round(month.miles, 2),
+                        "hike_count": month.hike_count,
+                        "total_time": round(month.total_time, 2)}
+                       for month in months],
+        }
+
+    return stats_json
@@ -0,0 +1,110 @@
+"""Typeahead suggestions for hike names, areas and cities."""
+
+from bisect import bisect_left
+from collections import OrderedDict
+import heapq
+import threading
+
+from search import tokenize
+
+
+# Catalog fields suggested, and the type returned with each suggestion
+SUGGEST_FIELDS = {"hike_name": "hike", "area": "area", "city": "city"}
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+# Number of (prefix, limit) results kept in the LRU
+CACHE_SIZE = 1024
+
+
+class SuggestIndex:
+    """Sorted array of every word-suffix of hike names, areas and cities.
+
+    "Cedar Grove Trail" is indexed under "cedar grove trail", "grove trail"
+    and "trail", so a prefix lookup is a bisect into the array and matches
+    the start of any word. The array is rebuilt when the catalog changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.generation = None
+
+        self._keys = []  # sorted word-suffix keys
+        self._entries = []  # (key, word position, suggestion) for each key
+        self._cache = OrderedDict()
+
+    def sync(self, snapshot):
+        """Rebuild the index if the catalog has changed."""
+
+        if snapshot.generation == self.generation:
+            return
+
+        suggestions = {}
+
+        for hike in snapshot.hikes:
+            for field, suggestion_type in SUGGEST_FIELDS.items():
+                label = hike[field]
+                if not label:
+                    continue
+
+                if suggestion_type == "hike":
+                    suggestion = {"type": "hike", "label": label, "hike_id": hike["hike_id"]}
+                    suggestions[(suggestion_type, hike["hike_id"])] = suggestion
+                else:
+                    suggestions.setdefault((suggestion_type, label),
+                                           {"type": suggestion_type, "label": label})
+
+        entries = []
+
+        for suggestion in suggestions.values():
+            words = tokenize(suggestion["label"])
+            for position in range(len(words)):
+                entries.append((" ".join(words[position:]), position, suggestion))
+
+        entries.sort(key=lambda entry: entry[0])
+
+        with self._lock:
+            self._entries = entries
+            self._keys = [key for key, _, _ in entries]
+            self._cache.clear()
+            self.generation = snapshot.generation
+
+    def suggest(self, prefix, limit=DEFAULT_LIMIT):
+        """Return up to limit suggestions whose words start with prefix.
+
+        Labels starting with the prefix come first, then shorter labels.
+        """
+
+        prefix = " ".join(tokenize(prefix))
+
+        if not prefix:
+            return []
+
+        with self._lock:
+            cache_key = (prefix, limit)
+
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                return self._cache[cache_key]
+
+            matches = {}
+
+            for i in range(bisect_left(self._keys, prefix), len(self._keys)):
+                key, position, suggestion = self._entries[i]
+                if not key.startswith(prefix):
+                    break
+
+                suggestion_id = id(suggestion)
+                if suggestion_id not in matches or position < matches[suggestion_id][0]:
+                    matches[suggestion_id] = (position, suggestion)
+
+            ranked = heapq.nsmallest(limit, matches.values(),
+                                     key=lambda match: (match[0] > 0, len(match[1]["label"]), match[1]["label"]))
+            suggestions = [suggestion for _, suggestion in ranked]
+
+            self._cache[cache_key] = suggestions
+            if len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+            return suggestions
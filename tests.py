@@ -1,8 +1,32 @@
 from unittest import TestCase
-from flask import session
-from server import app
-from model import (connect_to_db, db, example_data, User)
+from flask import session, g
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.exc import IntegrityError
+from flask import jsonify
+from server import app, catalog_cache, create_app
+import server
+import schemas
+from model import (connect_to_db, db, example_data, User, Hike, Pet, CheckIn, Comment,
+                   BookmarksList, PetCheckIn, HikeBookmarksList, HikingStats, HikingStatsMonth,
+                   HikeActivity, ChangeVersion, get_engine_options)
+from migrations import LATEST_VERSION, get_version, stamp, upgrade
+from instrumentation import N_PLUS_ONE_THRESHOLD
+from stats import get_streaks, rebuild_hiking_stats
+from activity import get_trending_weight, rebuild_hike_activity
+from uploads import MAX_ATTEMPTS, LocalImageClient
+from sessions import MemorySessionStore, get_session_key, get_user_key
+from catalog import CatalogSnapshot
+from facets import FacetIndex
+from catalog_loader import CatalogRecordError, iter_json_array, load_catalog
+from profile_startup import DEFERRED_MODULES, get_import_times
+from datetime import datetime
+import io
+import json
 import os
+import subprocess
+import sys
+import tempfile
+from PIL import Image
 
 os.system("dropdb testdb --if-exists")
 os.system("createdb testdb")
@@ -93,6 +117,1751 @@ class FlaskTestsDatabase(TestCase):
         self.assertIn(b"Cedar Grove and Vista View Point in Griffith Park", result.data)
 
 
+class CatalogCacheTests(TestCase):
+    """Tests for the hike catalog cache."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+        catalog_cache.clear()
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def test_all_hikes_json_is_cached(self):
+        """Test repeated catalog requests are served from the cache."""
+
+        first = self.client.get("/all_hikes.json")
+        second = self.client.get("/all_hikes.json")
+
+        self.assertEqual(first.data, second.data)
+        self.assertIn(b"Cedar Grove and Vista View Point in Griffith Park", second.data)
+        self.assertEqual(catalog_cache.misses, 1)
+        self.assertEqual(catalog_cache.hits, 1)
+
+    def test_hike_change_invalidates_cache(self):
+        """Test editing a hike bumps the catalog version and rebuilds the cache."""
+
+        self.client.get("/all_hikes.json")
+
+        hike = Hike.get_hike_by_id(1)
+        hike.hike_name = "Renamed Hike"
+        db.session.commit()
+
+        result = self.client.get("/all_hikes.json")
+
+        self.assertIn(b"Renamed Hike", result.data)
+        self.assertEqual(catalog_cache.misses, 2)
+
+    def test_catalog_version_read_once_per_request(self):
+        """Test a catalog request reads the catalog version once, however often it uses the cache."""
+
+        version_queries = []
+
+        def count_version_query(conn, cursor, statement, *args):
+            if "change_versions" in statement:
+                version_queries.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count_version_query)
+        try:
+            for path in ("/all_hikes.json", "/hikes/advanced_search?keyword=cedar&difficulty=easy"):
+                with self.subTest(path=path):
+                    version_queries.clear()
+                    self.assertEqual(self.client.get(path).status_code, 200)
+                    self.assertEqual(len(version_queries), 1)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_version_query)
+
+    def test_shared_version_invalidates_cache(self):
+        """Test a catalog change made outside this process's ORM session rebuilds the cache."""
+
+        self.client.get("/all_hikes.json")
+
+        # As import_catalog.py writes it, from another process
+        with db.engine.begin() as connection:
+            connection.execute(Hike.__table__.update().where(Hike.hike_id == 1)
+                               .values(hike_name="Imported Hike"))
+            ChangeVersion.bump_versions(connection, {"catalog"})
+
+        result = self.client.get("/all_hikes.json")
+
+        self.assertIn(b"Imported Hike", result.data)
+        self.assertEqual(catalog_cache.misses, 2)
+
+
+class CatalogImportTests(TestCase):
+    """Tests for the streaming catalog loader."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+        catalog_cache.clear()
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def load(self, text):
+        with db.engine.begin() as connection:
+            return load_catalog(connection, io.StringIO(text), batch_size=2)
+
+    def test_stream_json_array(self):
+        """Test a JSON array is parsed the same in small chunks."""
+
+        text = ' [{"hike_name": "A", "miles": 12.5}, {"hike_name": "B [1]"}, 3 ] '
+
+        self.assertEqual(list(iter_json_array(io.StringIO(text), chunk_size=4)),
+                         [{"hike_name": "A", "miles": 12.5}, {"hike_name": "B [1]"}, 3])
+
+        with self.assertRaises(CatalogRecordError):
+            list(iter_json_array(io.StringIO('[{"hike_name": "A"} {"hike_name": "B"}]')))
+
+    def test_import_upserts_hikes(self):
+        """Test importing adds new hikes, updates changed ones and skips invalid ones."""
+
+        hike = Hike.get_hike_by_id(1)
+        changed = {column: getattr(hike, column) for column in
+                   ["hike_name", "area", "difficulty", "leash_rule", "description", "address",
+                    "latitude", "longitude", "city", "state", "path", "parking", "resources",
+                    "hike_imgURL"]}
+        changed["miles"] = "2.5"
+        new = dict(changed, hike_name="New Hike", latitude=" 34.5 ", miles=4)
+        records = [changed, new, dict(new, latitude="north"), dict(new, address="")]
+        text = "\n".join(json.dumps(record) for record in records)
+
+        self.client.get("/all_hikes.json")
+        result = self.load(text)
+
+        self.assertEqual((result.inserted, result.updated, result.unchanged), (1, 1, 0))
+        self.assertEqual([number for number, _ in result.errors], [3, 4])
+
+        db.session.expire_all()
+        new_hike = Hike.query.filter_by(hike_name="New Hike").one()
+        self.assertEqual(Hike.get_hike_by_id(1).miles, 2.5)
+        self.assertEqual((new_hike.latitude, new_hike.lat, new_hike.miles), ("34.5", 34.5, 4.0))
+        self.assertIsNotNone(HikeActivity.query.get(new_hike.hike_id))
+        self.assertIn(b"New Hike", self.client.get("/all_hikes.json").data)
+
+        result = self.load(text)
+
+        self.assertEqual((result.inserted, result.updated, result.unchanged), (0, 0, 2))
+
+
+class ReplicaRoutingTests(TestCase):
+    """Tests for sending read-only endpoints' queries to a read replica."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+        app.config['SECRET_KEY'] = 'key'
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+        # A SQLite file stands in for the replica, with a differently named hike
+        replica_uri = f"sqlite:///{tempfile.mkdtemp()}/replica.db"
+        replica_engine = create_engine(replica_uri)
+        db.metadata.create_all(replica_engine)
+        with replica_engine.begin() as connection:
+            connection.execute(Hike.__table__.insert().values(
+                hike_id=1, hike_name="Replica Hike", address="1 Replica Road"))
+        replica_engine.dispose()
+
+        app.config['DATABASE_REPLICA_URI'] = replica_uri
+        catalog_cache.clear()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['login'] = True
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        app.config['DATABASE_REPLICA_URI'] = None
+        catalog_cache.clear()
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def test_read_only_endpoints_use_replica(self):
+        """Test catalog endpoints read the replica and other endpoints the primary."""
+
+        result = self.client.get("/hikes/1.json")
+        self.assertEqual(result.get_json()["hike"]["hike_name"], "Replica Hike")
+
+        result = self.client.get("/pets.json")
+        self.assertEqual(result.get_json()["petProfiles"][0]["pet_name"], "Test Pet 1")
+
+    def test_falls_back_to_primary(self):
+        """Test read-only endpoints use the primary when the replica is unreachable."""
+
+        app.config['DATABASE_REPLICA_URI'] = "sqlite:////nonexistent/replica.db"
+
+        result = self.client.get("/hikes/1.json")
+
+        self.assertEqual(result.get_json()["hike"]["hike_name"],
+                         "Cedar Grove and Vista View Point in Griffith Park")
+        self.assertFalse(server.replica_router.is_available())
+
+    def test_engine_options(self):
+        """Test pool settings and the statement timeout are passed to Postgres engines only."""
+
+        config = {"DATABASE_POOL_SIZE": 3, "DATABASE_STATEMENT_TIMEOUT_MS": 2500}
+        options = get_engine_options("postgresql://replica.internal/pupjourney", config)
+
+        self.assertEqual(options["pool_size"], 3)
+        self.assertTrue(options["pool_pre_ping"])
+        self.assertEqual(options["connect_args"], {"options": "-c statement_timeout=2500"})
+        self.assertEqual(get_engine_options("sqlite:///replica.db", config), {"pool_pre_ping": True})
+
+
+class AdvancedSearchTests(TestCase):
+    """Tests for keyword, advanced and map search."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def test_advanced_search_facets(self):
+        """Test search results come with per-facet counts."""
+
+        result = self.client.get("/hikes/advanced_search?state=California&difficulty=hard&parking=free")
+        self.assertEqual(result.get_json()["hikes"], [])
+
+        facets = result.get_json()["facets"]
+        self.assertEqual(facets["difficulty"], {"easy": 1})
+        self.assertEqual(facets["parking"], {})
+
+    def test_search(self):
+        """Test search matches names, areas and descriptions with typos."""
+
+        for search_term, hike_ids in [("griffith", [1]),
+                                      ("vista view", [1]),
+                                      ("grifith park", [1]),
+                                      ("picni", [1]),
+                                      ("los angeles waterfall", [])]:
+            result = self.client.get("/hikes/search.json", query_string={"search_term": search_term})
+            self.assertEqual([hike["hike_id"] for hike in result.get_json()["hikes"]], hike_ids)
+
+    def test_empty_search_returns_all_hikes(self):
+        """Test an empty or stopword-only search term returns the whole catalog."""
+
+        db.session.add(Hike(hike_name="Another Hike", area="Los Angeles Area - Griffith Park",
+                            difficulty="moderate", leash_rule="On leash", address="Los Angeles, CA",
+                            city="Los Angeles", state="California", miles=4.0, parking="Free lot"))
+        db.session.commit()
+
+        for search_term in ["", "the", "  "]:
+            result = self.client.get("/hikes/search.json", query_string={"search_term": search_term})
+            self.assertEqual([hike["hike_id"] for hike in result.get_json()["hikes"]], [2, 1])
+
+    def test_suggest(self):
+        """Test suggestions match the start of any word."""
+
+        result = self.client.get("/hikes/suggest?q=griff")
+        self.assertEqual(result.get_json()["suggestions"], [
+            {"type": "area", "label": "Los Angeles Area - Griffith Park"},
+            {"type": "hike", "label": "Cedar Grove and Vista View Point in Griffith Park", "hike_id": 1},
+        ])
+
+        result = self.client.get("/hikes/suggest?q=los")
+        self.assertEqual(result.get_json()["suggestions"][0], {"type": "city", "label": "Los Angeles"})
+
+    def test_nearby_and_in_bbox(self):
+        """Test radius and bounding box queries return hikes with distances."""
+
+        result = self.client.get("/hikes/nearby?lat=34.1184&lng=-118.3004&radius=5")
+        hikes = result.get_json()["hikes"]
+        self.assertEqual([hike["hike_id"] for hike in hikes], [1])
+        self.assertAlmostEqual(hikes[0]["distance"], 0.82, places=1)
+
+        result = self.client.get("/hikes/nearby?lat=45.5&lng=-122.7&radius=50")
+        self.assertEqual(result.get_json()["hikes"], [])
+
+        result = self.client.get("/hikes/in_bbox?south=34&west=-118.5&north=34.2&east=-118")
+        self.assertEqual([hike["hike_id"] for hike in result.get_json()["hikes"]], [1])
+
+        result = self.client.get("/hikes/in_bbox?south=34&west=-118.5")
+        self.assertEqual(result.status_code, 400)
+
+    def test_hike_change_updates_facets(self):
+        """Test the facet index follows hike changes."""
+
+        self.assertEqual(self.client.get("/California/city_area.json").get_json(),
+                         {"areas": ["Los Angeles Area - Griffith Park"], "cities": ["Los Angeles"]})
+
+        hike = Hike.get_hike_by_id(1)
+        hike.difficulty = "hard"
+        hike.state = "Oregon"
+        db.session.commit()
+
+        result = self.client.get("/hikes/advanced_search?difficulty=hard")
+        self.assertEqual([hike["hike_id"] for hike in result.get_json()["hikes"]], [1])
+        self.assertEqual(self.client.get("/California/city_area.json").get_json(),
+                         {"areas": [], "cities": []})
+
+    def test_facet_bitsets_follow_catalog_positions(self):
+        """Test facet bitsets are as long as the catalog, whatever the hike_ids."""
+
+        hikes = [{"hike_id": hike_id, "difficulty": difficulty, "leash_rule": "On leash",
+                  "area": "Area", "city": "City", "state": "Oregon", "parking": "Free lot",
+                  "miles": miles}
+                 for hike_id, difficulty, miles in [(10 ** 9, "easy", 2.0), (3, "hard", 5.0),
+                                                    (10 ** 6, "easy", 9.0)]]
+        index = FacetIndex()
+        index.sync(CatalogSnapshot(1, 1, hikes, {hike["hike_id"]: hike for hike in hikes}, b""))
+
+        hike_ids, counts = index.search({"difficulty": ["easy"]}, within=[3, 10 ** 6, 10 ** 9],
+                                        length_max=8)
+        self.assertEqual(hike_ids, [10 ** 9])
+        self.assertEqual(counts["difficulty"], {"easy": 1, "hard": 1})
+        self.assertEqual(index.search({}, within=[3, 42])[0], [3])
+        self.assertEqual(index.search({})[0], [10 ** 9, 3, 10 ** 6])
+
+        bitsets = index._values["difficulty"].values()
+        self.assertLessEqual(max(bitset.bit_length() for bitset in bitsets), len(hikes))
+
+    def test_facet_index_updates_changed_hikes(self):
+        """Test editing hikes in place updates their bits without rebuilding the index."""
+
+        hikes = [{"hike_id": hike_id, "difficulty": "easy", "leash_rule": "On leash", "area": "Area",
+                  "city": "City", "state": "Oregon", "parking": "Free lot", "miles": 2.0}
+                 for hike_id in (5, 2, 9)]
+        index = FacetIndex()
+        index.sync(CatalogSnapshot(1, 1, hikes, {}, b""))
+
+        edited = [dict(hikes[0]), dict(hikes[1], difficulty="hard", city="Town"), dict(hikes[2])]
+        index.sync(CatalogSnapshot(2, 2, edited, {}, b""))
+
+        self.assertEqual(index.rebuilds, 1)
+        self.assertEqual(index.search({"difficulty": ["hard"]})[0], [2])
+        self.assertEqual(index.search({})[1]["city"], {"City": 2, "Town": 1})
+        self.assertEqual(index.get_values("city", "state", "Oregon"), ["City", "Town"])
+
+        # Moving a hike shifts the positions after it
+        reordered = [edited[1], edited[0], edited[2]]
+        index.sync(CatalogSnapshot(3, 3, reordered, {}, b""))
+
+        self.assertEqual(index.rebuilds, 2)
+        self.assertEqual(index.search({"difficulty": ["easy"]})[0], [5, 9])
+
+
+class ConditionalGetTests(TestCase):
+    """Tests for ETag / If-None-Match support on JSON endpoints."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+        app.config['SECRET_KEY'] = 'key'
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['login'] = True
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def test_not_modified(self):
+        """Test a matching If-None-Match returns 304 with no body."""
+
+        result = self.client.get("/user_check_ins.json")
+        etag = result.headers["ETag"]
+        self.assertEqual(result.headers["Cache-Control"], "private, no-cache")
+
+        result = self.client.get("/user_check_ins.json", headers={"If-None-Match": etag})
+        self.assertEqual(result.status_code, 304)
+        self.assertEqual(result.data, b"")
+
+    def test_write_changes_etag(self):
+        """Test a new comment changes the ETag of the hike's comments."""
+
+        result = self.client.get("/hikes/1/comments.json")
+        etag = result.headers["ETag"]
+        self.assertEqual(result.headers["Cache-Control"], "public, no-cache")
+
+        self.client.post("/add-comment", json={"hikeId": 1, "commentBody": "Shady trail"})
+
+        result = self.client.get("/hikes/1/comments.json", headers={"If-None-Match": etag})
+        self.assertEqual(result.status_code, 200)
+        self.assertIn(b"Shady trail", result.data)
+
+
+class DashboardQueryTests(TestCase):
+    """Tests for the dashboard JSON endpoints' queries."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+        app.config['SECRET_KEY'] = 'key'
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['login'] = True
+
+        self.query_count = 0
+        event.listen(db.engine, "before_cursor_execute", self.count_query)
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        event.remove(db.engine, "before_cursor_execute", self.count_query)
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def count_query(self, *args):
+        self.query_count += 1
+
+    def add_pets_with_check_ins(self, num_pets):
+        """Add pets for the test user, each with a few check ins."""
+
+        user = User.get_user_by_email("test@test")
+        hike = Hike.get_hike_by_id(1)
+
+        for i in range(num_pets):
+            pet = Pet(user=user, pet_name=f"Pet {i}", check_ins=[])
+            db.session.add(pet)
+            for day in range(1, 4):
+                check_in = CheckIn(user=user, hike=hike, pets=[pet], date_hiked=datetime(2022, 1, day),
+                                   miles_completed=1.0, total_time=None, notes="")
+                db.session.add(check_in)
+
+        db.session.commit()
+        db.session.remove()
+
+    def test_bootstrap_matches_endpoints(self):
+        """Test the bootstrap payload matches the individual endpoints."""
+
+        bootstrap = self.client.get("/dashboard/bootstrap.json").get_json()
+
+        for key, url in [("checkIns", "/user_check_ins.json"),
+                         ("petCheckIns", "/check-ins-by-pets.json"),
+                         ("bookmarksLists", "/user_bookmarks_lists.json"),
+                         ("comments", "/user_comments.json"),
+                         ("petProfiles", "/pets.json")]:
+            self.assertEqual(bootstrap[key], self.client.get(url).get_json()[key])
+
+    def test_bootstrap_query_count(self):
+        """Test the bootstrap query count doesn't grow with the user's data."""
+
+        self.client.get("/dashboard/bootstrap.json")
+        expected = self.query_count
+
+        self.add_pets_with_check_ins(5)
+
+        self.query_count = 0
+        self.client.get("/dashboard/bootstrap.json")
+        self.assertEqual(self.query_count, expected)
+
+    def test_check_ins_by_pets_query_count(self):
+        """Test /check-ins-by-pets.json doesn't issue a query per pet."""
+
+        self.client.get("/check-ins-by-pets.json")
+        expected = self.query_count
+
+        self.add_pets_with_check_ins(10)
+
+        self.query_count = 0
+        result = self.client.get("/check-ins-by-pets.json")
+        self.assertEqual(self.query_count, expected)
+
+        pet_check_ins = result.get_json()["petCheckIns"]
+        self.assertEqual(len(pet_check_ins), 11)
+        for pet_check_in in pet_check_ins:
+            dates = [check_in["date_hiked"] for check_in in pet_check_in["data"]]
+            self.assertEqual(dates, sorted(dates, reverse=True))
+
+
+class AddCheckInTests(TestCase):
+    """Tests for adding check ins."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+        app.config['SECRET_KEY'] = 'key'
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['login'] = True
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def test_add_check_ins(self):
+        """Test adding many check ins in one request."""
+
+        check_ins = [{"hikeId": 1, "petIds": [1], "dateHiked": f"2022-04-{day:02}",
+                      "milesCompleted": 2.3, "totalTime": "", "notes": ""}
+                     for day in range(1, 21)]
+
+        result = self.client.post("/add-check-ins", json={"checkIns": check_ins})
+        check_ins_added = result.get_json()["checkInsAdded"]
+
+        self.assertEqual(len(check_ins_added), 20)
+        self.assertEqual(check_ins_added[0]["pets"], [{"pet_id": 1}])
+        self.assertEqual(len(Pet.get_pet_by_id(1).check_ins), 21)
+
+    def test_add_check_in_with_other_users_pet(self):
+        """Test a check in with another user's pet is rejected."""
+
+        other_user = User(full_name="Test User 2", email="test2@test", password="test")
+        other_pet = Pet(user=other_user, pet_name="Test Pet 2", check_ins=[])
+        db.session.add_all([other_user, other_pet])
+        db.session.commit()
+        other_pet_id = other_pet.pet_id
+
+        result = self.client.post("/add-check-in", json={
+            "hikeId": "1",
+            "allPetOptions": [{"select": True, "pet_name": "Test Pet 2", "pet_id": other_pet_id}],
+            "dateHiked": "2022-04-01",
+            "milesCompleted": "2.3",
+            "totalTime": "",
+            "notes": ""
+        })
+
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(len(Pet.get_pet_by_id(other_pet_id).check_ins), 0)
+
+
+class PaginationTests(TestCase):
+    """Tests for keyset pagination of list endpoints."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+        app.config['SECRET_KEY'] = 'key'
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['login'] = True
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def get_all_pages(self, url, key):
+        items = []
+        cursor = None
+
+        while True:
+            query_string = {"limit": 3}
+            if cursor:
+                query_string["cursor"] = cursor
+
+            data = self.client.get(url, query_string=query_string).get_json()
+            self.assertLessEqual(len(data[key]), 3)
+            items.extend(data[key])
+
+            cursor = data["nextCursor"]
+            if not cursor:
+                return items
+
+    def test_check_in_pages(self):
+        """Test paging through check ins returns each check in once, in order."""
+
+        # Several check ins share a date, so pages must break ties by id
+        check_ins = [{"hikeId": 1, "petIds": [1], "dateHiked": f"2022-04-{day // 3 + 1:02}",
+                      "milesCompleted": 2.3, "totalTime": "", "notes": ""}
+                     for day in range(10)]
+        self.client.post("/add-check-ins", json={"checkIns": check_ins})
+
+        check_ins = self.client.get("/user_check_ins.json").get_json()["checkIns"]
+        pages = self.get_all_pages("/user_check_ins.json", "checkIns")
+
+        self.assertEqual(len(pages), 11)
+        self.assertEqual(len({check_in["check_in_id"] for check_in in pages}), 11)
+        self.assertEqual([check_in["date_hiked"] for check_in in pages],
+                         [check_in["date_hiked"] for check_in in check_ins])
+
+    def test_hike_pages(self):
+        """Test paging through all hikes returns them by name."""
+
+        hikes = self.get_all_pages("/all_hikes.json", "hikes")
+        hike_names = [hike["hike_name"] for hike in hikes]
+
+        self.assertEqual(hike_names, sorted(hike_names, key=str.lower))
+        self.assertEqual(len(hikes), Hike.query.count())
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor is rejected."""
+
+        result = self.client.get("/user_comments.json?cursor=not-a-cursor")
+
+        self.assertEqual(result.status_code, 400)
+
+
+# The schema db.create_all() made before migrations.py was added, which
+# python3 migrate.py has to bring up to the current models
+BASELINE_SCHEMA = [
+    """
+    CREATE TABLE users (
+        user_id SERIAL PRIMARY KEY,
+        full_name VARCHAR NOT NULL,
+        email VARCHAR NOT NULL UNIQUE,
+        password VARCHAR NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE pets (
+        pet_id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users (user_id),
+        pet_name TEXT NOT NULL,
+        gender VARCHAR,
+        birthday DATE,
+        breed VARCHAR,
+        pet_img_url VARCHAR,
+        img_public_id VARCHAR
+    )
+    """,
+    """
+    CREATE TABLE hikes (
+        hike_id SERIAL PRIMARY KEY,
+        hike_name VARCHAR NOT NULL,
+        area VARCHAR,
+        difficulty VARCHAR,
+        leash_rule VARCHAR,
+        description TEXT,
+        latitude VARCHAR,
+        longitude VARCHAR,
+        address TEXT NOT NULL,
+        city VARCHAR,
+        state VARCHAR,
+        miles DOUBLE PRECISION,
+        path VARCHAR,
+        parking VARCHAR,
+        resources TEXT,
+        "hike_imgURL" VARCHAR
+    )
+    """,
+    """
+    CREATE TABLE comments (
+        comment_id SERIAL PRIMARY KEY,
+        hike_id INTEGER NOT NULL REFERENCES hikes (hike_id),
+        user_id INTEGER NOT NULL REFERENCES users (user_id),
+        body TEXT NOT NULL,
+        date_created TIMESTAMP NOT NULL,
+        edit BOOLEAN NOT NULL,
+        date_edited TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE check_ins (
+        check_in_id SERIAL PRIMARY KEY,
+        hike_id INTEGER NOT NULL REFERENCES hikes (hike_id),
+        user_id INTEGER NOT NULL REFERENCES users (user_id),
+        date_hiked DATE NOT NULL,
+        miles_completed DOUBLE PRECISION NOT NULL,
+        total_time DOUBLE PRECISION,
+        notes TEXT
+    )
+    """,
+    """
+    CREATE TABLE bookmarks_lists (
+        bookmarks_list_id SERIAL PRIMARY KEY,
+        bookmarks_list_name VARCHAR NOT NULL UNIQUE,
+        user_id INTEGER NOT NULL REFERENCES users (user_id)
+    )
+    """,
+    """
+    CREATE TABLE pets_check_ins (
+        pet_check_in_id SERIAL PRIMARY KEY,
+        pet_id INTEGER NOT NULL REFERENCES pets (pet_id),
+        check_in_id INTEGER NOT NULL REFERENCES check_ins (check_in_id)
+    )
+    """,
+    """
+    CREATE TABLE hikes_bookmarks_lists (
+        hike_bookmarks_list_id SERIAL PRIMARY KEY,
+        hike_id INTEGER NOT NULL REFERENCES hikes (hike_id),
+        bookmarks_list_id INTEGER NOT NULL REFERENCES bookmarks_lists (bookmarks_list_id)
+    )
+    """,
+]
+
+
+class SchemaTests(TestCase):
+    """Tests for the schema's indexes and migrations."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def get_plan_index_names(self, query):
+        """Return the names of the indexes in a query's plan."""
+
+        statement = query.statement.compile(dialect=db.engine.dialect,
+                                            compile_kwargs={"literal_binds": True})
+
+        # The test tables are tiny, so without this the planner would
+        # sequentially scan every one of them
+        db.session.execute("SET enable_seqscan = off")
+        plan = db.session.execute(f"EXPLAIN (FORMAT JSON) {statement}").scalar()
+
+        index_names = set()
+        nodes = [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            if "Index Name" in node:
+                index_names.add(node["Index Name"])
+            nodes.extend(node.get("Plans", []))
+
+        return index_names
+
+    def test_hot_queries_use_indexes(self):
+        """Test each frequently filtered column is looked up with its index."""
+
+        hot_queries = [
+            (db.session.query(CheckIn).filter_by(user_id=1), "ix_check_ins_user_id_date_hiked"),
+            (db.session.query(CheckIn).filter_by(hike_id=1), "ix_check_ins_hike_id"),
+            (db.session.query(Comment).filter_by(hike_id=1), "ix_comments_hike_id_date_created"),
+            (db.session.query(Comment).filter_by(user_id=1), "ix_comments_user_id_date_created"),
+            (db.session.query(Pet).filter_by(user_id=1), "ix_pets_user_id"),
+            (db.session.query(PetCheckIn).filter_by(pet_id=1, check_in_id=1),
+             "uq_pets_check_ins_pet_id_check_in_id"),
+            (db.session.query(PetCheckIn).filter_by(check_in_id=1), "ix_pets_check_ins_check_in_id"),
+            (db.session.query(HikeBookmarksList).filter_by(bookmarks_list_id=1),
+             "uq_hikes_bookmarks_lists_bookmarks_list_id_hike_id"),
+            (db.session.query(HikeBookmarksList).filter_by(hike_id=1), "ix_hikes_bookmarks_lists_hike_id"),
+            (db.session.query(BookmarksList).filter_by(user_id=1), "ix_bookmarks_lists_user_id"),
+            (db.session.query(Hike).filter_by(state="California"), "ix_hikes_state"),
+        ]
+
+        for query, index_name in hot_queries:
+            with self.subTest(index_name=index_name):
+                self.assertIn(index_name, self.get_plan_index_names(query))
+
+    def test_duplicate_pet_check_in(self):
+        """Test a pet can't be added to a check in twice."""
+
+        db.session.add(PetCheckIn(pet_id=1, check_in_id=1))
+
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+
+    def test_migrations(self):
+        """Test migrations apply to a created schema and don't run twice."""
+
+        with db.engine.connect() as connection:
+            self.assertEqual(get_version(connection), 0)
+
+            applied = upgrade(connection)
+
+            self.assertEqual(applied[-1][0], LATEST_VERSION)
+            self.assertEqual(get_version(connection), LATEST_VERSION)
+            self.assertEqual(upgrade(connection), [])
+
+    def get_columns(self):
+        """Return {table: {column: (type, nullable)}} for the database's tables."""
+
+        inspector = inspect(db.engine)
+
+        return {table: {column["name"]: (str(column["type"]), column["nullable"])
+                        for column in inspector.get_columns(table)}
+                for table in inspector.get_table_names()}
+
+    def test_migrations_match_models(self):
+        """Test migrating the baseline schema makes the tables and columns create_all() does."""
+
+        db.session.remove()
+        db.drop_all()
+
+        with db.engine.connect() as connection:
+            with connection.begin():
+                for statement in BASELINE_SCHEMA:
+                    connection.execute(db.text(statement))
+
+            upgrade(connection)
+
+        migrated_columns = self.get_columns()
+
+        db.drop_all()
+        db.create_all()
+
+        self.assertEqual(migrated_columns, self.get_columns())
+
+    def test_stamp(self):
+        """Test stamping a created schema marks every migration applied."""
+
+        with db.engine.connect() as connection:
+            stamp(connection)
+
+            self.assertEqual(get_version(connection), LATEST_VERSION)
+            self.assertEqual(upgrade(connection), [])
+
+
+class InstrumentationTests(TestCase):
+    """Tests for request instrumentation and the /metrics endpoint."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+        app.config['SECRET_KEY'] = 'key'
+
+        app.config['METRICS_TOKEN'] = 'token'
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        app.config["N_PLUS_ONE_THRESHOLD"] = N_PLUS_ONE_THRESHOLD
+        app.config["METRICS_TOKEN"] = None
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def get_metric(self, sample):
+        """Return the value of a sample in the /metrics output, or 0."""
+
+        result = self.client.get("/metrics", headers={"Authorization": "Bearer token"})
+
+        for line in result.get_data(as_text=True).splitlines():
+            if line.startswith(sample + " "):
+                return float(line.split()[-1])
+
+        return 0
+
+    def test_request_metrics(self):
+        """Test requests are counted per endpoint with their queries."""
+
+        requests = 'pupjourney_requests_total{endpoint="get_hike_comments_json",method="GET",status="200"}'
+        queries = 'pupjourney_db_queries_total{endpoint="get_hike_comments_json",method="GET"}'
+        requests_before = self.get_metric(requests)
+        queries_before = self.get_metric(queries)
+
+        self.client.get("/hikes/1/comments.json")
+        self.client.get("/hikes/1/comments.json")
+
+        self.assertEqual(self.get_metric(requests), requests_before + 2)
+        self.assertGreater(self.get_metric(queries), queries_before)
+
+    def test_n_plus_one(self):
+        """Test a request repeating a statement more than the threshold is flagged."""
+
+        n_plus_one = 'pupjourney_n_plus_one_requests_total{endpoint="get_hike_comments_json",method="GET"}'
+        before = self.get_metric(n_plus_one)
+
+        self.client.get("/hikes/1/comments.json")
+        self.assertEqual(self.get_metric(n_plus_one), before)
+
+        app.config["N_PLUS_ONE_THRESHOLD"] = 0
+        with self.assertLogs(app.logger, "WARNING"):
+            self.client.get("/hikes/1/comments.json")
+        self.assertEqual(self.get_metric(n_plus_one), before + 1)
+
+    def test_metrics_not_public(self):
+        """Test /metrics needs the token, even from a local address outside debug mode."""
+
+        result = self.client.get("/metrics", environ_base={"REMOTE_ADDR": "203.0.113.1"})
+        self.assertEqual(result.status_code, 403)
+
+        result = self.client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+        self.assertEqual(result.status_code, 403)
+
+        app.config["METRICS_TOKEN"] = None
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+    def test_metrics_add_up_workers(self):
+        """Test metrics written by other worker processes are included."""
+
+        sample = 'pupjourney_requests_total{endpoint="get_hike_comments_json",method="GET",status="200"}'
+        script = ("from instrumentation import Instrumentation\n"
+                  "Instrumentation().requests.labels('get_hike_comments_json', 'GET', 200).inc(2)\n")
+
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=metrics_dir)
+            for _ in range(2):
+                subprocess.run([sys.executable, "-c", script], env=env, check=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+            try:
+                self.assertEqual(self.get_metric(sample), 4)
+            finally:
+                del os.environ["PROMETHEUS_MULTIPROC_DIR"]
+
+
+class AppFactoryTests(TestCase):
+    """Tests for create_app() and the health endpoints."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+        self.config = dict(app.config)
+        self.image_client = server.image_uploader.client
+        self.session_store = server.server_sessions.store
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+        app.config.clear()
+        app.config.update(self.config)
+        server.image_uploader.client = self.image_client
+        server.server_sessions.store = self.session_store
+
+    def test_create_app(self):
+        """Test create_app applies settings and connects to the database."""
+
+        result = create_app({"DATABASE_URI": "postgresql:///testdb", "GOOGLE_KEY": "key",
+                             "IMAGE_STORAGE": "local", "SESSION_STORE": "memory"})
+
+        self.assertIs(result, app)
+        self.assertIsInstance(server.image_uploader.client, LocalImageClient)
+        self.assertIsInstance(server.server_sessions.store, MemorySessionStore)
+        self.assertEqual(self.client.get("/hikes/1.json").status_code, 200)
+
+    def test_missing_settings(self):
+        """Test create_app names the required settings that are missing."""
+
+        with self.assertRaisesRegex(RuntimeError,
+                                    "GOOGLE_KEY, CLOUDINARY_KEY, CLOUDINARY_SECRET, SESSION_REDIS_URL"):
+            create_app({"GOOGLE_KEY": None, "IMAGE_STORAGE": None, "CLOUDINARY_KEY": "",
+                        "CLOUDINARY_SECRET": None, "SESSION_STORE": None, "SESSION_REDIS_URL": None})
+
+    def test_health_endpoints(self):
+        """Test the liveness and readiness endpoints."""
+
+        self.assertEqual(self.client.get("/healthz").get_json(), {"status": "ok"})
+        self.assertEqual(self.client.get("/readyz").status_code, 200)
+
+        db.drop_all()
+        catalog_cache.clear()
+
+        self.assertEqual(self.client.get("/healthz").status_code, 200)
+        self.assertEqual(self.client.get("/readyz").status_code, 503)
+
+
+class GeventWorkerTests(TestCase):
+    """Tests for serving the app from gunicorn's gevent workers."""
+
+    def test_gevent_worker(self):
+        """Test the gevent settings patch the app's I/O and resize images on a native thread."""
+
+        script = ("import json, runpy\n"
+                  "runpy.run_path('gunicorn.conf.py')\n"
+                  "from gevent import monkey\n"
+                  "import psycopg2.extensions\n"
+                  "import server\n"
+                  "from uploads import run_in_os_thread\n"
+                  "get_ident = monkey.get_original('threading', 'get_ident')\n"
+                  "upload_thread = server.image_uploader.executor.submit(get_ident).result()\n"
+                  "image_thread = server.image_uploader.executor.submit(\n"
+                  "    run_in_os_thread, get_ident).result()\n"
+                  "print(json.dumps({\n"
+                  "    'patched': monkey.is_module_patched('socket') and monkey.is_module_patched('threading'),\n"
+                  "    'psycopg2_waits': psycopg2.extensions.get_wait_callback() is not None,\n"
+                  "    'status': server.app.test_client().get('/healthz').status_code,\n"
+                  "    'upload_on_main_thread': upload_thread == get_ident(),\n"
+                  "    'image_on_main_thread': image_thread == get_ident()}))\n")
+
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            env = dict(os.environ, WEB_WORKER_CLASS="gevent", PROMETHEUS_MULTIPROC_DIR=metrics_dir)
+            output = subprocess.run([sys.executable, "-c", script], env=env, check=True,
+                                    capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+
+        self.assertEqual(json.loads(output.splitlines()[-1]),
+                         {"patched": True, "psycopg2_waits": True, "status": 200,
+                          # The upload pool's threads are greenlets on the main thread
+                          "upload_on_main_thread": True,
+                          "image_on_main_thread": False})
+
+
+class ServerSessionTests(TestCase):
+    """Tests for server-side sessions and the cached logged in user."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+        self.session_store = server.server_sessions.store
+        self.store = server.server_sessions.store = MemorySessionStore()
+
+        self.user_queries = 0
+        event.listen(db.engine, "before_cursor_execute", self.count_user_query)
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        event.remove(db.engine, "before_cursor_execute", self.count_user_query)
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+        server.server_sessions.store = self.session_store
+
+    def count_user_query(self, conn, cursor, statement, *args):
+        if "FROM users" in statement:
+            self.user_queries += 1
+
+    def get_session_id(self):
+        return next(cookie.value for cookie in self.client.cookie_jar
+                    if cookie.name == app.session_cookie_name)
+
+    def log_in(self, client):
+        client.post("/login", data={"email": "test@test", "current-password": "test"},
+                    headers={"Referer": "/"})
+
+    def test_log_in(self):
+        """Test logging in keeps the session in the store and gives it a new id."""
+
+        with self.client.session_transaction() as sess:
+            sess['theme'] = "dark"
+        old_sid = self.get_session_id()
+
+        self.log_in(self.client)
+        sid = self.get_session_id()
+
+        self.assertNotEqual(sid, old_sid)
+        self.assertIsNone(self.store.get(get_session_key(old_sid)))
+        self.assertIn('"user_id":1', self.store.get(get_session_key(sid)))
+
+        self.client.get("/logout", headers={"Referer": "/"})
+
+        self.assertIsNone(self.store.get(get_session_key(sid)))
+        self.assertNotIn("user_id", self.store.get(get_session_key(self.get_session_id())))
+
+    def test_cached_user(self):
+        """Test the logged in user is resolved without a query."""
+
+        self.log_in(self.client)
+        self.user_queries = 0
+
+        result = self.client.get("/dashboard")
+
+        self.assertIn(b'<div hidden id="user_id">1</div>', result.data)
+        self.assertEqual(self.user_queries, 0)
+
+    def test_edit_user_uncaches_user(self):
+        """Test changing a user's email updates every one of their sessions."""
+
+        other_client = app.test_client()
+        self.log_in(self.client)
+        self.log_in(other_client)
+
+        self.client.post("/edit-user", data={"full_name": "", "email": "new@test", "new-password": ""},
+                         headers={"Referer": "/"})
+
+        self.assertIsNone(self.store.get(get_user_key(1)))
+
+        with other_client:
+            other_client.get("/dashboard")
+            self.assertEqual(g.user.email, "new@test")
+
+
+class StartupTests(TestCase):
+    """Tests for the modules importing the app imports."""
+
+    def test_deferred_imports(self):
+        """Test importing server doesn't import the modules it only needs on first use."""
+
+        imported = {import_time.module.split(".")[0] for import_time in get_import_times("server")}
+
+        for module in DEFERRED_MODULES:
+            with self.subTest(module=module):
+                self.assertNotIn(module, imported)
+
+
+class CompiledSerializerTests(TestCase):
+    """Tests for compiled serializers and their column projections."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def test_same_json(self):
+        """Test each compiled serializer dumps the same JSON as its schema."""
+
+        # Include empty and null values
+        hike = Hike(hike_name="Test Hike", address="Test Address", miles=None)
+        user = User.get_user_by_email("test@test")
+        db.session.add_all([hike, Comment(user=user, hike=hike, body="Test Comment",
+                                          date_created=datetime.now(), edit=True,
+                                          date_edited=datetime.now())])
+        db.session.commit()
+
+        hikes = Hike.query.all()
+        pets = Pet.query.all()
+        check_ins = CheckIn.query.all()
+
+        serializers = [
+            ("hikes_serializer", hikes),
+            ("comments_serializer", Comment.query.all()),
+            ("check_ins_serializer", check_ins),
+            ("user_check_ins_serializer", check_ins),
+            ("check_in_graph_serializer", check_ins),
+            ("pets_serializer", pets),
+            ("pet_names_serializer", pets[0]),
+            ("bookmarks_lists_serializer", BookmarksList.query.all()),
+        ]
+
+        with app.app_context():
+            for name, obj in serializers:
+                with self.subTest(serializer=name):
+                    serializer = getattr(schemas, name)
+                    self.assertEqual(jsonify(serializer.dump(obj)).get_data(),
+                                     jsonify(serializer.schema.dump(obj)).get_data())
+
+    def test_projection(self):
+        """Test a projection spec loads only the columns it names."""
+
+        self.assertCountEqual(schemas.check_in_graph_serializer.fields, ("date_hiked", "miles_completed"))
+
+        check_in = CheckIn.get_check_ins_by_param(("user_id", 1),
+                                                  fields=schemas.USER_CHECK_IN_PROJECTION)[0]
+        check_in_state = inspect(check_in)
+
+        self.assertIn("notes", schemas.USER_CHECK_IN_PROJECTION)
+        self.assertNotIn("notes", check_in_state.unloaded)
+        self.assertIn("user_id", check_in_state.unloaded)
+        self.assertIn("description", inspect(check_in.hike).unloaded)
+        self.assertNotIn("pets", check_in_state.unloaded)
+
+        check_ins_by_pet = Pet.get_check_ins_by_pet_for_user_id(1, fields=["miles_completed"])
+
+        self.assertEqual([row.miles_completed for row in check_ins_by_pet[1]], [2.3])
+
+
+class HikingStatsTests(TestCase):
+    """Tests for the materialized hiking stats."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+        app.config['SECRET_KEY'] = 'key'
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+        db.session.add(Pet(user_id=1, pet_name="Test Pet 2", check_ins=[]))
+        db.session.commit()
+
+        with db.engine.begin() as connection:
+            rebuild_hiking_stats(connection)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['login'] = True
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def get_stats_rows(self):
+        """Return every row of the stats tables, with miles and times rounded."""
+
+        db.session.expire_all()
+        rows = []
+
+        for model in (HikingStats, HikingStatsMonth):
+            for row in model.query.all():
+                values = {column: getattr(row, column) for column in model.__table__.columns.keys()}
+                rows.append({column: round(value, 6) if isinstance(value, float) else value
+                             for column, value in values.items()})
+
+        return sorted(rows, key=lambda row: (row["subject"], str(row.get("month"))))
+
+    def test_updates_match_rebuild(self):
+        """Test stats updated by adding, editing and deleting check ins match a rebuild."""
+
+        check_ins = [{"hikeId": 1, "petIds": [1, 2] if day % 2 else [1], "dateHiked": f"2022-04-{day:02}",
+                      "milesCompleted": 2.3, "totalTime": 1.1 if day % 3 else "", "notes": ""}
+                     for day in range(1, 21)]
+        check_ins_added = self.client.post("/add-check-ins", json={"checkIns": check_ins}).get_json()["checkInsAdded"]
+
+        # The route reads each pet's status by key order, so send the keys in
+        # the dashboard's order (json= would sort them)
+        self.client.post(f"/edit-check-in/{check_ins_added[0]['check_in_id']}",
+                         content_type="application/json", data=json.dumps({
+            "petHikeStatus": [{"select": False, "pet_name": "Test Pet 1", "pet_id": 1},
+                              {"select": True, "pet_name": "Test Pet 2", "pet_id": 2}],
+            "dateHiked": "2022-05-30",
+            "milesCompleted": "4.5",
+            "totalTime": 2,
+            "notes": "",
+        }))
+        self.client.delete(f"/delete-check-in/{check_ins_added[1]['check_in_id']}")
+
+        updated_rows = self.get_stats_rows()
+
+        with db.engine.begin() as connection:
+            rebuild_hiking_stats(connection)
+
+        self.assertEqual(updated_rows, self.get_stats_rows())
+
+        stats = self.client.get("/stats.json").get_json()
+        self.assertEqual(stats["userStats"]["hike_count"], 20)
+        self.assertEqual(stats["userStats"]["distinct_hikes"], 1)
+        self.assertEqual(stats["userStats"]["last_hiked"], "2022-05-30")
+        self.assertEqual([month["month"] for month in stats["userStats"]["months"]],
+                         ["2022-03", "2022-04", "2022-05"])
+        self.assertEqual([pet["hike_count"] for pet in stats["petStats"]],
+                         [len(Pet.get_pet_by_id(pet_id).check_ins) for pet_id in (1, 2)])
+
+    def test_rebuild_changes_etag(self):
+        """Test stats repaired by a rebuild aren't answered with 304 from before it."""
+
+        with db.engine.begin() as connection:
+            connection.execute(db.text("UPDATE hiking_stats SET hike_count = 99 WHERE subject = 'pet:1'"))
+
+        etag = self.client.get("/stats.json").headers["ETag"]
+
+        with db.engine.begin() as connection:
+            rebuild_hiking_stats(connection)
+
+        result = self.client.get("/stats.json", headers={"If-None-Match": etag})
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.get_json()["petStats"][0]["hike_count"], 1)
+
+    def test_delete_pet(self):
+        """Test deleting a pet deletes its stats but not its user's."""
+
+        self.client.delete("/delete-pet/1")
+
+        self.assertIsNone(HikingStats.query.get("pet:1"))
+        self.assertEqual(HikingStats.query.get("user:1").hike_count, 1)
+
+    def test_streaks(self):
+        """Test streaks count consecutive weeks, ending with the latest."""
+
+        dates = [datetime(2022, 3, day).date() for day in (1, 2, 8, 15, 29)]
+
+        self.assertEqual(get_streaks(dates), (1, 3))
+        self.assertEqual(get_streaks([]), (0, 0))
+
+
+class HikeActivityTests(TestCase):
+    """Tests for the hike activity counters and popularity sorts."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+        app.config['SECRET_KEY'] = 'key'
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+        db.session.add(Hike(hike_name="Another Hike", area="Los Angeles Area - Griffith Park",
+                            difficulty="moderate", leash_rule="On leash", address="Los Angeles, CA",
+                            city="Los Angeles", state="California", miles=4.0, parking="Free lot"))
+        db.session.commit()
+
+        with db.engine.begin() as connection:
+            rebuild_hike_activity(connection)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['login'] = True
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def get_activity_rows(self):
+        """Return every hike's activity, with trending scores rounded."""
+
+        db.session.expire_all()
+
+        return [(activity.hike_id, activity.check_in_count, activity.comment_count,
+                 activity.bookmark_count, float(f"{activity.trending_score:.9g}"))
+                for activity in HikeActivity.query.order_by(HikeActivity.hike_id).all()]
+
+    def add_check_ins(self, hike_id, count):
+        """Add count check ins to a hike and return their ids."""
+
+        check_ins = [{"hikeId": hike_id, "petIds": [1], "dateHiked": f"2022-04-{day:02}",
+                      "milesCompleted": 2.3, "totalTime": "", "notes": ""}
+                     for day in range(1, count + 1)]
+        result = self.client.post("/add-check-ins", json={"checkIns": check_ins})
+
+        return [check_in["check_in_id"] for check_in in result.get_json()["checkInsAdded"]]
+
+    def test_updates_match_rebuild(self):
+        """Test activity updated by the create and delete routes matches a rebuild."""
+
+        check_in_ids = self.add_check_ins(2, 3)
+        self.client.delete(f"/delete-check-in/{check_in_ids[0]}")
+        self.client.post("/add-comment", json={"hikeId": 2, "commentBody": "Shady trail"})
+        self.client.delete("/delete-comment/1")
+        self.client.post("/1/add-hikes", json={"addHikeIds": [2], "removeHikeIds": [1]})
+        self.client.post("/hikes/2/add-hike-to-new-list", json={"bookmarksListName": "New List"})
+
+        updated_rows = self.get_activity_rows()
+        self.assertEqual([row[1:4] for row in updated_rows], [(1, 0, 0), (2, 1, 2)])
+
+        with db.engine.begin() as connection:
+            rebuild_hike_activity(connection)
+
+        self.assertEqual(updated_rows, self.get_activity_rows())
+
+    def test_sorted_hikes(self):
+        """Test hikes can be listed and paged by popularity."""
+
+        self.add_check_ins(2, 2)
+
+        result = self.client.get("/all_hikes.json?sort=check_ins")
+        self.assertEqual([hike["hike_id"] for hike in result.get_json()["hikes"]], [2, 1])
+
+        result = self.client.get("/all_hikes.json?sort=check_ins&limit=1").get_json()
+        self.assertEqual([hike["hike_id"] for hike in result["hikes"]], [2])
+
+        result = self.client.get(f"/all_hikes.json?sort=check_ins&limit=1&cursor={result['nextCursor']}")
+        self.assertEqual([hike["hike_id"] for hike in result.get_json()["hikes"]], [1])
+
+        # Hike 1's comment was made today, so it outweighs hike 2's older check ins
+        result = self.client.get("/all_hikes.json?sort=trending")
+        self.assertEqual([hike["hike_id"] for hike in result.get_json()["hikes"]], [1, 2])
+
+        result = self.client.get("/hikes/advanced_search?sort=comments")
+        self.assertEqual([hike["hike_id"] for hike in result.get_json()["hikes"]], [1, 2])
+
+        self.assertEqual(self.client.get("/all_hikes.json?sort=miles").status_code, 400)
+
+    def test_future_check_in_counts_as_today(self):
+        """Test a check in dated in the future weighs the same as one dated today."""
+
+        check_in = {"hikeId": 2, "petIds": [1], "dateHiked": "2045-01-01", "milesCompleted": 2.3,
+                    "totalTime": "", "notes": ""}
+        result = self.client.post("/add-check-ins", json={"checkIns": [check_in]})
+        self.assertEqual(result.status_code, 200)
+
+        activity = HikeActivity.query.get(2)
+        self.assertAlmostEqual(activity.trending_score, get_trending_weight(datetime.now()))
+
+        with db.engine.begin() as connection:
+            rebuild_hike_activity(connection)
+
+        db.session.expire_all()
+        self.assertAlmostEqual(HikeActivity.query.get(2).trending_score,
+                               get_trending_weight(datetime.now()))
+
+    def test_activity_changes_sort_etag(self):
+        """Test a check in changes the ETag of check in ordered listings only."""
+
+        sorted_etag = self.client.get("/all_hikes.json?sort=check_ins").headers["ETag"]
+        name_etag = self.client.get("/all_hikes.json").headers["ETag"]
+
+        self.add_check_ins(2, 1)
+
+        result = self.client.get("/all_hikes.json?sort=check_ins", headers={"If-None-Match": sorted_etag})
+        self.assertEqual(result.status_code, 200)
+
+        result = self.client.get("/all_hikes.json", headers={"If-None-Match": name_etag})
+        self.assertEqual(result.status_code, 304)
+
+
+class StubImageClient:
+    """Local stand-in for Cloudinary that records uploads and deletions."""
+
+    def __init__(self, failures=0):
+        self.failures = failures  # number of uploads to fail before succeeding
+        self.uploads = []
+        self.images = {}  # public id -> image bytes
+        self.image_count = 0
+        self.destroyed = []
+
+    def upload(self, path, public_id=None):
+        with open(path, "rb") as f:
+            data = f.read()
+        self.uploads.append(data)
+
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Cloudinary is unavailable")
+
+        if public_id is None:
+            self.image_count += 1
+            public_id = f"image{self.image_count}"
+        self.images[public_id] = data
+
+        return f"https://images.test/{public_id}{os.path.splitext(path)[1]}", public_id
+
+    def destroy(self, public_id):
+        self.destroyed.append(public_id)
+
+
+def make_image(width=800, height=600, orientation=None):
+    """Return the bytes of a JPEG with camera EXIF data."""
+
+    exif = Image.Exif()
+    exif[0x010F] = "Test Camera"  # Make
+    if orientation is not None:
+        exif[0x0112] = orientation  # Orientation
+
+    data = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(data, "JPEG", exif=exif)
+
+    return data.getvalue()
+
+
+class ImageUploadTests(TestCase):
+    """Tests for uploading pet images in the background."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+        app.config['SECRET_KEY'] = 'key'
+        app.config['UPLOAD_STAGING_DIR'] = tempfile.mkdtemp()
+        app.config['UPLOAD_RETRY_DELAY_SECONDS'] = 0
+
+        self.cloudinary_client = server.image_uploader.client
+        self.stub = server.image_uploader.client = StubImageClient()
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['login'] = True
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        server.image_uploader.wait()
+        server.image_uploader.client = self.cloudinary_client
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def post_pet(self, url, image):
+        """Post the pet form with an image file."""
+
+        return self.client.post(url, content_type="multipart/form-data", data={
+            "petName": "Test Pet 2", "gender": "", "birthday": "", "breed": "",
+            "imageFile": (io.BytesIO(image), "pet.jpg"),
+        })
+
+    def get_pet(self, pet_id):
+        db.session.expire_all()
+        return Pet.get_pet_by_id(pet_id)
+
+    def test_add_pet(self):
+        """Test a new pet is saved before its image is uploaded."""
+
+        pet_json = self.post_pet("/add-pet", make_image()).get_json()["petAdded"]
+
+        self.assertEqual(pet_json["img_status"], "pending")
+        self.assertIsNone(pet_json["pet_img_url"])
+        self.assertNotIn("img_upload_id", pet_json)
+
+        server.image_uploader.wait()
+        pet = self.get_pet(pet_json["pet_id"])
+
+        self.assertEqual(pet.pet_img_url, "https://images.test/image1.jpg")
+        self.assertEqual(pet.img_medium_url, "https://images.test/image1_medium.webp")
+        self.assertEqual(pet.img_thumb_url, "https://images.test/image1_thumb.webp")
+        self.assertIsNone(pet.img_status)
+        self.assertEqual(os.listdir(app.config['UPLOAD_STAGING_DIR']), [])
+
+    def test_image_variants(self):
+        """Test the variants are resized, upright and stripped of EXIF data."""
+
+        # Orientation 6: the camera was rotated, so the image displays as 1500x3000
+        self.post_pet("/edit-pet/1", make_image(3000, 1500, orientation=6))
+        server.image_uploader.wait()
+
+        sizes = {}
+        for public_id, data in self.stub.images.items():
+            with Image.open(io.BytesIO(data)) as image:
+                sizes[public_id] = image.format, image.size
+                self.assertEqual(dict(image.getexif()), {})
+
+        self.assertEqual(sizes, {"image1": ("JPEG", (1024, 2048)),
+                                 "image1_medium": ("WEBP", (320, 640)),
+                                 "image1_thumb": ("WEBP", (128, 256))})
+
+    def test_edit_pet_replaces_image(self):
+        """Test the old image and its variants are destroyed once the new one is uploaded."""
+
+        self.post_pet("/edit-pet/1", make_image())
+        server.image_uploader.wait()
+        self.post_pet("/edit-pet/1", make_image())
+        server.image_uploader.wait()
+
+        self.assertEqual(self.get_pet(1).img_public_id, "image2")
+        self.assertEqual(self.stub.destroyed, ["image1", "image1_medium", "image1_thumb"])
+
+    def test_upload_retries(self):
+        """Test a failed upload is retried, then the pet is marked failed."""
+
+        self.stub.failures = 1
+        self.post_pet("/edit-pet/1", make_image())
+        server.image_uploader.wait()
+
+        self.assertEqual(len(self.stub.uploads), 4)
+        self.assertEqual(self.get_pet(1).img_public_id, "image1")
+
+        self.stub.failures = MAX_ATTEMPTS
+        self.post_pet("/edit-pet/1", make_image())
+        server.image_uploader.wait()
+        pet = self.get_pet(1)
+
+        self.assertEqual(pet.img_status, "failed")
+        self.assertEqual(pet.img_public_id, "image1")
+
+    def test_invalid_image(self):
+        """Test a file that isn't an image fails without being uploaded."""
+
+        self.post_pet("/edit-pet/1", b"not an image")
+        server.image_uploader.wait()
+
+        self.assertEqual(self.get_pet(1).img_status, "failed")
+        self.assertEqual(self.stub.uploads, [])
+
+    def test_delete_pet_destroys_image(self):
+        """Test deleting a pet destroys its image."""
+
+        self.post_pet("/edit-pet/1", make_image())
+        server.image_uploader.wait()
+        self.client.delete("/delete-pet/1")
+        server.image_uploader.wait()
+
+        self.assertEqual(self.stub.destroyed, ["image1", "image1_medium", "image1_thumb"])
+
+
+class BookmarksListMembershipTests(TestCase):
+    """Tests for adding hikes to and removing hikes from bookmarks lists."""
+
+    def setUp(self):
+        """Stuff to do before every test."""
+
+        self.client = app.test_client()
+        app.config['TESTING'] = True
+        app.config['SECRET_KEY'] = 'key'
+
+        # Connect to test database
+        connect_to_db(app, "postgresql:///testdb", echo=False)
+
+        # Create tables and add sample data
+        db.create_all()
+        example_data()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['login'] = True
+
+    def tearDown(self):
+        """Do at end of every test."""
+
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+    def get_hike_ids(self):
+        result = self.client.get("/user_bookmarks_lists.json")
+        return [hike["hike_id"] for hike in result.get_json()["bookmarksLists"][0]["hikes"]]
+
+    def test_add_and_remove_hike_ids(self):
+        """Test compact add/remove deltas update the list."""
+
+        self.client.post("/1/add-hikes", json={"addHikeIds": [], "removeHikeIds": [1]})
+        self.assertEqual(self.get_hike_ids(), [])
+
+        self.client.post("/hikes/1/add-hike-to-existing-list",
+                         json={"addBookmarksListIds": [1], "removeBookmarksListIds": []})
+        self.assertEqual(self.get_hike_ids(), [1])
+
+        # Adding a hike that's already on the list doesn't duplicate it
+        self.client.post("/1/add-hikes", json={"allHikesOptions": [
+            {"select": True, "hike_name": "Cedar Grove", "hike_id": 1}
+        ]})
+        self.assertEqual(self.get_hike_ids(), [1])
+
+    def test_add_unknown_hike(self):
+        """Test adding a hike that doesn't exist is rejected."""
+
+        result = self.client.post("/1/add-hikes", json={"addHikeIds": [1000]})
+
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(self.get_hike_ids(), [1])
+
+
 class FlaskTestsLoggedIn(TestCase):
     """Flask tests with user logged in to session."""
 
@@ -115,7 +1884,7 @@ class FlaskTestsLoggedIn(TestCase):
 
         with self.client as c:
             with c.session_transaction() as sess:
-                sess['user_email'] = "test@test"
+                sess['user_id'] = 1
                 sess['login'] = True
 
     def test_dashboard_page(self):
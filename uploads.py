@@ -0,0 +1,332 @@
+"""Background Cloudinary uploads and deletions for pet images.
+
+A request that receives a pet image stages the file on local disk, gives
+the pet a pending image (img_status "pending" and a new img_upload_id)
+and commits right away. A thread pool resizes the staged file into the
+variants in images.IMAGE_VARIANTS and uploads them, retrying with
+backoff, then sets the pet's image URLs and img_public_id if the upload
+is still the pet's latest, and destroys the image it replaced. Images of
+deleted pets are destroyed on the same pool. Under gevent, resizing runs
+on a native thread (see run_in_os_thread).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from images import InvalidImageError, IMAGE_VARIANTS, get_variant_public_id, process_image, remove_variants
+from lazy import LazyModule
+from model import db, Pet
+
+
+# Only needed once an image is uploaded to Cloudinary, and slow to import
+cloudinary_uploader = LazyModule("cloudinary.uploader")
+
+# Attempts per upload or destroy, waiting RETRY_DELAY_SECONDS after the
+# first failure and twice as long after each one after that
+MAX_ATTEMPTS = 4
+RETRY_DELAY_SECONDS = 1.0
+
+UPLOAD_WORKERS = 2
+
+IMAGE_PENDING = "pending"
+IMAGE_FAILED = "failed"
+
+
+def run_in_os_thread(function, *args):
+    """Return function(*args), run on a native thread if gevent patched threading.
+
+    The upload pool's threads are greenlets in a gevent worker, so
+    CPU-bound work like resizing an image would hold up every request the
+    worker is serving. gevent's thread pool runs it on a native thread
+    instead, where Pillow releases the GIL while it decodes, resizes and
+    encodes.
+    """
+
+    monkey = sys.modules.get("gevent.monkey")
+
+    if monkey is None or not monkey.is_module_patched("threading"):
+        return function(*args)
+
+    import gevent
+
+    return gevent.get_hub().threadpool.apply(function, args)
+
+
+class CloudinaryClient:
+    """Uploads and destroys images in a Cloudinary account."""
+
+    def __init__(self, cloud_name, api_key, api_secret):
+        self.credentials = {"cloud_name": cloud_name, "api_key": api_key, "api_secret": api_secret}
+
+    def upload(self, path, public_id=None):
+        """Upload an image file and return its (secure URL, public id).
+
+        Cloudinary picks the public id unless one is given.
+        """
+
+        options = dict(self.credentials)
+        if public_id is not None:
+            options["public_id"] = public_id
+
+        result = cloudinary_uploader.upload(path, **options)
+
+        return result["secure_url"], result["public_id"]
+
+    def destroy(self, public_id):
+        """Delete an uploaded image."""
+
+        cloudinary_uploader.destroy(public_id, **self.credentials)
+
+
+class LocalImageClient:
+    """Stores images in a local directory served at base_url, for development."""
+
+    def __init__(self, directory, base_url):
+        self.directory = directory
+        self.base_url = base_url
+
+    def upload(self, path, public_id=None):
+        """Copy an image file into the directory and return its (URL, public id)."""
+
+        if public_id is None:
+            public_id = uuid.uuid4().hex
+
+        filename = public_id + os.path.splitext(path)[1]
+        os.makedirs(self.directory, exist_ok=True)
+        shutil.copyfile(path, os.path.join(self.directory, filename))
+
+        return f"{self.base_url}/{filename}", public_id
+
+    def destroy(self, public_id):
+        """Delete a stored image."""
+
+        for path in glob.glob(os.path.join(self.directory, glob.escape(public_id) + ".*")):
+            os.remove(path)
+
+
+class ImageUploader:
+    """Stage pet images locally and upload and destroy them in the background.
+
+    client is any object with upload(path, public_id=None) -> (url,
+    public_id) and destroy(public_id), such as a CloudinaryClient.
+    """
+
+    def __init__(self, app=None, client=None):
+        self._lock = threading.Lock()
+        self._futures = set()
+        self.executor = None
+        self.client = None
+        self.app = None
+
+        if app is not None:
+            self.init_app(app, client)
+
+    def init_app(self, app, client=None):
+        self.app = app
+        self.client = client
+        app.config.setdefault("UPLOAD_STAGING_DIR", os.environ.get(
+            "UPLOAD_STAGING_DIR", os.path.join(tempfile.gettempdir(), "pupjourney-uploads")))
+        app.config.setdefault("UPLOAD_WORKERS", UPLOAD_WORKERS)
+        app.config.setdefault("UPLOAD_RETRY_DELAY_SECONDS", RETRY_DELAY_SECONDS)
+
+        self._start_executor()
+
+    def _start_executor(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.app.config["UPLOAD_WORKERS"],
+                                           thread_name_prefix="image-upload")
+
+    def after_fork(self):
+        """Start a new thread pool in a forked process, which doesn't get the parent's threads."""
+
+        self._lock = threading.Lock()
+        self._futures = set()
+        self._start_executor()
+
+    def get_staged_path(self, upload_id):
+        """Return the local path an upload's file is staged at."""
+
+        return os.path.join(self.app.config["UPLOAD_STAGING_DIR"], upload_id)
+
+    def stage_pet_image(self, pet, file):
+        """Save an uploaded file for a pet and mark the pet's image pending.
+
+        Call upload_pet_image() with the pet once the pet is committed.
+        """
+
+        pet.img_upload_id = uuid.uuid4().hex
+        pet.img_status = IMAGE_PENDING
+
+        os.makedirs(self.app.config["UPLOAD_STAGING_DIR"], exist_ok=True)
+        file.save(self.get_staged_path(pet.img_upload_id))
+
+    def upload_pet_image(self, pet):
+        """Queue the upload of a committed pet's staged image."""
+
+        self._submit(self._upload_pet_image, pet.pet_id, pet.img_upload_id)
+
+    def destroy_image(self, public_id):
+        """Queue the deletion of an uploaded image."""
+
+        self._submit(self._destroy_image, public_id)
+
+    def resume(self):
+        """Queue the uploads left pending by a previous run of the app.
+
+        Pets whose staged file is gone are marked failed.
+        """
+
+        with self.app.app_context():
+            try:
+                for pet in Pet.query.filter_by(img_status=IMAGE_PENDING).all():
+                    if os.path.exists(self.get_staged_path(pet.img_upload_id)):
+                        self.upload_pet_image(pet)
+                    else:
+                        pet.img_status = IMAGE_FAILED
+                        pet.img_upload_id = None
+
+                db.session.commit()
+            finally:
+                db.session.remove()
+
+    def wait(self):
+        """Block until every queued upload and deletion is done."""
+
+        while True:
+            with self._lock:
+                futures = list(self._futures)
+
+            if not futures:
+                return
+
+            for future in futures:
+                future.exception()
+
+    def _submit(self, job, *args):
+        future = self.executor.submit(job, *args)
+
+        with self._lock:
+            self._futures.add(future)
+
+        future.add_done_callback(self._job_done)
+
+    def _job_done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+        if future.exception() is not None:
+            self.app.logger.error("Image job failed", exc_info=future.exception())
+
+    def _retry(self, description, call, *args):
+        """Return call(*args), retrying with backoff. Raise the last error after MAX_ATTEMPTS."""
+
+        delay = self.app.config["UPLOAD_RETRY_DELAY_SECONDS"]
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                return call(*args)
+            except Exception as error:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                self.app.logger.warning("%s failed (attempt %d of %d): %s",
+                                        description, attempt, MAX_ATTEMPTS, error)
+                time.sleep(delay)
+                delay *= 2
+
+    def _upload_variants(self, pet_id, variant_paths):
+        """Upload an image's variants and return ({variant: url}, public id).
+
+        The full image gets a public id from the client and the others are
+        stored under ids derived from it. If any upload fails, the ones
+        already uploaded are destroyed.
+        """
+
+        urls = {}
+        public_id = None
+
+        try:
+            for variant, variant_path in variant_paths:
+                description = f"Uploading {variant} image for pet {pet_id}"
+
+                if public_id is None:
+                    urls[variant], public_id = self._retry(description, self.client.upload,
+                                                           variant_path)
+                else:
+                    urls[variant], _ = self._retry(description, self.client.upload, variant_path,
+                                                   get_variant_public_id(public_id, variant))
+        except Exception:
+            if public_id is not None:
+                self.destroy_image(public_id)
+            raise
+
+        return urls, public_id
+
+    def _upload_pet_image(self, pet_id, upload_id):
+        path = self.get_staged_path(upload_id)
+        variant_paths = []
+
+        try:
+            variant_paths = run_in_os_thread(process_image, path)
+            urls, public_id = self._upload_variants(pet_id, variant_paths)
+        except InvalidImageError as error:
+            self.app.logger.warning("Image for pet %s can't be processed: %s", pet_id, error)
+            self._finish_pet_upload(pet_id, upload_id, None, None)
+            return
+        except Exception:
+            self._finish_pet_upload(pet_id, upload_id, None, None)
+            raise
+        finally:
+            remove_variants(variant_paths)
+            if os.path.exists(path):
+                os.remove(path)
+
+        unused_public_id = self._finish_pet_upload(pet_id, upload_id, urls, public_id)
+
+        if unused_public_id is not None:
+            self._destroy_image(unused_public_id)
+
+    def _finish_pet_upload(self, pet_id, upload_id, urls, public_id):
+        """Set a pet's uploaded image, or mark it failed if urls is None.
+
+        Return the public id of an image that's no longer used: the one the
+        upload replaced, or the uploaded one if the pet was deleted or has
+        a newer upload.
+        """
+
+        with self.app.app_context():
+            try:
+                pet = Pet.query.filter_by(pet_id=pet_id).with_for_update().first()
+
+                if pet is None or pet.img_upload_id != upload_id:
+                    db.session.rollback()
+                    return public_id
+
+                replaced_public_id = pet.img_public_id if urls is not None else None
+
+                if urls is not None:
+                    pet.pet_img_url = urls["full"]
+                    pet.img_medium_url = urls["medium"]
+                    pet.img_thumb_url = urls["thumb"]
+                    pet.img_public_id = public_id
+                    pet.img_status = None
+                else:
+                    pet.img_status = IMAGE_FAILED
+                pet.img_upload_id = None
+
+                db.session.commit()
+
+                return replaced_public_id
+            finally:
+                db.session.remove()
+
+    def _destroy_image(self, public_id):
+        for variant, _, _ in IMAGE_VARIANTS:
+            variant_public_id = get_variant_public_id(public_id, variant)
+            self._retry(f"Destroying image {variant_public_id}", self.client.destroy,
+                        variant_public_id)
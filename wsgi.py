@@ -0,0 +1,12 @@
+"""WSGI entry point for production servers.
+
+gunicorn.conf.py loads this module once in the master process
+(preload_app), then forks the workers:
+
+gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from server import create_app, warm_caches
+
+app = create_app()
+warm_caches()